@@ -0,0 +1,132 @@
+import time
+import threading
+from collections import OrderedDict
+
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from accounts.models import CustomUser
+
+
+# Snapshots are dropped on save/delete of the user in this process; the TTL
+# bounds how long another worker can serve a stale one.
+USER_CACHE_TTL = 30
+USER_CACHE_SIZE = 10000
+TOKEN_CACHE_SIZE = 10000
+
+
+class ExpiringLRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_users = ExpiringLRUCache(USER_CACHE_SIZE)
+_tokens = ExpiringLRUCache(TOKEN_CACHE_SIZE)
+
+
+def validate_access_token(raw_token):
+    """
+    Returns the validated AccessToken, decoding and verifying each distinct
+    token once; the result is reused until the token's own expiry.
+    Raises TokenError for invalid tokens.
+    """
+    if isinstance(raw_token, bytes):
+        raw_token = raw_token.decode()
+
+    token = _tokens.get(raw_token)
+    if token is None:
+        token = AccessToken(raw_token)
+        _tokens.set(raw_token, token, token['exp'])
+    return token
+
+
+def _copy(user):
+    # Each caller gets its own instance, so request-local changes never leak
+    # into the shared snapshot.
+    return CustomUser.from_db(user._state.db, None, [
+        getattr(user, field.attname) for field in CustomUser._meta.concrete_fields
+    ])
+
+
+def peek_cached_user(user_id):
+    """Returns a cached user without touching the database, or None."""
+    user = _users.get(user_id)
+    return _copy(user) if user is not None else None
+
+
+def get_cached_user(user_id):
+    """Returns the user for `user_id` or None, hitting the database only on a miss."""
+    user = _users.get(user_id)
+    if user is None:
+        user = CustomUser.objects.filter(id=user_id).first()
+        if user is None:
+            return None
+        _users.set(user.id, user, time.time() + USER_CACHE_TTL)
+    return _copy(user)
+
+
+def invalidate_cached_user(user_id):
+    _users.pop(user_id)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication backed by the same token and user caches as the WebSocket middleware."""
+
+    def get_validated_token(self, raw_token):
+        try:
+            return validate_access_token(raw_token)
+        except TokenError:
+            return super().get_validated_token(raw_token)
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
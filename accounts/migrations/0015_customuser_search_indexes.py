@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+SEARCH_FIELDS = ('username', 'fullname', 'phone_number', 'email')
+
+
+# icontains/istartswith compile to UPPER(col::text) LIKE UPPER(%s) on
+# PostgreSQL, so the trigram indexes are built on that same expression.
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS accounts_customuser_{field}_trgm '
+            f'ON accounts_customuser USING gin (UPPER("{field}"::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS accounts_customuser_{field}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_remove_userprofile_user_customuser_phone_number_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 
@@ -33,4 +35,12 @@ class Contact(models.Model):
     alias = models.CharField(max_length=50, null=True, blank=True)
 
     def __str__(self):
-        return self.alias
\ No newline at end of file
+        return self.alias
+
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_snapshot(sender, instance, **kwargs):
+    from accounts.authentication import invalidate_cached_user
+    invalidate_cached_user(instance.id)
@@ -1,8 +1,69 @@
-from chat.models import Room
+import base64
+
+from django.db.models import Q
+
+from accounts.models import CustomUser, Contact
+from chat.models import Room, InboxEntry
+from chat.services import ensure_room_entries
+
+
+USER_SEARCH_PAGE_SIZE = 20
+USER_SEARCH_MAX_PAGE_SIZE = 100
+# Shorter terms cannot use the trigram indexes, so they only match prefixes.
+USER_SEARCH_MIN_CONTAINS = 3
+USER_SEARCH_FIELDS = ('username', 'fullname', 'phone_number', 'email')
 
 def get_or_create_room(user1, user2):
     if user1.id > user2.id:
         user1, user2 = user2, user1 
 
     room, created = Room.objects.get_or_create(user1=user1, user2=user2)
+    if created:
+        ensure_room_entries(room)
     return room
+
+
+def encode_user_cursor(fullname):
+    return base64.urlsafe_b64encode(fullname.encode()).decode().rstrip('=')
+
+
+def decode_user_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode((cursor + '=' * (-len(cursor) % 4)).encode()).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def search_users(user, term='', after=None, limit=USER_SEARCH_PAGE_SIZE):
+    """
+    One page of users that are not yet contacts of `user`, ordered by the
+    unique fullname so `after` (the last fullname of the previous page) is a
+    stable keyset cursor. Returns (users, has_more).
+    """
+    limit = max(1, min(int(limit), USER_SEARCH_MAX_PAGE_SIZE))
+
+    users = CustomUser.objects.exclude(id=user.id).exclude(
+        id__in=Contact.objects.filter(owner=user, contact_user__isnull=False).values('contact_user_id')
+    )
+
+    term = (term or '').strip()
+    if term:
+        lookup = 'icontains' if len(term) >= USER_SEARCH_MIN_CONTAINS else 'istartswith'
+        condition = Q()
+        for field in USER_SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__{lookup}': term})
+        users = users.filter(condition)
+
+    if after:
+        users = users.filter(fullname__gt=after)
+
+    users = list(users.order_by('fullname')[:limit + 1])
+    return users[:limit], len(users) > limit
+
+
+def get_private_summaries(user, peer_ids):
+    """Unread count and last message per peer, read from the user's inbox entries in one query."""
+    entries = InboxEntry.objects.filter(
+        user=user, conversation_type='private', peer_id__in=peer_ids
+    ).values('peer_id', 'unread_count', 'last_message', 'last_message_at')
+    return {entry['peer_id']: entry for entry in entries}
@@ -1,15 +1,16 @@
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import update_session_auth_hash
-from django.db.models import Q
 
 from rest_framework import generics, status, filters, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from chat.models import Message
-
-from accounts.services import get_or_create_room
+from accounts.services import (
+    get_or_create_room, search_users, get_private_summaries,
+    encode_user_cursor, decode_user_cursor, USER_SEARCH_PAGE_SIZE
+)
+from chat.services import set_contact_alias
 from accounts.models import CustomUser, Contact
 from accounts.serializers import (
     RegisterSerializer, LoginSerializer,
@@ -63,33 +64,22 @@ class UserSearchApiView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        search_term = request.query_params.get('search', '')
-        contact_user_ids = Contact.objects.filter(owner=request.user).values_list('contact_user_id', flat=True)
-
-        users = CustomUser.objects.exclude(id=request.user.id)\
-                                  .exclude(id__in=contact_user_ids)
-
-        if search_term:
-            users = users.filter(
-                Q(username__icontains=search_term) |
-                Q(fullname__icontains=search_term) |
-                Q(phone_number__icontains=search_term) |
-                Q(email__icontains=search_term)
+        try:
+            cursor = request.query_params.get('cursor')
+            users, has_more = search_users(
+                request.user,
+                request.query_params.get('search', ''),
+                after=decode_user_cursor(cursor) if cursor else None,
+                limit=request.query_params.get('limit', USER_SEARCH_PAGE_SIZE),
             )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        summaries = get_private_summaries(request.user, [user.id for user in users])
 
         user_data = []
         for user in users:
-            unread_count = Message.objects.filter(
-                sender=user,
-                recipient=request.user,
-                is_read=False
-            ).count()
-
-            last_message = Message.objects.filter(
-                room__messages__sender__in=[user, request.user],
-                room__messages__recipient__in=[user, request.user]
-            ).order_by("-timestamp").first()
-
+            summary = summaries.get(user.id, {})
             user_data.append({
                 'id': user.id,
                 'username': user.username,
@@ -98,12 +88,16 @@ class UserSearchApiView(APIView):
                 'phone_number': user.phone_number,
                 'is_online': user.is_online,
                 'last_seen': user.last_seen,
-                'unread_count': unread_count,
-                'last_message': last_message.text if last_message else "",
-                'last_message_timestamp': last_message.timestamp if last_message else None,
+                'unread_count': summary.get('unread_count', 0),
+                'last_message': summary.get('last_message', ""),
+                'last_message_timestamp': summary.get('last_message_at'),
             })
 
-        return Response(user_data, status=status.HTTP_200_OK)
+        return Response({
+            "users": user_data,
+            "next_cursor": encode_user_cursor(users[-1].fullname) if has_more else None,
+            "has_more": has_more,
+        }, status=status.HTTP_200_OK)
 
 
 class UserFilterApiView(generics.ListAPIView):
@@ -147,6 +141,7 @@ class ContactApiView(generics.GenericAPIView):
             contact = serializer.save(owner=request.user)
             target_user = get_object_or_404(CustomUser, id=contact.contact_user.id)
             room = get_or_create_room(request.user, target_user)
+            set_contact_alias(request.user.id, target_user.id, contact.alias)
             return Response({
                 "contact": serializer.data,
                 "room_id": room.id
@@ -182,6 +177,7 @@ class ContactDeleteApiView(generics.GenericAPIView):
         try:
             contact = Contact.objects.get(id=id)
             contact.delete()
+            set_contact_alias(contact.owner_id, contact.contact_user_id, None)
             return Response({'message': 'Contact deleted'}, status=status.HTTP_200_OK)
         except Contact.DoesNotExist:
             return Response({'error': 'Contact not found'}, status=status.HTTP_400_BAD_REQUEST)
@@ -196,7 +192,8 @@ class ContactUpdateApiView(generics.GenericAPIView):
             contact = Contact.objects.get(id=id)
             serializer = self.get_serializer(contact, data=request.data)
             if serializer.is_valid():
-                serializer.save()
+                contact = serializer.save()
+                set_contact_alias(contact.owner_id, contact.contact_user_id, contact.alias)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Contact.DoesNotExist:
@@ -8,6 +8,10 @@ from django.core.files.base import ContentFile
 from django.utils import timezone
 from django.conf import settings
 
+from channel.feed import post_event
+from chat.timeline import DEFAULT_LIMIT
+from chat.utils import encoded_event
+
 logger = logging.getLogger(__name__)
 
 
@@ -53,6 +57,8 @@ class ChannelConsumer(AsyncWebsocketConsumer):
                 await self.handle_file_upload(data)
             elif action == 'get_history':
                 await self.send_message_history()
+            elif action == 'load_older':
+                await self.handle_load_older(data)
             elif action == 'mark_as_read':
                 await self.handle_mark_as_read(data)
             elif action == 'get_unread_count':
@@ -100,10 +106,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
         
             await self.channel_layer.group_send(
                 self.channel_room_name,
-                {
-                    'type': 'chat_message',
-                    'message': message_data
-                }
+                post_event('chat_message', message_data, self.channel_owner_id)
             )
 
     async def handle_file_upload(self, data):
@@ -132,10 +135,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
             
             await self.channel_layer.group_send(
                 self.channel_room_name,
-                {
-                    'type': 'file_uploaded',
-                    'message': message_data
-                }
+                post_event('file_uploaded', message_data, self.channel_owner_id)
             )
         else:
             await self.send(text_data=json.dumps({
@@ -147,6 +147,11 @@ class ChannelConsumer(AsyncWebsocketConsumer):
         if not message_id:
             return
 
+        try:
+            message_id = int(message_id)
+        except (TypeError, ValueError):
+            return
+
         success = await self.mark_message_as_read(message_id)
     
         if success:
@@ -181,22 +186,44 @@ class ChannelConsumer(AsyncWebsocketConsumer):
         }))
 
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message']
-        }))
+        is_owner = self.user.id == self.channel_owner_id
+        await self.send(text_data=event['owner_text'] if is_owner else event['text'])
 
     async def file_uploaded(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'file_uploaded',
-            'message': event['message']
-        }))
+        is_owner = self.user.id == self.channel_owner_id
+        await self.send(text_data=event['owner_text'] if is_owner else event['text'])
 
     async def send_message_history(self):
-        messages = await self.get_channel_messages()
+        messages, older_cursor, has_more = await self.get_channel_messages()
         await self.send(text_data=json.dumps({
             'type': 'message_history',
-            'messages': messages
+            'messages': messages,
+            'older_cursor': older_cursor,
+            'has_more': has_more
+        }))
+
+    async def handle_load_older(self, data):
+        cursor = data.get('cursor')
+        if not cursor:
+            await self.send(text_data=json.dumps({
+                'error': 'cursor is required'
+            }))
+            return
+
+        try:
+            messages, older_cursor, has_more = await self.get_channel_messages(cursor, data.get('limit') or DEFAULT_LIMIT)
+        except ValueError as e:
+            await self.send(text_data=json.dumps({
+                'error': str(e)
+            }))
+            return
+
+        await self.send(text_data=json.dumps({
+            'type': 'message_page',
+            'direction': 'older',
+            'messages': messages,
+            'older_cursor': older_cursor,
+            'has_more': has_more
         }))
         
         
@@ -221,11 +248,11 @@ class ChannelConsumer(AsyncWebsocketConsumer):
         if success:
             await self.channel_layer.group_send(
                 self.channel_room_name,
-                {
+                encoded_event('message_updated', {
                     'type': 'message_updated',
                     'message_id': message_id,
                     'new_content': new_content
-                }
+                })
             )
         else:
             await self.send(text_data=json.dumps({
@@ -297,11 +324,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
         }))
 
     async def message_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'message_updated',
-            'message_id': event['message_id'],
-            'new_content': event['new_content']
-        }))
+        await self.send(text_data=event['text'])
 
     async def message_deleted(self, event):
         await self.send(text_data=json.dumps({
@@ -312,6 +335,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def edit_message(self, message_id, new_content):
         from channel.models import ChannelMessage
+        from chat.services import refresh_preview
     
         try:
             message = ChannelMessage.objects.get(
@@ -323,6 +347,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
             message.content = new_content.strip()
             message.is_updated = True
             message.save(update_fields=["content", "is_updated"])
+            refresh_preview('channel', self.channel_id)
         
             return True
         except ChannelMessage.DoesNotExist:
@@ -332,6 +357,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
     def delete_file_message(self, file_id):
         from channel.models import ChannelMessage
         from chat.models import FileUpload
+        from chat.services import refresh_preview
     
         try:
             message = ChannelMessage.objects.get(
@@ -340,13 +366,14 @@ class ChannelConsumer(AsyncWebsocketConsumer):
                 user=self.user,
                 message_type='file'  # Faqat fayl xabarlarini o'chirish
             )
+            self.release_unread(message)
         
             if message.file:
                 file_upload = message.file
-                file_upload.file.delete()  # Faylni fayl tizimidan o'chiradi
-                file_upload.delete()       # FileUpload obyektini o'chiradi
+                file_upload.delete()  # Fayl ombordagi nusxasi signal orqali bo'shatiladi
         
             message.delete()
+            refresh_preview('channel', self.channel_id)
             return True
         
         except ChannelMessage.DoesNotExist:
@@ -359,6 +386,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def delete_message(self, message_id):
         from channel.models import ChannelMessage
+        from chat.services import refresh_preview
     
         try:
             message = ChannelMessage.objects.get(
@@ -366,23 +394,41 @@ class ChannelConsumer(AsyncWebsocketConsumer):
                 channel_id=self.channel_id,
                 user=self.user
             )
+            self.release_unread(message)
             message.delete()
+            refresh_preview('channel', self.channel_id)
             return True
         except ChannelMessage.DoesNotExist:
             return False
+
+    def release_unread(self, message):
+        from channel.models import ChannelMember
+        from chat.services import decrement_unread_for
+        from django.db.models import Q
+
+        # Subscribers whose watermark is still below the message lose it from their counter.
+        readers = ChannelMember.objects.filter(channel_id=self.channel_id).filter(
+            Q(last_read_message_id__gte=message.id) | Q(user_id=message.user_id)
+        ).values('user_id')
+        decrement_unread_for('channel', self.channel_id, readers)
        
 
     @database_sync_to_async
     def check_channel_access(self):
-        from channel.models import Channel
+        from channel.models import Channel, ChannelMember
         
         try:
             channel = Channel.objects.get(id=self.channel_id)
+            self.channel_owner_id = channel.owner_id
+            # Kept here and advanced by mark_as_read; None when not subscribed.
+            self.last_read_id = ChannelMember.objects.filter(
+                channel_id=self.channel_id, user=self.user
+            ).values_list('last_read_message_id', flat=True).first()
             
             if channel.owner_id == self.user.id:
                 return True
             
-            return channel.members.filter(id=self.user.id).exists()
+            return self.last_read_id is not None
             
         except Channel.DoesNotExist:
             return False
@@ -400,6 +446,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def save_message(self, content):
         from channel.models import ChannelMessage
+        from chat.services import record_message
         
         try:
             message = ChannelMessage.objects.create(
@@ -408,6 +455,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
                 content=content,
                 message_type='text'
             )
+            record_message('channel', self.channel_id, self.user.id, content, 'text', message.created_at)
             return message
         except Exception as e:
             logger.error(f"Error saving channel message: {e}")
@@ -417,6 +465,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
     def save_file_message(self, file_name, file_type, base64_data, file_size):
         from channel.models import ChannelMessage
         from chat.models import FileUpload
+        from chat.services import record_message
         import uuid
         import os
         
@@ -445,6 +494,7 @@ class ChannelConsumer(AsyncWebsocketConsumer):
                 message_type='file',
                 file=file_upload
             )
+            record_message('channel', self.channel_id, self.user.id, file_name, 'file', message.created_at)
 
             return message
 
@@ -454,157 +504,55 @@ class ChannelConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def serialize_message(self, message):
-        from channel.models import Channel
-    
-        print(f"[DEBUG] Serializing message: message_user_id={message.user.id}, current_user_id={self.user.id}, channel_id={self.channel_id}")
-    
-        is_channel_owner = False
-        can_edit = False
-        can_delete = False
-    
-        try:
-            channel = Channel.objects.get(id=self.channel_id)
-            is_channel_owner = channel.owner_id == self.user.id
-        
-            can_edit = is_channel_owner
-            can_delete = is_channel_owner
-        
-            print(f"[DEBUG] Channel check: channel_owner_id={channel.owner_id}, current_user_id={self.user.id}, is_channel_owner={is_channel_owner}")
-        
-        except Channel.DoesNotExist:
-            print(f"[DEBUG] Channel {self.channel_id} not found")
-            pass
-    
-        is_own_message = message.user.id == self.user.id
-    
-        result = {
-            'id': message.id,
-            'content': message.content,
-            'user': {
-                'id': str(message.user.id),
-                'fullname': message.user.fullname,
-                'email': message.user.email
-            },
-            'created_at': message.created_at.isoformat(),
-            'message_type': message.message_type,
-            'is_updated': message.is_updated,
-            'is_read': message.is_read,
-            'is_own': is_own_message,   
-            'is_channel_owner': is_channel_owner,   
-            'can_edit': can_edit,   
-            'can_delete': can_delete,   
-        }
-    
-        if message.file:
-            result['file'] = {
-                'name': message.file.original_filename,
-                'url': message.file.file_url,
-                'size': message.file.file.size if message.file.file else 0,
-                'type': message.message_type
-            }
+        from channel.feed import serialize_post
 
-        print(f"[DEBUG] Final result: is_own={is_own_message}, is_channel_owner={is_channel_owner}, can_edit={can_edit}, can_delete={can_delete}")
-        return result
+        # Viewer flags are added by each receiving consumer.
+        return serialize_post(message)
 
     @database_sync_to_async
-    def get_channel_messages(self):
-        from channel.models import ChannelMessage, Channel
+    def get_channel_messages(self, cursor=None, limit=DEFAULT_LIMIT):
+        from channel.models import Channel
+        from channel.feed import get_cached_page, apply_viewer
 
-        messages = ChannelMessage.objects.filter(
-            channel_id=self.channel_id
-        ).prefetch_related('read_by').select_related('user', 'file').order_by('created_at')
+        version = Channel.objects.filter(
+            id=self.channel_id
+        ).values_list('feed_version', flat=True).first() or 0
 
-        result = []
+        posts, older_cursor, has_more = get_cached_page(self.channel_id, version, cursor, limit)
+        messages = [apply_viewer(post, self.user.id, self.channel_owner_id, self.last_read_id or 0) for post in posts]
+        return messages, older_cursor, has_more
 
-        try:
-            channel = Channel.objects.get(id=self.channel_id)
-            is_current_user_channel_owner = channel.owner_id == self.user.id
-        except Channel.DoesNotExist:
-            is_current_user_channel_owner = False
+    async def mark_message_as_read(self, message_id):
+        from channel.reads import get_read_buffer
 
-        for msg in messages:
-            is_read_by_current_user = (
-                self.user in msg.read_by.all() or 
-                msg.user == self.user or  # O'z xabarimiz
-                is_current_user_channel_owner  # Kanal egasi
-            )
-        
-            is_channel_owner = is_current_user_channel_owner
-            can_edit = is_current_user_channel_owner
-            can_delete = is_current_user_channel_owner
-
-            message_data = {
-                'id': msg.id,
-                'content': msg.content,
-                'user': {
-                    'id': str(msg.user.id),
-                    'fullname': msg.user.fullname,
-                    'email': msg.user.email
-                },
-                'created_at': msg.created_at.isoformat(),
-                'message_type': msg.message_type,
-                'is_updated': msg.is_updated,
-                'is_read': is_read_by_current_user,  # ✅ To'g'ri qiymat
-                'is_own': msg.user.id == self.user.id,
-                'is_channel_owner': is_channel_owner,
-                'can_edit': can_edit,
-                'can_delete': can_delete,
-            }
-
-            if msg.file:
-                message_data['file'] = {
-                    'name': msg.file.original_filename,
-                    'url': msg.file.file_url,
-                    'size': msg.file.file.size if msg.file.file else 0,
-                    'type': msg.message_type
-                }
-
-            result.append(message_data)
+        sender_id = await self.get_message_sender(message_id)
+        if sender_id is None:
+            logger.error(f"Message {message_id} not found in channel {self.channel_id}")
+            return False
 
-        return result
+        # The read buffer writes the watermark and a view for every post it passes.
+        if sender_id != self.user.id and self.last_read_id is not None and message_id > self.last_read_id:
+            get_read_buffer().record(self.channel_id, self.user.id, message_id)
+            self.last_read_id = message_id
+        return True
 
     @database_sync_to_async
-    def mark_message_as_read(self, message_id):
+    def get_message_sender(self, message_id):
         from channel.models import ChannelMessage
-    
-        try:
-            message = ChannelMessage.objects.get(
-                id=message_id,
-                channel_id=self.channel_id
-            )
-        
-            if message.user != self.user:
-                if self.user not in message.read_by.all():
-                    message.read_by.add(self.user)
-            
-                from channel.models import Channel
-                channel = Channel.objects.get(id=self.channel_id)
-                total_members = channel.members.count()
-                read_count = message.read_by.count()
-            
-                if read_count >= total_members:
-                    message.is_read = True
-                    message.save(update_fields=['is_read'])
-        
-            return True
-        except ChannelMessage.DoesNotExist:
-            logger.error(f"Message {message_id} not found in channel {self.channel_id}")
-            return False
-        except Exception as e:
-            logger.error(f"Error marking message as read: {e}")
-            return False
+
+        return ChannelMessage.objects.filter(
+            id=message_id, channel_id=self.channel_id
+        ).values_list('user_id', flat=True).first()
 
     @database_sync_to_async
     def get_unread_count(self):
         from channel.models import ChannelMessage
     
+        if self.last_read_id is None:
+            return 0
         return ChannelMessage.objects.filter(
-            channel_id=self.channel_id
-        ).exclude(
-            user=self.user  
-        ).exclude(
-            read_by=self.user   
-        ).count()
+            channel_id=self.channel_id, id__gt=self.last_read_id
+        ).exclude(user=self.user).count()
         
         
     @database_sync_to_async
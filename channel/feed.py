@@ -0,0 +1,92 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from channel.models import Channel, ChannelMessage
+from chat.timeline import get_feed_page, DEFAULT_LIMIT, MAX_LIMIT
+
+
+# Pages are keyed by Channel.feed_version, which every post, edit and delete
+# bumps, so a stale page is never read even when the cache is per process.
+def _page_key(channel_id, version, cursor, limit):
+    return f'channel_feed:{channel_id}:{version}:{cursor or ""}:{limit}'
+
+
+def invalidate_feed(channel_ids):
+    if isinstance(channel_ids, int):
+        channel_ids = [channel_ids]
+    Channel.objects.filter(id__in=channel_ids).update(feed_version=F('feed_version') + 1)
+
+
+def serialize_post(message):
+    """The part of a post that is the same for every subscriber."""
+    data = {
+        'id': message.id,
+        'content': message.content,
+        'user': {
+            'id': str(message.user.id),
+            'fullname': message.user.fullname,
+            'email': message.user.email
+        },
+        'created_at': message.created_at.isoformat(),
+        'message_type': message.message_type,
+        'is_updated': message.is_updated,
+        'view_count': message.view_count,
+    }
+
+    if message.file:
+        data['file'] = {
+            'name': message.file.original_filename,
+            'url': message.file.file_url,
+            'size': message.file.file_size,
+            'type': message.message_type,
+            'preview': message.file.preview_payload(),
+        }
+    return data
+
+
+def apply_viewer(post, viewer_id, owner_id, last_read_id=0):
+    """Adds the flags that depend on who is looking at the post."""
+    is_owner = viewer_id == owner_id
+    is_own = post['user']['id'] == str(viewer_id)
+    return {
+        **post,
+        'is_read': is_own or is_owner or post['id'] <= last_read_id,
+        'is_own': is_own,
+        'is_channel_owner': is_owner,
+        'can_edit': is_owner,
+        'can_delete': is_owner,
+    }
+
+
+def post_event(handler, post, owner_id):
+    """
+    A channel layer event carrying the post already encoded: once as the
+    owner sees it and once as every other subscriber does.
+    """
+    return {
+        'type': handler,
+        'owner_text': json.dumps({'type': handler, 'message': apply_viewer(post, owner_id, owner_id)}),
+        'text': json.dumps({'type': handler, 'message': apply_viewer(post, None, owner_id)}),
+    }
+
+
+def get_cached_page(channel_id, version, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    One page of serialized posts, shared by every subscriber of the channel.
+    Returns (posts oldest first, older_cursor, has_more).
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    key = _page_key(channel_id, version, cursor, limit)
+
+    page = cache.get(key)
+    if page is None:
+        messages, older_cursor, has_more = get_feed_page(
+            ChannelMessage.objects.filter(channel_id=channel_id).select_related('user', 'file'),
+            'channel', cursor, limit
+        )
+        page = ([serialize_post(message) for message in messages], older_cursor, has_more)
+        cache.set(key, page, settings.CHANNEL_FEED_CACHE_TTL)
+    return page
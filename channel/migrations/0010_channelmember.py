@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+READ_BY_TABLE = 'channel_messages_read_by'
+
+
+def backfill_watermarks(apps, schema_editor):
+    ChannelMember = apps.get_model('channel', 'ChannelMember')
+    ChannelMessage = apps.get_model('channel', 'ChannelMessage')
+    InboxEntry = apps.get_model('chat', 'InboxEntry')
+    connection = schema_editor.connection
+
+    # ChannelMessage.read_by never had a migration, so its table exists only
+    # on databases where it was created by hand.
+    if READ_BY_TABLE in connection.introspection.table_names():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT m.channel_id, r.customuser_id, MAX(r.channelmessage_id) "
+                f"FROM {READ_BY_TABLE} r JOIN channel_messages m ON m.id = r.channelmessage_id "
+                f"GROUP BY m.channel_id, r.customuser_id"
+            )
+            rows = cursor.fetchall()
+        for channel_id, user_id, last_read in rows:
+            ChannelMember.objects.filter(
+                channel_id=channel_id, user_id=user_id
+            ).update(last_read_message_id=last_read)
+        schema_editor.execute(f"DROP TABLE {READ_BY_TABLE}")
+
+    for member in ChannelMember.objects.iterator():
+        unread = ChannelMessage.objects.filter(
+            channel_id=member.channel_id, id__gt=member.last_read_message_id
+        ).exclude(user_id=member.user_id).count()
+        InboxEntry.objects.filter(
+            conversation_type='channel', channel_id=member.channel_id, user_id=member.user_id
+        ).update(unread_count=unread)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('channel', '0009_alter_channel_options_alter_channelmessage_options_and_more'),
+        ('chat', '0026_searchentry'),
+    ]
+
+    operations = [
+        # Channel.members keeps its table; the through model only names it.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ChannelMember',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriptions', to='channel.channel')),
+                        ('user', models.ForeignKey(db_column='customuser_id', on_delete=django.db.models.deletion.CASCADE, related_name='channel_subscriptions', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'channels_members',
+                        'unique_together': {('channel', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='channel',
+                    name='members',
+                    field=models.ManyToManyField(blank=True, related_name='channel_members', through='channel.ChannelMember', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='channelmember',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_watermarks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='channelmessage',
+            index=models.Index(fields=['channel', 'id'], name='channel_mes_channel_5f8f4c_idx'),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channel', '0010_channelmember'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='channelmessage',
+            index=models.Index(fields=['channel', 'created_at', 'id'], name='channel_mes_channel_2b1b5d_idx'),
+        ),
+    ]
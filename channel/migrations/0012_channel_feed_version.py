@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channel', '0011_channelmessage_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='feed_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('channel', '0012_channel_feed_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channelmessage',
+            name='view_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
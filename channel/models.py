@@ -1,14 +1,18 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 from accounts.models import CustomUser
 
 
 class Channel(models.Model):
     owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='channel_owner')
-    members = models.ManyToManyField(CustomUser, related_name='channel_members', blank=True)
+    members = models.ManyToManyField(CustomUser, through='ChannelMember', related_name='channel_members', blank=True)
     name = models.CharField(max_length=50)
     description = models.TextField(null=True, blank=True)
     username = models.CharField(max_length=50, unique=True, null=True)
+    # Bumped on every post, edit and delete; cached feed pages are keyed by it.
+    feed_version = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -20,6 +24,39 @@ class Channel(models.Model):
         ordering = ['-created_at'] 
 
 
+class ChannelMember(models.Model):
+    channel = models.ForeignKey(Channel, on_delete=models.CASCADE, related_name='subscriptions')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_column='customuser_id', related_name='channel_subscriptions')
+    # Every message with an id up to this one counts as read by the subscriber.
+    last_read_message_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'channels_members'
+        unique_together = ('channel', 'user')
+
+    def __str__(self):
+        return f'{self.user} in {self.channel}'
+
+    def unread_messages(self):
+        return ChannelMessage.objects.filter(
+            channel_id=self.channel_id,
+            id__gt=self.last_read_message_id
+        ).exclude(user_id=self.user_id)
+
+    @property
+    def unread_count(self):
+        return self.unread_messages().count()
+
+    def mark_read_up_to(self, message_id):
+        """Moves the watermark forward to `message_id`; returns False if it was already past it."""
+        advanced = ChannelMember.objects.filter(
+            id=self.id, last_read_message_id__lt=message_id
+        ).update(last_read_message_id=message_id)
+        if advanced:
+            self.last_read_message_id = message_id
+        return bool(advanced)
+
+
 class ChannelMessage(models.Model):
     MESSAGE_TYPE_CHOICES = [
         ('text', 'Text'),
@@ -34,8 +71,10 @@ class ChannelMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_updated = models.BooleanField(default=False, null=True)
+    # Set once every subscriber's watermark has passed the message.
     is_read = models.BooleanField(default=False)
-    read_by = models.ManyToManyField(CustomUser, related_name='read_channel_messages', blank=True)
+    # Written in batches by channel.reads.ReadBuffer.
+    view_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return f'{self.user} - {self.content or "File message"}'
@@ -46,10 +85,10 @@ class ChannelMessage(models.Model):
         super().save(*args, **kwargs)
         
     def mark_as_read_by(self, user):
-        if self.user != user and user not in self.read_by.all():
-            self.read_by.add(user)
-            return True
-        return False
+        if self.user_id == user.id:
+            return False
+        member = ChannelMember.objects.filter(channel_id=self.channel_id, user=user).first()
+        return bool(member) and member.mark_read_up_to(self.id)
     
     
     def get_absolute_url(self):
@@ -66,4 +105,29 @@ class ChannelMessage(models.Model):
     
     class Meta:
         db_table = 'channel_messages'
-        ordering = ['created_at']
\ No newline at end of file
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['channel', 'id']),
+            models.Index(fields=['channel', 'created_at', 'id']),
+        ]
+
+
+
+@receiver(post_save, sender=ChannelMessage)
+def index_channel_message(sender, instance, created, update_fields, **kwargs):
+    from chat.search import index_message
+    index_message('channel', instance, created, update_fields)
+
+
+@receiver(post_delete, sender=ChannelMessage)
+def unindex_channel_message(sender, instance, **kwargs):
+    from chat.search import unindex_message
+    unindex_message('channel', instance.id)
+
+
+@receiver(post_save, sender=ChannelMessage)
+@receiver(post_delete, sender=ChannelMessage)
+def invalidate_channel_feed(sender, instance, **kwargs):
+    from channel.feed import invalidate_feed
+    if instance.channel_id:
+        invalidate_feed(instance.channel_id)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Case, When, Value, Min, Count, OuterRef, Subquery, BigIntegerField, PositiveIntegerField
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from channels.db import database_sync_to_async
+
+from channel.models import ChannelMember, ChannelMessage
+from chat.models import InboxEntry
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = 500
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), WRITE_BATCH_SIZE):
+        yield items[start:start + WRITE_BATCH_SIZE]
+
+
+def _members(keys):
+    condition = Q()
+    for channel_id, user_id in keys:
+        condition |= Q(channel_id=channel_id, user_id=user_id)
+    return condition
+
+
+def _count_views(watermarks):
+    """
+    {message_id: new views} for the posts each member's watermark moves
+    past. The ranges start at the stored watermarks, so a post is counted
+    once per subscriber however many sockets or flushes report it.
+    """
+    ranges = {}
+    for keys in _chunks(watermarks):
+        members = ChannelMember.objects.select_for_update().filter(_members(keys)).values_list(
+            'channel_id', 'user_id', 'last_read_message_id'
+        )
+        for channel_id, user_id, last_read_id in members:
+            if watermarks[channel_id, user_id] > last_read_id:
+                ranges.setdefault(channel_id, []).append((last_read_id, watermarks[channel_id, user_id], user_id))
+
+    views = {}
+    for channel_id, spans in ranges.items():
+        posts = ChannelMessage.objects.filter(
+            channel_id=channel_id,
+            id__gt=min(low for low, _, _ in spans),
+            id__lte=max(high for _, high, _ in spans)
+        ).values_list('id', 'user_id')
+        for message_id, author_id in posts:
+            count = sum(1 for low, high, user_id in spans if low < message_id <= high and user_id != author_id)
+            if count:
+                views[message_id] = count
+    return views
+
+
+def _write_views(views):
+    for ids in _chunks(views):
+        ChannelMessage.objects.filter(id__in=ids).update(
+            view_count=F('view_count') + Case(
+                *[When(id=message_id, then=Value(views[message_id])) for message_id in ids],
+                output_field=PositiveIntegerField()
+            )
+        )
+
+
+def _write_watermarks(watermarks):
+    unread_posts = ChannelMessage.objects.filter(
+        channel_id=OuterRef('channel_id'), id__gt=OuterRef('last_read_message_id')
+    ).exclude(user_id=OuterRef('user_id')).order_by().values('channel_id').annotate(n=Count('id')).values('n')
+
+    for keys in _chunks(watermarks):
+        members = ChannelMember.objects.filter(_members(keys))
+        members.update(last_read_message_id=Greatest('last_read_message_id', Case(
+            *[When(channel_id=c, user_id=u, then=Value(watermarks[c, u])) for c, u in keys],
+            output_field=BigIntegerField()
+        )))
+
+        unread = members.annotate(
+            unread=Coalesce(Subquery(unread_posts), 0)
+        ).values_list('channel_id', 'user_id', 'unread')
+        whens = [When(channel_id=c, user_id=u, then=Value(n)) for c, u, n in unread]
+        if whens:
+            InboxEntry.objects.filter(conversation_type='channel').filter(_members(keys)).update(
+                unread_count=Case(*whens, output_field=PositiveIntegerField()),
+                last_read_at=timezone.now()
+            )
+
+    # Everything below a channel's lowest watermark has been read by every subscriber.
+    for channel_id in {channel_id for channel_id, _ in watermarks}:
+        lowest = ChannelMember.objects.filter(
+            channel_id=channel_id
+        ).aggregate(lowest=Min('last_read_message_id'))['lowest']
+        ChannelMessage.objects.filter(
+            channel_id=channel_id, id__lte=lowest or 0, is_read=False
+        ).update(is_read=True)
+
+
+def write_reads(watermarks):
+    """
+    Persists buffered reads, given as {(channel_id, user_id): last read
+    message id}. Every post between a member's stored watermark and the new
+    one gains a view. The cost is a handful of statements per batch, however
+    many subscribers read.
+
+    Feed versions are left alone: cached pages show view counts up to
+    CHANNEL_FEED_CACHE_TTL old rather than being rebuilt on every flush.
+    """
+    with transaction.atomic():
+        views = _count_views(watermarks)
+        if views:
+            _write_views(views)
+        _write_watermarks(watermarks)
+
+
+class ReadBuffer:
+    """
+    Collects channel read watermarks from the consumers and writes them,
+    with the post views they imply, every interval, so reading a channel
+    does no synchronous writes.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.watermarks = {}
+        self.task = None
+
+    def record(self, channel_id, user_id, message_id):
+        key = (channel_id, user_id)
+        self.watermarks[key] = max(self.watermarks.get(key, 0), message_id)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        while self.watermarks:
+            await asyncio.sleep(self.interval)
+            watermarks, self.watermarks = self.watermarks, {}
+            try:
+                await database_sync_to_async(write_reads)(watermarks)
+            except Exception as e:
+                logger.error(f"Error writing channel reads: {e}")
+                for key, message_id in watermarks.items():
+                    self.watermarks[key] = max(self.watermarks.get(key, 0), message_id)
+        self.task = None
+
+
+_buffer = None
+
+
+def get_read_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = ReadBuffer(settings.CHANNEL_READ_FLUSH_INTERVAL)
+    return _buffer
@@ -20,13 +20,19 @@ class ChannelSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
     
+    # Lists pass channels through channel.services.annotate_channels; the
+    # fallbacks below are for single objects.
     def get_member_count(self, obj):
+        if hasattr(obj, 'member_count'):
+            return obj.member_count
         return obj.members.count()
     
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             is_owner = obj.owner_id == request.user.id
+            if hasattr(obj, 'is_subscribed'):
+                return is_owner or obj.is_subscribed
             is_member = obj.members.filter(id=request.user.id).exists()
             return is_owner or is_member
         return False
@@ -39,11 +45,14 @@ class ChannelSerializer(serializers.ModelSerializer):
     
     def get_last_message(self, obj):
         from channel.models import ChannelMessage
-        last_msg = ChannelMessage.objects.filter(channel=obj).order_by('-created_at').first()
+        from channel.services import format_last_post
+
+        if hasattr(obj, 'last_post_type'):
+            return format_last_post(obj.last_post_content, obj.last_post_type, obj.last_post_file)
+
+        last_msg = ChannelMessage.objects.filter(channel=obj).select_related('file').order_by('-created_at', '-id').first()
         if last_msg:
-            if last_msg.message_type == 'file':
-                return f"📎 {last_msg.file.original_filename if last_msg.file else 'Fayl'}"
-            return last_msg.content or ""
+            return format_last_post(last_msg.content, last_msg.message_type, last_msg.file.original_filename if last_msg.file else None)
         return ""
         
 
@@ -70,7 +79,7 @@ class ChannelMessageSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'content', 'user', 'user_info', 'channel', 'file',
             'message_type', 'created_at', 'updated_at', 'is_updated',
-            'is_read', 'read_by', 'is_own', 'can_edit', 'can_delete'
+            'is_read', 'view_count', 'is_own', 'can_edit', 'can_delete'
         ]
     
     def get_is_own(self, obj):
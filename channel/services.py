@@ -0,0 +1,24 @@
+from django.db.models import Count, Exists, OuterRef, Subquery
+
+from channel.models import ChannelMember, ChannelMessage
+
+
+def annotate_channels(queryset, user_id):
+    """
+    Adds member_count, is_subscribed and the latest post of every channel to
+    the same query, so serializing a list costs no query per channel.
+    """
+    latest = ChannelMessage.objects.filter(channel_id=OuterRef('pk')).order_by('-created_at', '-id')
+    return queryset.select_related('owner').annotate(
+        member_count=Count('subscriptions'),
+        is_subscribed=Exists(ChannelMember.objects.filter(channel_id=OuterRef('pk'), user_id=user_id)),
+        last_post_content=Subquery(latest.values('content')[:1]),
+        last_post_type=Subquery(latest.values('message_type')[:1]),
+        last_post_file=Subquery(latest.values('file__original_filename')[:1]),
+    )
+
+
+def format_last_post(content, message_type, file_name):
+    if message_type == 'file':
+        return f"📎 {file_name or 'Fayl'}"
+    return content or ""
@@ -2,16 +2,15 @@ from rest_framework import generics, status, permissions, filters
 from rest_framework.response import Response
 
 from channel.permissions import IsOwner
-from channel.models import Channel, ChannelMessage
+from channel.models import Channel
 from channel.serializers import (
-    ChannelSerializer, ChannelMessageSerializer,
-    FollowChannelSerializer, ChannelUpdateSerializer,
-    ChannelCreateSerializer, ChannelListSerializer
+    ChannelSerializer, FollowChannelSerializer,
+    ChannelUpdateSerializer, ChannelCreateSerializer
 )
 
-from django.db.models import Q
-
-from accounts.models import CustomUser
+from channel.services import annotate_channels
+from chat.services import add_inbox_entries, remove_inbox_entries, get_inbox, INBOX_PAGE_SIZE
+from chat.timeline import encode_cursor, decode_cursor
 
 
 
@@ -21,7 +20,8 @@ class ChannelApiView(generics.GenericAPIView):
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
-            serializer.save()
+            channel = serializer.save()
+            add_inbox_entries('channel', channel.id, [channel.owner_id])
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -33,31 +33,47 @@ class ChannelListApiView(generics.GenericAPIView):
     
     def get(self, request):
         try:
-            user_channels = Channel.objects.filter(
-                Q(members=request.user) | Q(owner=request.user)
-            ).distinct().order_by('-updated_at')    
-            
-            channels_data = []
-            for channel in user_channels:
-                serializer = self.get_serializer(channel, context={'request': request})
-                channel_data = serializer.data
-                
-                channel_data['type'] = 'channel'
-                
-                last_message = ChannelMessage.objects.filter(
-                    channel=channel
-                ).order_by('-created_at').first()
-                
-                if last_message:
-                    channel_data['timestamp'] = last_message.created_at.isoformat()
-                else:
-                    channel_data['timestamp'] = channel.created_at.isoformat()
-                    
-                channels_data.append(channel_data)
-            
-            return Response(channels_data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({'message': 'Error retrieving channels', 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            before = None
+            cursor = request.query_params.get('cursor')
+            if cursor:
+                before_at, _, before_id = decode_cursor(cursor)
+                before = (before_at, before_id)
+
+            # The user's channels, most recent first, come from their inbox entries.
+            entries, has_more = get_inbox(
+                request.user.id,
+                conversation_type='channel',
+                before=before,
+                limit=request.query_params.get('limit', INBOX_PAGE_SIZE),
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        channels = annotate_channels(
+            Channel.objects.filter(id__in=[entry.channel_id for entry in entries]), request.user.id
+        ).in_bulk()
+
+        channels_data = []
+        for entry in entries:
+            channel = channels.get(entry.channel_id)
+            if channel is None:
+                continue
+            channel_data = self.get_serializer(channel, context={'request': request}).data
+            channel_data['type'] = 'channel'
+            channel_data['timestamp'] = entry.last_message_at.isoformat()
+            channel_data['unread'] = entry.unread_count
+            channels_data.append(channel_data)
+
+        next_cursor = None
+        if has_more:
+            last = entries[-1]
+            next_cursor = encode_cursor(last.last_message_at, last.conversation_type, last.id)
+
+        return Response({
+            'channels': channels_data,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        }, status=status.HTTP_200_OK)
     
 # class ChannelListApiView(generics.GenericAPIView):
 #     serializer_class = ChannelSerializer
@@ -135,7 +151,9 @@ class ChannelFilterApiView(generics.ListAPIView):
     filter_backends = [filters.SearchFilter]
     search_fields = ['username']
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Channel.objects.all()
+    
+    def get_queryset(self):
+        return annotate_channels(Channel.objects.all(), self.request.user.id)
     
     
     
@@ -168,6 +186,7 @@ class FollowChannelApiView(generics.GenericAPIView):
             }, status=status.HTTP_200_OK)
             
         channel.members.add(user)
+        add_inbox_entries('channel', channel.id, [user.id])
         
         return Response({
             'message': f'{user.fullname} followed {channel.name}!',
@@ -204,6 +223,8 @@ class UnFollowChannelApiView(generics.GenericAPIView):
             }, status=status.HTTP_200_OK)
             
         channel.members.remove(user)
+        if user.id != channel.owner_id:
+            remove_inbox_entries('channel', channel.id, [user.id])
         
         return Response({
             'message': f'{user.fullname} unfollowed from {channel.name}!',
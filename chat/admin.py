@@ -1,8 +1,10 @@
 from django.contrib import admin
-from chat.models import Message, FileUpload, Notification, Room
+from chat.models import Message, FileUpload, Notification, Room, InboxEntry, StoredBlob
 
 
 admin.site.register(Room)
 admin.site.register(Message)
 admin.site.register(FileUpload)
-admin.site.register(Notification)
\ No newline at end of file
+admin.site.register(Notification)
+admin.site.register(InboxEntry)
+admin.site.register(StoredBlob)
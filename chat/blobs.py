@@ -0,0 +1,85 @@
+import os
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from chat.models import StoredBlob
+
+
+BLOB_ROOT = 'chat_files/blobs'
+PREVIEW_ROOT = 'chat_files/previews'
+PREVIEW_KINDS = ('thumb', 'poster')
+
+
+def blob_name(checksum, file_name=None):
+    """chat_files/blobs/ab/cd/abcd....ext, so no directory grows past 65536 entries per level."""
+    extension = os.path.splitext(file_name or '')[1].lower()[:16]
+    return f'{BLOB_ROOT}/{checksum[:2]}/{checksum[2:4]}/{checksum}{extension}'
+
+
+def preview_name(checksum, kind):
+    """Previews are keyed by content too, so duplicate uploads share them."""
+    return f'{PREVIEW_ROOT}/{checksum[:2]}/{checksum[2:4]}/{checksum}-{kind}.webp'
+
+
+def _storage():
+    return StoredBlob._meta.get_field('file').storage
+
+
+def _add_reference(checksum):
+    if StoredBlob.objects.filter(checksum=checksum).update(ref_count=F('ref_count') + 1):
+        return StoredBlob.objects.get(checksum=checksum)
+    return None
+
+
+def acquire_blob(content, checksum, file_name=None):
+    """
+    Returns the blob for `checksum` with one more reference. The content is
+    written only when no blob with that hash exists, so duplicate uploads
+    skip the write entirely.
+    """
+    blob = _add_reference(checksum)
+    if blob:
+        return blob
+
+    storage = _storage()
+    name = blob_name(checksum, file_name)
+    if not storage.exists(name):
+        name = storage.save(name, content)
+
+    try:
+        with transaction.atomic():
+            return StoredBlob.objects.create(
+                checksum=checksum, file=name, size=content.size, ref_count=1
+            )
+    except IntegrityError:
+        # Another writer stored the same content first.
+        if name != blob_name(checksum, file_name):
+            storage.delete(name)
+        return _add_reference(checksum)
+
+
+def delete_unreferenced(checksum, name):
+    """Removes a blob's file and previews from storage unless a blob row still uses them."""
+    if not StoredBlob.objects.filter(checksum=checksum).exists():
+        storage = _storage()
+        storage.delete(name)
+        for kind in PREVIEW_KINDS:
+            storage.delete(preview_name(checksum, kind))
+
+
+def release_blob(blob_id):
+    """Drops one reference and deletes the blob once nothing points at it."""
+    with transaction.atomic():
+        StoredBlob.objects.filter(id=blob_id).update(ref_count=Greatest(F('ref_count') - 1, Value(0)))
+
+        # The row stays locked until commit, so a concurrent acquire_blob
+        # either ran first and keeps the blob or finds it gone and re-creates it.
+        blob = StoredBlob.objects.select_for_update().filter(id=blob_id, ref_count=0).values('checksum', 'file').first()
+        if not blob:
+            return
+        deleted, _ = StoredBlob.objects.filter(id=blob_id, ref_count=0, uploads__isnull=True).delete()
+
+    if deleted:
+        transaction.on_commit(lambda: delete_unreferenced(blob['checksum'], blob['file']))
@@ -1,55 +1,35 @@
 import json
 import base64
+import asyncio
 import logging
 
 from django.contrib.auth.models import AnonymousUser
 from django.core.files.base import ContentFile
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.core.exceptions import ValidationError
-from django.core.cache import cache
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
 
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
 
 from chat.models import Room, Message, FileUpload
+from chat.timeline import get_room_timeline, OLDER, NEWER
+from chat.services import (
+    decrement_unread, mark_read, mark_read_until, get_unread_count, get_total_unread,
+    record_private_message, refresh_preview, get_inbox, INBOX_MAX_PAGE_SIZE
+)
+from chat.presence import (
+    presence_group, get_default_interests, get_room_interests, get_group_interests,
+    get_presence_registry, get_presence_writer, PRESENCE_BATCH_DELAY, MAX_PRESENCE_SUBSCRIPTIONS
+)
+from chat.utils import file_type_for_category, format_file_size, encoded_event, p2p_file_frame
 
 logger = logging.getLogger(__name__)
 
 
-@database_sync_to_async
-def set_user_online_status(user, status):
-    try:
-        user.is_online = status
-        update_fields = ["is_online"]
-        
-        if not status:
-            user.last_seen = timezone.now()
-            update_fields.append("last_seen")
-            
-        user.save(update_fields=update_fields)
-        return True
-    except Exception as e:
-        logger.error(f"Error setting user online status: {e}")
-        return False
-    
-
-@database_sync_to_async
-def increment_connection(user_id):
-    key = f"user:{user_id}:connections"
-    count = cache.get(key, 0) + 1
-    cache.set(key, count, timeout=None)
-    return count
-
-
-@database_sync_to_async
-def decrement_connection(user_id):
-    key = f"user:{user_id}:connections"
-    count = max(cache.get(key, 0) - 1, 0)
-    cache.set(key, count, timeout=None)
-    return count
-
-
 class StatusConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
         user = self.scope["user"]
@@ -57,43 +37,140 @@ class StatusConsumer(AsyncJsonWebsocketConsumer):
             await self.close()
             return
 
-        connections = await increment_connection(user.id)
+        self.subscriptions = set()
+        self.default_interests = set()
+        self.pending_presence = {}
+        self.flush_task = None
+        self.registry = get_presence_registry()
+        self.writer = get_presence_writer()
+
+        connections = await self.registry.add_connection(user.id, self.channel_name)
         if connections == 1: 
-            await set_user_online_status(user, True)
+            self.writer.record(user.id, True)
 
-        await self.channel_layer.group_add("status", self.channel_name)
         await self.accept()
+        self.heartbeat_task = asyncio.ensure_future(self.send_heartbeats())
+
+        self.default_interests = await self.get_default_interests()
+        await self.subscribe(self.default_interests)
+
+        if connections == 1:
+            await self.publish_presence("online")
+
+    async def disconnect(self, code):
+        user = self.scope["user"]
+        if user.is_anonymous:
+            return
+
+        heartbeat_task = getattr(self, 'heartbeat_task', None)
+        if heartbeat_task:
+            heartbeat_task.cancel()
+        if getattr(self, 'flush_task', None):
+            self.flush_task.cancel()
+        # connect() can fail before the connection was registered.
+        if getattr(self, 'registry', None) is None:
+            return
+
+        remaining = await self.registry.remove_connection(user.id, self.channel_name)
+        if remaining == 0:  
+            self.writer.record(user.id, False)
+            await self.publish_presence("offline")
+
+        for user_id in self.subscriptions:
+            await self.channel_layer.group_discard(presence_group(user_id), self.channel_name)
+
+    async def receive_json(self, content):
+        message_type = content.get("type")
+        if message_type not in ("subscribe", "unsubscribe"):
+            return
+
+        if content.get("room_id"):
+            user_ids = await self.get_room_interests(content["room_id"])
+        elif content.get("group_id"):
+            user_ids = await self.get_group_interests(content["group_id"])
+        else:
+            return
+
+        if message_type == "subscribe":
+            await self.subscribe(user_ids)
+        else:
+            await self.unsubscribe(user_ids - self.default_interests)
+
+    async def subscribe(self, user_ids):
+        capacity = max(MAX_PRESENCE_SUBSCRIPTIONS - len(self.subscriptions), 0)
+        new_ids = [user_id for user_id in user_ids if user_id not in self.subscriptions][:capacity]
+        if not new_ids:
+            return
+
+        for user_id in new_ids:
+            await self.channel_layer.group_add(presence_group(user_id), self.channel_name)
+        self.subscriptions.update(new_ids)
 
+        online = await self.registry.online_among(new_ids)
+        await self.send_json({
+            "type": "presence_diff",
+            "online": sorted(online),
+            "offline": sorted(set(new_ids) - online),
+            "timestamp": timezone.now().isoformat()
+        })
+
+    async def unsubscribe(self, user_ids):
+        for user_id in user_ids & self.subscriptions:
+            await self.channel_layer.group_discard(presence_group(user_id), self.channel_name)
+            self.pending_presence.pop(user_id, None)
+        self.subscriptions -= user_ids
+
+    async def send_heartbeats(self):
+        # Keeps this connection's registry entry alive; if the worker dies the
+        # entry lapses after PRESENCE_TTL and the user stops counting as online.
+        while True:
+            await asyncio.sleep(settings.PRESENCE_TTL / 3)
+            try:
+                await self.registry.heartbeat(self.scope["user"].id, self.channel_name)
+            except Exception as e:
+                logger.error(f"Presence heartbeat failed: {e}")
+
+    async def publish_presence(self, status):
         await self.channel_layer.group_send(
-            "status",
+            presence_group(self.scope["user"].id),
             {
-                "type": "status_update",
-                "user_id": user.id,
-                "status": "online",
-                "timestamp": timezone.now().isoformat()
+                "type": "presence_update",
+                "user_id": self.scope["user"].id,
+                "status": status,
             }
         )
 
-    async def disconnect(self, code):
-        user = self.scope["user"]
+    async def presence_update(self, event):
+        # Flaps inside one window collapse to the last state per user.
+        self.pending_presence[event["user_id"]] = event["status"]
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_presence())
+
+    async def flush_presence(self):
+        await asyncio.sleep(PRESENCE_BATCH_DELAY)
+        pending, self.pending_presence = self.pending_presence, {}
+        self.flush_task = None
+        if not pending:
+            return
 
-        remaining = await decrement_connection(user.id)
-        if remaining == 0:  
-            await set_user_online_status(user, False)
-            await self.channel_layer.group_send(
-                "status",
-                {
-                    "type": "status_update",
-                    "user_id": user.id,
-                    "status": "offline",
-                    "timestamp": timezone.now().isoformat()
-                }
-            )
+        await self.send_json({
+            "type": "presence_diff",
+            "online": sorted(u for u, s in pending.items() if s == "online"),
+            "offline": sorted(u for u, s in pending.items() if s == "offline"),
+            "timestamp": timezone.now().isoformat()
+        })
 
-        await self.channel_layer.group_discard("status", self.channel_name)
+    @database_sync_to_async
+    def get_default_interests(self):
+        return get_default_interests(self.scope["user"].id)
 
-    async def status_update(self, event):
-        await self.send_json(event)
+    @database_sync_to_async
+    def get_room_interests(self, room_id):
+        return get_room_interests(self.scope["user"].id, room_id)
+
+    @database_sync_to_async
+    def get_group_interests(self, group_id):
+        return get_group_interests(self.scope["user"].id, group_id)
 
 
 
@@ -141,6 +218,8 @@ class P2PChatConsumer(BaseChatConsumer):
 
         if not await self.validate_user_and_room():
             return
+
+        self.recipient = self.room.user2 if self.room.user1_id == self.user.id else self.room.user1
         
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -154,10 +233,12 @@ class P2PChatConsumer(BaseChatConsumer):
 
         await self.accept()
 
-        last_messages = await self.get_last_messages()
+        page = await self.get_last_messages()
         await self.send_json({  
             "type": "message_history",
-            "messages": last_messages
+            "messages": page["messages"],
+            "older_cursor": page["older_cursor"],
+            "has_more": page["has_more"]
         })
 
 
@@ -199,6 +280,8 @@ class P2PChatConsumer(BaseChatConsumer):
             await self.handle_send(content)
         elif action == 'read':
             await self.handle_read(content)
+        elif action == 'read_until':
+            await self.handle_read_until(content)
         elif action == 'edit_message':
             await self.handle_edit(content)
         elif action == 'delete_message':
@@ -211,9 +294,13 @@ class P2PChatConsumer(BaseChatConsumer):
             await self.handle_read_file(content)
         elif action == 'get_files':
             await self.handle_get_files(content)
+        elif action == 'load_older':
+            await self.handle_load_page(content, OLDER)
+        elif action == 'load_newer':
+            await self.handle_load_page(content, NEWER)
         else:
             await self.send_error(
-                "Invalid action. Choose from: send, read, delete_message, delete_file, edit_message, upload_file, read_file, get_files", 
+                "Invalid action. Choose from: send, read, read_until, delete_message, delete_file, edit_message, upload_file, read_file, get_files, load_older, load_newer", 
                 'invalid_action'
             )
 
@@ -224,27 +311,41 @@ class P2PChatConsumer(BaseChatConsumer):
             await self.send_error("Message is required", 'message_required')
             return
 
-        saved_message = await self.save_message(message_text)
-        if not saved_message:
+        result = await self.save_message(message_text)
+        if not result:
             await self.send_error("Failed to save message", 'save_error')
             return
 
-        message_data = await self.get_message_data(saved_message.id)
-        if not message_data:
-            await self.send_error("Failed to get message data", 'data_error')
-            return
+        message_data, unread_count, total_unread = result
+        temp_message_id = content.get('temp_message_id')
+        if temp_message_id:
+            message_data['temp_message_id'] = temp_message_id
 
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                "type": "chat_message",
-                "message": message_data  
-            }
+            encoded_event("chat_message", {"type": "chat_message", **message_data})
         )
 
-        recipient = self.room.user2 if self.user == self.room.user1 else self.room.user1
-        unread_count = await self.get_unread_count_for_recipient(self.room.id, recipient.id)
-        await self.send_unread_count_update(recipient.id, unread_count) 
+        await self.send_unread_count_update(self.recipient.id, unread_count, total_unread) 
+
+
+    async def handle_load_page(self, content, direction):
+        cursor = content.get('cursor')
+        if not cursor:
+            await self.send_error("cursor is required", 'cursor_required')
+            return
+
+        try:
+            page = await self.get_timeline_page(cursor, direction, content.get('limit') or 50)
+        except ValueError as e:
+            await self.send_error(str(e), 'invalid_page')
+            return
+
+        await self.send_json({
+            "type": "message_page",
+            "direction": direction,
+            **page
+        })
 
 
     async def handle_read(self, content):
@@ -298,6 +399,65 @@ class P2PChatConsumer(BaseChatConsumer):
             await self.send_error(error_msg, 'mark_error')
 
 
+    async def handle_read_until(self, content):
+        message_id = content.get("message_id")
+        file_id = content.get("file_id")
+        timestamp = content.get("timestamp")
+
+        if not message_id and not file_id and not timestamp:
+            await self.send_error("message_id, file_id or timestamp is required", "id_required")
+            return
+
+        until = await self.resolve_read_watermark(message_id, file_id, timestamp)
+        if until is None:
+            await self.send_error("Message, file or timestamp not found", "invalid_id")
+            return
+
+        result = await self.mark_read_until(until)
+        if result is None:
+            await self.send_error("Failed to mark as read", 'mark_error')
+            return
+
+        marked, unread_count = result
+
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type": "read_until_update",
+                "room_id": self.room_id,
+                "user_id": self.user.id,
+                "until": until.isoformat(),
+                "message_id": message_id,
+                "file_id": file_id,
+                "count": marked,
+            }
+        )
+
+        if marked:
+            total_unread = await self.get_total_unread_for_user(self.user.id)
+            await self.channel_layer.group_send(
+                f"notifications_{self.user.id}",
+                {
+                    "type": "unread_count_update",
+                    "contact_id": self.recipient.id,
+                    "unread_count": unread_count,
+                    "total_unread": total_unread,
+                }
+            )
+
+
+    async def read_until_update(self, event):
+        await self.send_json({
+            "type": "read_until",
+            "room_id": event["room_id"],
+            "user_id": event["user_id"],
+            "until": event["until"],
+            "message_id": event.get("message_id"),
+            "file_id": event.get("file_id"),
+            "count": event["count"],
+        })
+
+
     async def read(self, event):
         await self.send_json({
             "type": "read",
@@ -351,12 +511,12 @@ class P2PChatConsumer(BaseChatConsumer):
         if success:
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
+                encoded_event("message_updated", {
                     "type": "message_updated",
                     "message_id": message_id,
                     "new_content": new_content,
                     "room_id": self.room_id
-                }
+                })
             )
             await self.send_success('Message updated successfully')
         else:
@@ -364,12 +524,7 @@ class P2PChatConsumer(BaseChatConsumer):
 
 
     async def message_updated(self, event):
-        await self.send_json({
-            'type': 'message_updated',
-            'message_id': event['message_id'],
-            'new_content': event['new_content'],
-            'room_id': event['room_id']
-        })
+        await self.send(text_data=event['text'])
 
 
     async def handle_upload_file(self, content):
@@ -381,24 +536,15 @@ class P2PChatConsumer(BaseChatConsumer):
             await self.send_error("file_data and file_name are required", 'params_required')
             return
     
-        file_upload = await self.save_file(file_data, file_name, file_type)
-        if file_upload:
-            file_info = await self.get_file_data(file_upload.id)
-        
-            if file_info is None:
-                await self.send_error("Failed to get file information", 'data_error')
-                return
+        result = await self.save_file(file_data, file_name, file_type)
+        if result:
+            file_info, unread_count, total_unread = result
             
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
-                    "type": "file_uploaded",
-                    **file_info
-                }
+                encoded_event("file_uploaded", p2p_file_frame(file_info))
             )
-            recipient = self.room.user2 if self.user == self.room.user1 else self.room.user1
-            unread_count = await self.get_unread_count_for_recipient(self.room.id, recipient.id)
-            await self.send_unread_count_update(recipient.id, unread_count)
+            await self.send_unread_count_update(self.recipient.id, unread_count, total_unread)
         else:
             await self.send_error("Failed to upload file", 'upload_error')
 
@@ -447,20 +593,7 @@ class P2PChatConsumer(BaseChatConsumer):
 
 
     async def chat_message(self, event):
-        message_data = event["message"] 
-    
-        sender_id = message_data.get("sender_id")
-        recipient_id = message_data.get("recipient_id")
-        room_id = message_data.get("room_id")
-
-        await self.send_json({
-            "type": "chat_message",
-            **message_data,
-        })
-
-        if self.user.id == recipient_id: 
-            unread_count = await self.get_unread_count_for_recipient(room_id, recipient_id)
-            await self.send_unread_count_update(recipient_id, unread_count)
+        await self.send(text_data=event["text"])
 
 
     async def message_deleted(self, event):
@@ -473,14 +606,7 @@ class P2PChatConsumer(BaseChatConsumer):
 
 
     async def file_uploaded(self, event):
-        await self.send_json({
-            'type': 'file_uploaded',
-            'id': event['id'],
-            'file_name': event['file_name'],
-            'file_url': event['file_url'],
-            'user': event['user'],
-            'uploaded_at': event['uploaded_at']
-        })
+        await self.send(text_data=event['text'])
 
 
     async def unread_count_update(self, event):
@@ -488,22 +614,22 @@ class P2PChatConsumer(BaseChatConsumer):
             "type": "unread_count_update",
             "contact_id": event["contact_id"],
             "unread_count": event["unread_count"],
+            "total_unread": event.get("total_unread"),
         })
 
 
-    async def send_unread_count_update(self, user_id, unread_count):
+    async def send_unread_count_update(self, user_id, unread_count, total_unread=None):
         try:
             if user_id == self.user.id:
                 return
-            
-            contact_id = await self.get_contact_id_for_user(user_id)
         
             await self.channel_layer.group_send(
                 f"notifications_{user_id}",
                 {
                     "type": "unread_count_update",
-                    "contact_id": contact_id,
+                    "contact_id": self.user.id,
                     "unread_count": unread_count,
+                    "total_unread": total_unread,
                 }
         )
         except Exception as e:
@@ -511,58 +637,14 @@ class P2PChatConsumer(BaseChatConsumer):
 
 
     @database_sync_to_async
-    def get_contact_id_for_user(self, user_id):
-        try:
-            current_user_id = self.user.id
-            
-            if user_id == self.room.user1.id:
-                return self.room.user2.id  
-            else:
-                return self.room.user1.id  
-                
-        except Exception as e:
-            logger.error(f"Error getting contact ID: {e}")
-            return current_user_id
-        
-        
-    @database_sync_to_async
-    def get_unread_count(self, room_id, recipient_id):
-        return Message.objects.filter(
-            room_id=room_id,
-            recipient_id=recipient_id,
-            is_read=False
-        ).count()
-
-
-    @database_sync_to_async
-    def get_message_data(self, message_id):
-        try:
-            message = Message.objects.select_related('sender').get(
-                id=message_id, 
-                room=self.room
-            )
-            return {
-                'id': str(message.id),
-                "message": message.text,
-                'sender': {
-                    "id": str(message.sender.id),
-                    "email": message.sender.email,
-                    "full_name": message.sender.fullname,
-                    "fullname": message.sender.fullname 
-                },
-                'is_updated': message.is_updated,
-                'is_read': message.is_read,
-                'timestamp': str(message.timestamp),  
-            }
-        except (Message.DoesNotExist, ValidationError) as e:
-            logger.error(f"Error getting message data: {e}")
-            return None
+    def get_total_unread_for_user(self, user_id):
+        return get_total_unread(user_id)
 
 
     @database_sync_to_async
     def get_room(self):
         try:
-            return Room.objects.get(id=self.room_id)
+            return Room.objects.select_related('user1', 'user2').get(id=self.room_id)
         except (Room.DoesNotExist, ValidationError) as e:
             logger.error(f"Room not found: {e}")
             return None
@@ -580,77 +662,49 @@ class P2PChatConsumer(BaseChatConsumer):
     @database_sync_to_async
     def save_message(self, message_text):
         try:
-            recipient = self.room.user2 if self.user == self.room.user1 else self.room.user1
-            
-            return Message.objects.create(
-                room=self.room,
-                sender=self.user,
-                recipient=recipient,
-                text=message_text.strip()
-            )
+            with transaction.atomic():
+                message = Message.objects.create(
+                    room=self.room,
+                    sender=self.user,
+                    recipient=self.recipient,
+                    text=message_text.strip()
+                )
+                unread_count = record_private_message(
+                    self.room, self.user.id, message.text, 'text', message.timestamp
+                )
+            total_unread = get_total_unread(self.recipient.id)
         except Exception as e:
             logger.error(f"Error saving message: {e}")
             return None
 
+        message_data = {
+            'id': str(message.id),
+            "message": message.text,
+            'sender': {
+                "id": str(self.user.id),
+                "email": self.user.email,
+                "full_name": self.user.fullname,
+                "fullname": self.user.fullname 
+            },
+            'is_updated': message.is_updated,
+            'is_read': message.is_read,
+            'timestamp': str(message.timestamp),  
+        }
+        return message_data, unread_count, total_unread
+
 
     @database_sync_to_async
     def get_last_messages(self, limit=50):
         try:
-            text_messages = Message.objects.filter(
-                room=self.room
-            ).select_related('sender').order_by('-timestamp')[:limit]
-    
-            file_messages = FileUpload.objects.filter(
-                room=self.room
-            ).select_related('user').order_by('-uploaded_at')[:limit]
-    
-            all_messages = []
-    
-            for msg in text_messages:
-                all_messages.append({
-                    "type": "text",
-                    "id": str(msg.id),
-                    "message": msg.text,
-                    'sender': {
-                        "id": str(msg.sender.id),
-                        "email": msg.sender.email,
-                        "full_name": msg.sender.fullname,
-                        "fullname": msg.sender.fullname  
-                    },
-                    "is_read": msg.is_read,
-                    "is_updated": msg.is_updated,
-                    "timestamp": str(msg.timestamp),
-                })
-    
-            for file_msg in file_messages:
-                file_name = (file_msg.original_filename 
-                            if hasattr(file_msg, 'original_filename') and file_msg.original_filename 
-                            else file_msg.file.name.split('/')[-1])
-        
-                all_messages.append({
-                    "type": "file",
-                    "id": str(file_msg.id),
-                    "message": file_name,
-                    'sender': {
-                        "id": str(file_msg.user.id),
-                        "email": file_msg.user.email,
-                        "full_name": file_msg.user.fullname,
-                        "fullname": file_msg.user.fullname  
-                    },
-                    "is_read": file_msg.is_read,
-                    "is_updated": False,
-                    "timestamp": str(file_msg.uploaded_at),
-                    "file_name": file_name,
-                    "file_url": getattr(file_msg, 'file_url', None),
-                    "file_type": self.get_file_type(file_name),
-                })
-    
-            all_messages.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-            return all_messages[:limit]
+            return get_room_timeline(self.room.id, limit=limit)
         except Exception as e:
             logger.error(f"Error getting last messages: {e}")
-            return []
+            return {"messages": [], "older_cursor": None, "newer_cursor": None, "has_more": False}
+
+
+    @database_sync_to_async
+    def get_timeline_page(self, cursor, direction, limit):
+        return get_room_timeline(self.room.id, cursor=cursor, direction=direction, limit=limit)
 
 
     @database_sync_to_async
@@ -665,6 +719,7 @@ class P2PChatConsumer(BaseChatConsumer):
             if not message.is_read:
                 message.is_read = True
                 message.save(update_fields=["is_read"])
+                mark_read(self.room.id, self.user.id, read_at=message.timestamp)
                 logger.info(f"Message {message_id} marked as read by user {self.user.id}")
         
             return True
@@ -676,6 +731,37 @@ class P2PChatConsumer(BaseChatConsumer):
             return False
 
 
+    @database_sync_to_async
+    def resolve_read_watermark(self, message_id=None, file_id=None, timestamp=None):
+        try:
+            if message_id:
+                return Message.objects.filter(
+                    id=int(message_id), room=self.room
+                ).values_list('timestamp', flat=True).first()
+
+            if file_id:
+                return FileUpload.objects.filter(
+                    id=int(file_id), room=self.room
+                ).values_list('uploaded_at', flat=True).first()
+
+            until = parse_datetime(str(timestamp))
+            if until and timezone.is_naive(until):
+                until = timezone.make_aware(until)
+            return until
+        except (ValueError, TypeError) as e:
+            logger.error(f"Invalid read watermark: {e}")
+            return None
+
+
+    @database_sync_to_async
+    def mark_read_until(self, until):
+        try:
+            return mark_read_until(self.room.id, self.user.id, until)
+        except Exception as e:
+            logger.error(f"Error marking messages as read: {e}")
+            return None
+
+
     @database_sync_to_async
     def delete_message(self, message_id):
         try:
@@ -685,6 +771,9 @@ class P2PChatConsumer(BaseChatConsumer):
                 room=self.room
             )
             message.delete()
+            if not message.is_read:
+                decrement_unread(self.room.id, message.recipient_id)
+            refresh_preview('private', self.room.id)
             return True
         except Message.DoesNotExist:
             return False
@@ -708,6 +797,7 @@ class P2PChatConsumer(BaseChatConsumer):
             message.text = new_content.strip()
             message.is_updated = True
             message.save(update_fields=["text", "is_updated"])
+            refresh_preview('private', self.room.id)
     
             logger.info(f"Message {message_id} updated by user {self.user.id} (timestamp unchanged)")
             return True
@@ -730,84 +820,40 @@ class P2PChatConsumer(BaseChatConsumer):
     
             file_content = ContentFile(file_bytes, name=file_name)
     
-            recipient = self.room.user2 if self.user == self.room.user1 else self.room.user1
-    
             file_upload = FileUpload(
                 user=self.user,
                 file=file_content,
                 room=self.room,
-                recipient=recipient
+                recipient=self.recipient,
+                original_filename=file_name
             )
-    
-            if hasattr(FileUpload, 'original_filename'):
-                file_upload.original_filename = file_name
-        
-            file_upload.save()
+
+            with transaction.atomic():
+                file_upload.save()
+                unread_count = record_private_message(
+                    self.room, self.user.id, file_name, 'file', file_upload.uploaded_at
+                )
+            total_unread = get_total_unread(self.recipient.id)
     
             logger.info(f"File uploaded successfully: {file_upload.id}")
-            return file_upload
         except Exception as e:
             logger.error(f"File upload error: {e}")
             return None
 
-
-    @database_sync_to_async
-    def get_file_data(self, file_upload_id):
-        try:
-            file_upload = FileUpload.objects.select_related('user').get(id=file_upload_id)
-    
-            file_url = file_upload.file_url
-        
-            if hasattr(file_upload, 'original_filename') and file_upload.original_filename:
-                file_name = file_upload.original_filename
-            else:
-                file_name = file_upload.file.name.split('/')[-1]
-    
-            return {
-                'id': str(file_upload.id),
-                'file_name': file_name,
-                'file_url': file_url,
-                'file_size': file_upload.file.size if file_upload.file else 0,
-                'file_type': self.get_file_type(file_name),
-                'user': {
-                    'id': str(file_upload.user.id),
-                    'email': file_upload.user.email,
-                    'full_name': file_upload.user.fullname
-                },
-                'uploaded_at': str(file_upload.uploaded_at)
-            }
-        except FileUpload.DoesNotExist:
-            logger.error(f"File upload not found: {file_upload_id}")
-            return None
-        except Exception as e:
-            logger.error(f"Error getting file data: {e}")
-            return None
-        
-        
-    def get_file_type(self, file_name):
-        if not file_name:
-            return 'file'
-    
-        extension = file_name.split('.')[-1].lower() if '.' in file_name else ''
-    
-        if extension in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-            return 'image'
-        elif extension in ['mp4', 'avi', 'mov', 'wmv']:
-            return 'video'
-        elif extension in ['mp3', 'wav', 'ogg', 'flac']:
-            return 'audio'
-        elif extension == 'pdf':
-            return 'pdf'
-        elif extension in ['doc', 'docx']:
-            return 'word'
-        elif extension in ['xls', 'xlsx']:
-            return 'excel'
-        elif extension in ['zip', 'rar']:
-            return 'archive'
-        elif extension in ['txt']:
-            return 'text'
-        else:
-            return 'file'
+        return {
+            'id': str(file_upload.id),
+            'file_name': file_name,
+            'file_url': file_upload.file_url,
+            'file_size': file_upload.file_size,
+            'file_type': file_type_for_category(file_upload.file_category),
+            'preview': file_upload.preview_payload(),
+            'user': {
+                'id': str(self.user.id),
+                'email': self.user.email,
+                'full_name': self.user.fullname
+            },
+            'uploaded_at': str(file_upload.uploaded_at)
+        }, unread_count, total_unread
 
 
     @database_sync_to_async
@@ -828,6 +874,7 @@ class P2PChatConsumer(BaseChatConsumer):
             if not file_upload.is_read:  
                 file_upload.is_read = True
                 file_upload.save(update_fields=["is_read"])
+                mark_read(self.room.id, self.user.id, read_at=file_upload.uploaded_at)
         
             logger.info(f"File {file_id} marked as read by user {self.user.id}")
             return True
@@ -842,23 +889,9 @@ class P2PChatConsumer(BaseChatConsumer):
     @database_sync_to_async
     def get_unread_count_for_recipient(self, room_id, recipient_id):
         try:
-            message_count = Message.objects.filter(
-                room_id=room_id,
-                recipient_id=recipient_id,
-                is_read=False
-            ).count()
-        
-            file_count = FileUpload.objects.filter(
-                room_id=room_id,
-                recipient_id=recipient_id,
-                is_read=False
-            ).count()
-        
-            total_unread = message_count + file_count
-            logger.info(f"Unread count for user {recipient_id} in room {room_id}: {total_unread} (messages: {message_count}, files: {file_count})")
-            return total_unread
+            return get_unread_count(room_id, recipient_id)
         except Exception as e:
-            logger.error(f"Error calculating unread count: {e}")
+            logger.error(f"Error reading unread count: {e}")
             return 0
 
 
@@ -870,10 +903,10 @@ class P2PChatConsumer(BaseChatConsumer):
                 user=self.user, 
                 room=self.room
             )
-            if file_upload.file:
-                file_upload.file.delete(save=False)
-        
             file_upload.delete()
+            if not file_upload.is_read and file_upload.recipient_id:
+                decrement_unread(self.room.id, file_upload.recipient_id)
+            refresh_preview('private', self.room.id)
             return True
         except FileUpload.DoesNotExist:
             logger.error(f"File upload not found: {file_id}, user: {self.user.id}")
@@ -899,8 +932,8 @@ class P2PChatConsumer(BaseChatConsumer):
                 {
                     'id': file.id,
                     'name': file.original_filename if hasattr(file, 'original_filename') and file.original_filename else file.file.name.split('/')[-1],
-                    'type': self.get_file_type(file.file.name),
-                    'size': self.format_file_size(file.file.size),
+                    'type': file_type_for_category(file.file_category),
+                    'size': format_file_size(file.file_size),
                     'uploadedBy': file.user.fullname,
                     'uploadDate': file.uploaded_at.strftime("%Y-%m-%d %H:%M"),
                     'downloadCount': file.download_count if hasattr(file, 'download_count') else 0
@@ -912,16 +945,6 @@ class P2PChatConsumer(BaseChatConsumer):
             return []
 
 
-    def format_file_size(self, size_bytes):
-        if size_bytes == 0:
-            return "0B"
-        size_names = ["B", "KB", "MB", "GB"]
-        i = 0
-        while size_bytes >= 1024 and i < len(size_names)-1:
-            size_bytes /= 1024.0
-            i += 1
-        return f"{size_bytes:.1f}{size_names[i]}"
-
 
 class NotificationConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
@@ -967,6 +990,8 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
     
         if action == 'get_recent_conversations':
             await self.handle_get_recent_conversations()
+        elif action == 'get_total_unread':
+            await self.handle_get_total_unread()
         else:
             await self.send_error("Invalid action", 'invalid_action')
 
@@ -978,6 +1003,19 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
         })
 
 
+    async def handle_get_total_unread(self):
+        total_unread = await self.get_total_unread()
+        await self.send_json({
+            "type": "total_unread",
+            "total_unread": total_unread
+        })
+
+
+    @database_sync_to_async
+    def get_total_unread(self):
+        return get_total_unread(self.user.id)
+
+
     async def handle_get_recent_conversations(self):
         conversations = await self.get_recent_conversations()
         await self.send_json({
@@ -989,95 +1027,23 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
     @database_sync_to_async
     def get_recent_conversations(self):
         try:
-            from django.db.models import Q, Max
-            from chat.models import Room, Message, FileUpload
-            from accounts.models import Contact  # Kontakt modelini import qiling
-        
-            user = self.user
-        
-            user_rooms = Room.objects.filter(
-                Q(user1=user) | Q(user2=user)
-            ).select_related('user1', 'user2')
-        
-            conversations = []
-        
-            for room in user_rooms:
-                other_user = room.user2 if room.user1 == user else room.user1
-            
-                try:
-                    contact = Contact.objects.filter(
-                        user=user, 
-                        contact_user=other_user
-                    ).first()
-                    alias = contact.alias if contact else None
-                except Exception as e:
-                    logger.error(f"Error getting contact alias: {e}")
-                    alias = None
-            
-                latest_text_message = Message.objects.filter(room=room).order_by('-timestamp').first()
-                latest_file_upload = FileUpload.objects.filter(room=room).order_by('-uploaded_at').first()
-            
-                latest_timestamp = None
-                last_message = "No messages yet"
-                message_type = "text"
-            
-                if latest_text_message and latest_file_upload:
-                    if latest_text_message.timestamp > latest_file_upload.uploaded_at:
-                        latest_timestamp = latest_text_message.timestamp
-                        last_message = latest_text_message.text
-                        message_type = "text"
-                    else:
-                        latest_timestamp = latest_file_upload.uploaded_at
-                        file_name = (latest_file_upload.original_filename 
-                                if hasattr(latest_file_upload, 'original_filename') and latest_file_upload.original_filename
-                                else latest_file_upload.file.name.split('/')[-1])
-                        last_message = file_name
-                        message_type = "file"
-                elif latest_text_message:
-                    latest_timestamp = latest_text_message.timestamp
-                    last_message = latest_text_message.text
-                    message_type = "text"
-                elif latest_file_upload:
-                    latest_timestamp = latest_file_upload.uploaded_at
-                    file_name = (latest_file_upload.original_filename 
-                            if hasattr(latest_file_upload, 'original_filename') and latest_file_upload.original_filename
-                            else latest_file_upload.file.name.split('/')[-1])
-                    last_message = file_name
-                    message_type = "file"
-            
-                if not latest_timestamp:
-                    continue
-            
-                unread_messages = Message.objects.filter(
-                    room=room,
-                    recipient=user,
-                    is_read=False
-                ).count()
-            
-                unread_files = FileUpload.objects.filter(
-                    room=room,
-                    recipient=user,
-                    is_read=False
-                ).count()
-            
-                total_unread = unread_messages + unread_files
-            
-                conversations.append({
-                    'id': room.id,
-                    'sender': alias or other_user.fullname,  # ✅ Avval alias, keyin fullname
-                    'sender_id': other_user.id,
-                    'last_message': last_message,
-                    'message_type': message_type,
-                    'timestamp': latest_timestamp.isoformat(),
-                    'unread': total_unread,
-                    'alias': alias,  # ✅ Alias ni alohida saqlash
-                    'is_contact': bool(alias)  # ✅ Kontakt ekanligini belgilash
-                })
-        
-            conversations.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-            return conversations[:]
-        
+            entries, has_more = get_inbox(self.user.id, conversation_type='private', limit=INBOX_MAX_PAGE_SIZE)
+
+            return [
+                {
+                    'id': entry.room_id,
+                    'sender': entry.alias or entry.peer.fullname,
+                    'sender_id': entry.peer_id,
+                    'last_message': entry.last_message,
+                    'message_type': entry.message_type,
+                    'timestamp': entry.last_message_at.isoformat(),
+                    'unread': entry.unread_count,
+                    'alias': entry.alias,
+                    'is_contact': bool(entry.alias)
+                }
+                for entry in entries
+            ]
+
         except Exception as e:
             logger.error(f"Error getting recent conversations: {e}")
             return []
@@ -1100,6 +1066,7 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
             "type": "unread_count_update",
             "contact_id": event["contact_id"],
             "unread_count": event["unread_count"],
+            "total_unread": event.get("total_unread"),
         })
         
         
@@ -1285,13 +1252,14 @@ class FilesConsumer(AsyncJsonWebsocketConsumer):
                 {
                     'id': file.id,
                     'name': file.original_filename if hasattr(file, 'original_filename') and file.original_filename else file.file.name.split('/')[-1],
-                    'type': self.get_file_type(file.file.name),
-                    'size': self.format_file_size(file.file.size),
+                    'type': file.file_category,
+                    'size': format_file_size(file.file_size),
                     'uploadedBy': file.user.fullname,
                     'uploadDate': file.uploaded_at.strftime("%Y-%m-%d %H:%M"),
                     'downloadCount': file.download_count if hasattr(file, 'download_count') else 0,
                     'isOwner': file.user.id == self.user.id,
                     'fileUrl': file.file.url if file.file else None,
+                    'preview': file.preview_payload(),
                     'fileName': file.original_filename if hasattr(file, 'original_filename') and file.original_filename else file.file.name.split('/')[-1],
                     'roomId': file.room.id if file.room else None
                 }
@@ -1335,6 +1303,8 @@ class FilesConsumer(AsyncJsonWebsocketConsumer):
                 file_upload.original_filename = file_name
             
             file_upload.save()
+            if room:
+                refresh_preview('private', room.id)
         
             logger.info(f"File uploaded successfully: {file_upload.id}")
             return file_upload
@@ -1355,13 +1325,14 @@ class FilesConsumer(AsyncJsonWebsocketConsumer):
             return {
                 'id': file_upload.id,
                 'name': file_name,
-                'type': self.get_file_type(file_name),
-                'size': self.format_file_size(file_upload.file.size),
+                'type': file_upload.file_category,
+                'size': format_file_size(file_upload.file_size),
                 'uploadedBy': file_upload.user.fullname,
                 'uploadDate': file_upload.uploaded_at.strftime("%Y-%m-%d %H:%M"),
                 'downloadCount': file_upload.download_count if hasattr(file_upload, 'download_count') else 0,
                 'isOwner': file_upload.user.id == self.user.id,
                 'fileUrl': file_upload.file.url,
+                'preview': file_upload.preview_payload(),
                 'fileName': file_name,
                 'roomId': file_upload.room.id if file_upload.room else None
             }
@@ -1381,10 +1352,11 @@ class FilesConsumer(AsyncJsonWebsocketConsumer):
             if file_upload.user != self.user and self.user.role != 'Admin':
                 return False
             
-            if file_upload.file:
-                file_upload.file.delete(save=False)
-        
             file_upload.delete()
+            if file_upload.room_id:
+                if not file_upload.is_read and file_upload.recipient_id:
+                    decrement_unread(file_upload.room_id, file_upload.recipient_id)
+                refresh_preview('private', file_upload.room_id)
             return True
         except FileUpload.DoesNotExist:
             logger.error(f"File upload not found: {file_id}")
@@ -1421,42 +1393,6 @@ class FilesConsumer(AsyncJsonWebsocketConsumer):
             return None
 
 
-    def get_file_type(self, file_name):
-        if not file_name:
-            return 'file'
-    
-        extension = file_name.split('.')[-1].lower() if '.' in file_name else ''
-    
-        if extension in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-            return 'image'
-        elif extension in ['mp4', 'avi', 'mov', 'wmv']:
-            return 'video'
-        elif extension in ['mp3', 'wav', 'ogg', 'flac']:
-            return 'audio'
-        elif extension == 'pdf':
-            return 'pdf'
-        elif extension in ['doc', 'docx']:
-            return 'document'
-        elif extension in ['xls', 'xlsx']:
-            return 'spreadsheet'
-        elif extension in ['zip', 'rar']:
-            return 'archive'
-        elif extension in ['txt']:
-            return 'text'
-        else:
-            return 'file'
-
-
-    def format_file_size(self, size_bytes):
-        if size_bytes == 0:
-            return "0B"
-        size_names = ["B", "KB", "MB", "GB"]
-        i = 0
-        while size_bytes >= 1024 and i < len(size_names)-1:
-            size_bytes /= 1024.0
-            i += 1
-        return f"{size_bytes:.1f}{size_names[i]}"
-
 
 class VideoCallConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
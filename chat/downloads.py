@@ -0,0 +1,140 @@
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _FileRange:
+    """
+    File object limited to one byte range. Under daphne FileResponse reads
+    it chunk by chunk in Python; CHAT_FILE_OFFLOAD is the only way to have
+    the proxy send files without copying them through the application.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(file_upload, stat):
+    if file_upload.checksum:
+        return f'"{file_upload.checksum}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) for a single satisfiable byte range, None when the
+    header should be ignored, or raises ValueError when it is unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def _offload_response(file_upload, path):
+    response = HttpResponse()
+    if settings.CHAT_FILE_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.CHAT_FILE_OFFLOAD_PREFIX + quote(file_upload.file.name)
+    else:
+        response['X-Sendfile'] = path
+    # Let the proxy decide the type; it also handles Range on its own.
+    del response['Content-Type']
+    return response
+
+
+def serve_file(request, file_upload):
+    """
+    Serves a stored file with validators, conditional requests and single
+    byte ranges, or delegates the transfer to the front proxy when
+    CHAT_FILE_OFFLOAD is set.
+    """
+    path = file_upload.file.path
+    stat = os.stat(path)
+    etag = file_etag(file_upload, stat)
+    last_modified = stat.st_mtime
+
+    # The validators are copied onto a 304 from the response passed in.
+    validators = HttpResponse()
+    validators['ETag'] = etag
+    validators['Last-Modified'] = http_date(last_modified)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified), response=validators
+    )
+    if response is not validators:
+        return response
+
+    filename = file_upload.original_filename or os.path.basename(file_upload.file.name)
+
+    if settings.CHAT_FILE_OFFLOAD:
+        response = _offload_response(file_upload, path)
+        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+        if byte_range and _if_range_matches(request, etag, last_modified):
+            start, end = byte_range
+            length = end - start + 1
+            response = FileResponse(
+                _FileRange(open(path, 'rb'), start, length),
+                as_attachment=True, filename=filename, status=206
+            )
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
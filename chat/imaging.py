@@ -0,0 +1,137 @@
+import io
+import math
+import shutil
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+
+# This module runs inside the preview worker processes, so it imports nothing
+# from Django and works under any multiprocessing start method.
+
+PLACEHOLDER_COMPONENTS = (4, 3)
+
+_EXIF_ORIENTATION = 0x0112
+# Orientations that turn the image a quarter, so width and height swap.
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+_BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _encode83(value, length):
+    return ''.join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _to_linear(value):
+    value /= 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _to_srgb(value):
+    value = min(max(value, 0), 1)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, x_components=PLACEHOLDER_COMPONENTS[0], y_components=PLACEHOLDER_COMPONENTS[1]):
+    """Encodes a BlurHash string; the image is shrunk first since only low frequencies matter."""
+    image = image.convert('RGB')
+    image.thumbnail((32, 32))
+    width, height = image.size
+    pixels = [tuple(_to_linear(c) for c in pixel) for pixel in image.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            norm = 1 if i == j == 0 else 2
+            r = g = b = 0
+            for y in range(height):
+                basis_y = math.cos(math.pi * j * y / height)
+                for x in range(width):
+                    basis = norm * math.cos(math.pi * i * x / width) * basis_y
+                    pr, pg, pb = pixels[y * width + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(c) for f in ac for c in f) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += _encode83(quantised_max, 1)
+    result += _encode83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+
+    for factor in ac:
+        r, g, b = (
+            max(0, min(18, int(math.floor(math.copysign(abs(c / max_value) ** 0.5, c) * 9 + 9.5))))
+            for c in factor
+        )
+        result += _encode83(r * 19 * 19 + g * 19 + b, 2)
+    return result
+
+
+def _first_frame(path):
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        return None
+    result = subprocess.run(
+        [ffmpeg, '-v', 'error', '-i', path, '-frames:v', '1', '-f', 'image2pipe', '-vcodec', 'png', '-'],
+        capture_output=True, timeout=60
+    )
+    return result.stdout or None
+
+
+def _webp(image, size):
+    image = image.copy()
+    image.thumbnail((size, size))
+    output = io.BytesIO()
+    image.save(output, 'WEBP', quality=80, method=4)
+    return output.getvalue()
+
+
+def render_preview(path, category, thumbnail_size, poster_size):
+    """
+    Returns the WebP thumbnail, the poster for videos, the placeholder hash
+    and the original dimensions, or None when the file cannot be decoded.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        if category == 'video':
+            frame = _first_frame(path)
+            if not frame:
+                return None
+            image = Image.open(io.BytesIO(frame))
+        else:
+            image = Image.open(path)
+
+        # The dimensions are taken before draft(), which can shrink the image.
+        width, height = image.size
+        if image.getexif().get(_EXIF_ORIENTATION) in _ROTATED_ORIENTATIONS:
+            width, height = height, width
+
+        if category != 'video':
+            # JPEG decoders can scale down while decoding.
+            image.draft('RGB', (thumbnail_size * 2, thumbnail_size * 2))
+
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+        return {
+            'thumbnail': _webp(image, thumbnail_size),
+            'poster': _webp(image, poster_size) if category == 'video' else None,
+            'placeholder': blurhash(image),
+            'width': width,
+            'height': height,
+        }
+    except Exception:
+        logger.exception(f"Could not render preview for {path}")
+        return None
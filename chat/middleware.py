@@ -3,11 +3,9 @@ from urllib.parse import parse_qs
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 
-from rest_framework_simplejwt.tokens import AccessToken
-
 from django.contrib.auth.models import AnonymousUser
 
-from accounts.models import CustomUser
+from accounts.authentication import validate_access_token, peek_cached_user, get_cached_user
 
 
 
@@ -26,9 +24,11 @@ class JWTAuthMiddleware(BaseMiddleware):
 
         if token:
             try:
-                validated_token = AccessToken(token)
+                validated_token = validate_access_token(token)
                 user_id = validated_token["user_id"]
-                user = await self.get_user(user_id)
+                # Clients open several sockets per page; only the first one
+                # should need the database.
+                user = peek_cached_user(user_id) or await self.get_user(user_id)
                 scope["user"] = user
             except Exception:
                 scope["user"] = AnonymousUser()
@@ -40,7 +40,4 @@ class JWTAuthMiddleware(BaseMiddleware):
 
     @database_sync_to_async
     def get_user(self, user_id):
-        try:
-            return CustomUser.objects.get(id=user_id)
-        except CustomUser.DoesNotExist:
-            return AnonymousUser()
\ No newline at end of file
+        return get_cached_user(user_id) or AnonymousUser()
\ No newline at end of file
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0018_alter_fileupload_options_alter_fileupload_channel_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'timestamp', 'id'], name='chat_messag_room_id_284f10_idx'),
+        ),
+    ]
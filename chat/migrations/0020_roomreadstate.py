@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-17 00:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_read_states(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    FileUpload = apps.get_model('chat', 'FileUpload')
+    RoomReadState = apps.get_model('chat', 'RoomReadState')
+
+    counts = {}
+    for model in (Message, FileUpload):
+        rows = model.objects.filter(
+            is_read=False, room__isnull=False, recipient__isnull=False
+        ).values('room_id', 'recipient_id').annotate(total=models.Count('id'))
+
+        for row in rows:
+            key = (row['room_id'], row['recipient_id'])
+            counts[key] = counts.get(key, 0) + row['total']
+
+    RoomReadState.objects.bulk_create(
+        [
+            RoomReadState(room_id=room_id, user_id=user_id, unread_count=total)
+            for (room_id, user_id), total in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0019_message_room_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chat.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='roomreadstate',
+            constraint=models.UniqueConstraint(fields=('room', 'user'), name='unique_read_state_per_room_user'),
+        ),
+        migrations.RunPython(backfill_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,197 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+PREVIEW_LENGTH = 255
+
+
+def _latest_room_item(Message, FileUpload, room_id):
+    message = Message.objects.filter(room_id=room_id).order_by('-timestamp', '-id').first()
+    upload = FileUpload.objects.filter(room_id=room_id).order_by('-uploaded_at', '-id').first()
+
+    if upload and (not message or upload.uploaded_at > message.timestamp):
+        name = upload.original_filename or upload.file.name.split('/')[-1]
+        return name, 'file', upload.uploaded_at, upload.user_id
+    if message:
+        return message.text, 'text', message.timestamp, message.sender_id
+    return '', 'text', None, None
+
+
+def _latest_feed_item(queryset, sender_field):
+    message = queryset.select_related('file').order_by('-created_at', '-id').first()
+    if not message:
+        return '', 'text', None, None
+    if message.file_id:
+        name = message.file.original_filename or message.file.file.name.split('/')[-1]
+        return name, 'file', message.created_at, getattr(message, sender_field)
+    return message.content or '', message.message_type or 'text', message.created_at, getattr(message, sender_field)
+
+
+def backfill_inbox(apps, schema_editor):
+    InboxEntry = apps.get_model('chat', 'InboxEntry')
+    Room = apps.get_model('chat', 'Room')
+    Message = apps.get_model('chat', 'Message')
+    FileUpload = apps.get_model('chat', 'FileUpload')
+    Contact = apps.get_model('accounts', 'Contact')
+    Group = apps.get_model('groups', 'Group')
+    GroupMember = apps.get_model('groups', 'GroupMember')
+    GroupMessage = apps.get_model('groups', 'GroupMessage')
+    Channel = apps.get_model('channel', 'Channel')
+    ChannelMessage = apps.get_model('channel', 'ChannelMessage')
+
+    aliases = {
+        (owner_id, contact_user_id): alias
+        for owner_id, contact_user_id, alias in Contact.objects.values_list('owner_id', 'contact_user_id', 'alias')
+    }
+    existing = {
+        (entry.room_id, entry.user_id): entry
+        for entry in InboxEntry.objects.filter(room__isnull=False)
+    }
+
+    for room in Room.objects.filter(user1__isnull=False, user2__isnull=False).iterator():
+        text, message_type, sent_at, sender_id = _latest_room_item(Message, FileUpload, room.id)
+        for user_id, peer_id in ((room.user1_id, room.user2_id), (room.user2_id, room.user1_id)):
+            entry = existing.get((room.id, user_id)) or InboxEntry(room_id=room.id, user_id=user_id)
+            entry.conversation_type = 'private'
+            entry.peer_id = peer_id
+            entry.alias = aliases.get((user_id, peer_id))
+            entry.last_message = text[:PREVIEW_LENGTH]
+            entry.message_type = message_type
+            entry.last_message_at = sent_at
+            entry.last_sender_id = sender_id
+            entry.save()
+
+    for group in Group.objects.iterator():
+        text, message_type, sent_at, sender_id = _latest_feed_item(
+            GroupMessage.objects.filter(group_id=group.id), 'sender_id'
+        )
+        entries = []
+        for member in GroupMember.objects.filter(group_id=group.id):
+            unread = GroupMessage.objects.filter(group_id=group.id).exclude(
+                sender_id=member.user_id
+            ).exclude(read_by__id=member.user_id).count()
+            entries.append(InboxEntry(
+                user_id=member.user_id, conversation_type='group', group_id=group.id,
+                last_message=text[:PREVIEW_LENGTH], message_type=message_type,
+                last_message_at=sent_at or group.created_at, last_sender_id=sender_id,
+                unread_count=unread,
+            ))
+        InboxEntry.objects.bulk_create(entries, batch_size=1000)
+
+    for channel in Channel.objects.iterator():
+        text, message_type, sent_at, sender_id = _latest_feed_item(
+            ChannelMessage.objects.filter(channel_id=channel.id), 'user_id'
+        )
+        user_ids = set(channel.members.values_list('id', flat=True))
+        user_ids.add(channel.owner_id)
+        entries = []
+        # ChannelMessage.read_by never had a migration, so every post by
+        # someone else counts; channel 0010 recounts from the watermarks.
+        for user_id in user_ids:
+            unread = ChannelMessage.objects.filter(channel_id=channel.id).exclude(user_id=user_id).count()
+            entries.append(InboxEntry(
+                user_id=user_id, conversation_type='channel', channel_id=channel.id,
+                last_message=text[:PREVIEW_LENGTH], message_type=message_type,
+                last_message_at=sent_at or channel.created_at, last_sender_id=sender_id,
+                unread_count=unread,
+            ))
+        InboxEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0014_remove_userprofile_user_customuser_phone_number_and_more'),
+        ('groups', '0010_alter_groupmessage_created_at'),
+        ('channel', '0009_alter_channel_options_alter_channelmessage_options_and_more'),
+        ('chat', '0020_roomreadstate'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='roomreadstate',
+            name='unique_read_state_per_room_user',
+        ),
+        migrations.RenameModel(
+            old_name='RoomReadState',
+            new_name='InboxEntry',
+        ),
+        migrations.AlterField(
+            model_name='inboxentry',
+            name='room',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='chat.room'),
+        ),
+        migrations.AlterField(
+            model_name='inboxentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='conversation_type',
+            field=models.CharField(choices=[('private', 'Private'), ('group', 'Group'), ('channel', 'Channel')], default='private', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='groups.group'),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='channel',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='channel.channel'),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='peer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='alias',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='last_message',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='message_type',
+            field=models.CharField(default='text', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='inboxentry',
+            name='last_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['user', '-last_message_at', '-id'], name='chat_inboxe_user_id_fa608c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['user', 'peer'], name='chat_inboxe_user_id_d3006b_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxentry',
+            constraint=models.UniqueConstraint(fields=('room', 'user'), name='unique_inbox_entry_per_room_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxentry',
+            constraint=models.UniqueConstraint(fields=('group', 'user'), name='unique_inbox_entry_per_group_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxentry',
+            constraint=models.UniqueConstraint(fields=('channel', 'user'), name='unique_inbox_entry_per_channel_user'),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-17 00:18
+
+import hashlib
+import mimetypes
+
+from django.db import migrations, models
+
+from chat.utils import get_file_category
+
+
+def backfill_file_metadata(apps, schema_editor):
+    FileUpload = apps.get_model('chat', 'FileUpload')
+
+    for upload in FileUpload.objects.exclude(file='').exclude(file__isnull=True).iterator():
+        name = upload.original_filename or upload.file.name
+        upload.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        upload.file_category = get_file_category(name)
+
+        try:
+            hasher = hashlib.sha256()
+            with upload.file.open('rb') as f:
+                for chunk in f.chunks():
+                    hasher.update(chunk)
+            upload.file_size = upload.file.size
+            upload.checksum = hasher.hexdigest()
+        except (OSError, ValueError):
+            pass
+
+        upload.save(update_fields=['file_size', 'content_type', 'file_category', 'checksum'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0022_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='checksum',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='content_type',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='file_category',
+            field=models.CharField(db_index=True, default='file', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='file_size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_file_metadata, migrations.RunPython.noop),
+    ]
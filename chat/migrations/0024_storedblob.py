@@ -0,0 +1,66 @@
+# Generated by Django 4.2 on 2026-10-17 00:21
+
+from django.db import migrations, models, transaction
+from django.db.models import Count, Max, Min
+import django.db.models.deletion
+
+
+def _delete_files(storage, names):
+    for name in names:
+        storage.delete(name)
+
+
+def backfill_blobs(apps, schema_editor):
+    """
+    Existing files keep their paths: the first upload of each checksum becomes
+    the blob and every duplicate is repointed at it. The duplicate files are
+    removed from storage only once the migration has committed.
+    """
+    FileUpload = apps.get_model('chat', 'FileUpload')
+    StoredBlob = apps.get_model('chat', 'StoredBlob')
+
+    groups = FileUpload.objects.exclude(checksum='').values('checksum').annotate(
+        first_id=Min('id'), refs=Count('id'), size=Max('file_size')
+    )
+    for group in groups.iterator():
+        keeper = FileUpload.objects.get(id=group['first_id'])
+        blob = StoredBlob.objects.create(
+            checksum=group['checksum'], file=keeper.file.name,
+            size=group['size'], ref_count=group['refs']
+        )
+        uploads = FileUpload.objects.filter(checksum=group['checksum'])
+        duplicates = set(uploads.exclude(file=keeper.file.name).values_list('file', flat=True))
+        uploads.update(blob=blob, file=keeper.file.name)
+        duplicates -= {'', None}
+        if duplicates:
+            transaction.on_commit(
+                lambda storage=keeper.file.storage, names=duplicates: _delete_files(storage, names),
+                using=schema_editor.connection.alias
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0023_fileupload_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checksum', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='uploads', to='chat.storedblob'),
+        ),
+        migrations.RunPython(backfill_blobs, migrations.RunPython.noop),
+    ]
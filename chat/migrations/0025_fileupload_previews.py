@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-17 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0024_storedblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileupload',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='placeholder',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='poster',
+            field=models.FileField(blank=True, default='', max_length=255, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='thumbnail',
+            field=models.FileField(blank=True, default='', max_length=255, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='fileupload',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
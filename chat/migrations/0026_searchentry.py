@@ -0,0 +1,107 @@
+# Generated by Django 4.2 on 2026-10-17 00:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Django does not manage the full-text index. On SQLite any later migration
+# that rebuilds chat_searchentry drops the FTS triggers and has to recreate them.
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE chat_searchentry_fts USING fts5("
+    "body, content='chat_searchentry', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER chat_searchentry_ai AFTER INSERT ON chat_searchentry BEGIN "
+    "INSERT INTO chat_searchentry_fts(rowid, body) VALUES (new.id, new.body); END",
+    "CREATE TRIGGER chat_searchentry_ad AFTER DELETE ON chat_searchentry BEGIN "
+    "INSERT INTO chat_searchentry_fts(chat_searchentry_fts, rowid, body) VALUES ('delete', old.id, old.body); END",
+    "CREATE TRIGGER chat_searchentry_au AFTER UPDATE OF body ON chat_searchentry BEGIN "
+    "INSERT INTO chat_searchentry_fts(chat_searchentry_fts, rowid, body) VALUES ('delete', old.id, old.body); "
+    "INSERT INTO chat_searchentry_fts(rowid, body) VALUES (new.id, new.body); END",
+]
+
+POSTGRES_INDEX = [
+    "ALTER TABLE chat_searchentry ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED",
+    "CREATE INDEX chat_searchentry_vector_gin ON chat_searchentry USING gin (search_vector)",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRES_INDEX}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS chat_searchentry_{trigger}")
+        schema_editor.execute("DROP TABLE IF EXISTS chat_searchentry_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS chat_searchentry_vector_gin")
+        schema_editor.execute("ALTER TABLE chat_searchentry DROP COLUMN IF EXISTS search_vector")
+
+
+def backfill_search_entries(apps, schema_editor):
+    SearchEntry = apps.get_model('chat', 'SearchEntry')
+    sources = [
+        ('private', apps.get_model('chat', 'Message'), 'room_id', 'sender_id', 'text', 'timestamp'),
+        ('group', apps.get_model('groups', 'GroupMessage'), 'group_id', 'sender_id', 'content', 'created_at'),
+        ('channel', apps.get_model('channel', 'ChannelMessage'), 'channel_id', 'user_id', 'content', 'created_at'),
+    ]
+
+    for conversation_type, model, conversation, sender, body, created_at in sources:
+        rows = model.objects.exclude(**{f'{body}__isnull': True}).exclude(**{body: ''}).exclude(
+            **{f'{created_at}__isnull': True}
+        ).values_list('id', conversation, sender, body, created_at)
+
+        batch = []
+        for message_id, conversation_id, sender_id, text, sent_at in rows.iterator(chunk_size=2000):
+            batch.append(SearchEntry(
+                conversation_type=conversation_type, message_id=message_id,
+                sender_id=sender_id, body=text, created_at=sent_at,
+                **{conversation: conversation_id}
+            ))
+            if len(batch) >= 2000:
+                SearchEntry.objects.bulk_create(batch)
+                batch = []
+        SearchEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('channel', '0009_alter_channel_options_alter_channelmessage_options_and_more'),
+        ('groups', '0010_alter_groupmessage_created_at'),
+        ('chat', '0025_fileupload_previews'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_type', models.CharField(choices=[('private', 'Private'), ('group', 'Group'), ('channel', 'Channel')], max_length=10)),
+                ('message_id', models.PositiveBigIntegerField()),
+                ('body', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('channel', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='channel.channel')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='groups.group')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chat.room')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchentry',
+            index=models.Index(fields=['-created_at', '-id'], name='chat_search_created_46066a_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('conversation_type', 'message_id'), name='unique_search_entry_per_message'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(backfill_search_entries, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,14 @@
-from django.db import models
+import uuid
+import hashlib
+import mimetypes
+
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
 from accounts.models import CustomUser
+from chat.utils import get_file_category
 
 
 
@@ -35,6 +42,7 @@ class Message(models.Model):
             models.Index(fields=['sender', 'recipient']),
             models.Index(fields=['timestamp']),
             models.Index(fields=['is_read']),
+            models.Index(fields=['room', 'timestamp', 'id']),
         ]
         ordering = ['-timestamp']
 
@@ -43,6 +51,73 @@ class Message(models.Model):
 
 
 
+CONVERSATION_TYPES = (
+    ('private', 'Private'),
+    ('group', 'Group'),
+    ('channel', 'Channel'),
+)
+
+
+class InboxEntry(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='inbox_entries')
+    conversation_type = models.CharField(max_length=10, choices=CONVERSATION_TYPES, default='private')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='inbox_entries', null=True, blank=True)
+    group = models.ForeignKey('groups.Group', on_delete=models.CASCADE, related_name='inbox_entries', null=True, blank=True)
+    channel = models.ForeignKey('channel.Channel', on_delete=models.CASCADE, related_name='inbox_entries', null=True, blank=True)
+    peer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    alias = models.CharField(max_length=50, null=True, blank=True)
+    last_message = models.CharField(max_length=255, blank=True, default='')
+    message_type = models.CharField(max_length=10, default='text')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_sender = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'user'], name='unique_inbox_entry_per_room_user'),
+            models.UniqueConstraint(fields=['group', 'user'], name='unique_inbox_entry_per_group_user'),
+            models.UniqueConstraint(fields=['channel', 'user'], name='unique_inbox_entry_per_channel_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id']),
+            models.Index(fields=['user', 'peer']),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.conversation_type}: {self.unread_count} unread'
+
+
+
+class SearchEntry(models.Model):
+    """
+    One row per indexed message of any conversation type. The full-text index
+    itself is created by migration: a tsvector column with a GIN index on
+    PostgreSQL, an FTS5 table kept in sync by triggers on SQLite.
+    """
+    conversation_type = models.CharField(max_length=10, choices=CONVERSATION_TYPES)
+    message_id = models.PositiveBigIntegerField()
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    group = models.ForeignKey('groups.Group', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    channel = models.ForeignKey('channel.Channel', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    body = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation_type', 'message_id'], name='unique_search_entry_per_message'),
+        ]
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+        ]
+
+    def __str__(self):
+        return f'{self.conversation_type} message {self.message_id}'
+
+
+
 class Notification(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications')
     message = models.ForeignKey(Message, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
@@ -63,6 +138,18 @@ class Notification(models.Model):
     
 
 
+class StoredBlob(models.Model):
+    checksum = models.CharField(max_length=64, unique=True)
+    file = models.FileField(max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.file.name} ({self.ref_count} refs)'
+
+
+
 class FileUpload(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='uploaded_files')
     room = models.ForeignKey('chat.Room', on_delete=models.CASCADE, related_name='files', null=True, blank=True)
@@ -71,11 +158,68 @@ class FileUpload(models.Model):
     channel = models.ForeignKey('channel.Channel', on_delete=models.CASCADE, related_name='channel_uploaded_files', null=True, blank=True)
     file = models.FileField(upload_to='chat_files/%Y/%m/%d/', null=True)
     original_filename = models.CharField(max_length=255, null=True)  
+    file_size = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    file_category = models.CharField(max_length=20, default='file', db_index=True)
+    checksum = models.CharField(max_length=64, blank=True, default='')
+    blob = models.ForeignKey(StoredBlob, on_delete=models.PROTECT, related_name='uploads', null=True, blank=True)
+    thumbnail = models.FileField(max_length=255, blank=True, default='')
+    poster = models.FileField(max_length=255, blank=True, default='')
+    placeholder = models.CharField(max_length=64, blank=True, default='')
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
     def __str__(self):
         return f'File uploaded by {self.user.username if self.user else "Unknown"}'
+
+    def save(self, *args, **kwargs):
+        # Metadata is captured while the content is still in hand, so listings
+        # never have to stat or re-read the stored file.
+        if self.file and not self.file._committed:
+            self.store_content(self.file.file)
+        elif self.file and self._state.adding and not self.blob_id:
+            # FieldFile.save() wrote the file before the row exists; move it
+            # into blob storage so it is deduplicated like any other upload.
+            written = self.file.name
+            try:
+                with self.file.open('rb') as content:
+                    self.store_content(content)
+            except OSError:
+                pass
+            else:
+                if written != self.file.name:
+                    self.file.storage.delete(written)
+        super().save(*args, **kwargs)
+
+    def store_content(self, content, checksum=None):
+        """
+        Points the upload at the shared blob for `content`, writing it only if
+        no blob with the same hash exists yet.
+        """
+        from chat.blobs import acquire_blob
+
+        self.set_file_metadata(content, checksum=checksum)
+        self.blob = acquire_blob(content, self.checksum, self.original_filename or content.name)
+        self.file = self.blob.file.name
+
+    def set_file_metadata(self, content, checksum=None):
+        name = self.original_filename or content.name or ''
+        self.file_size = content.size
+        self.content_type = (
+            getattr(content, 'content_type', None)
+            or mimetypes.guess_type(name)[0]
+            or 'application/octet-stream'
+        )[:100]
+        self.file_category = get_file_category(name)
+
+        if checksum is None:
+            hasher = hashlib.sha256()
+            for chunk in content.chunks():
+                hasher.update(chunk)
+            checksum = hasher.hexdigest()
+        self.checksum = checksum
     
     def get_absolute_url(self):
         from django.urls import reverse
@@ -87,6 +231,10 @@ class FileUpload(models.Model):
             from django.conf import settings
             return f"{settings.BASE_URL}{self.file.url}"
         return None
+
+    def preview_payload(self):
+        from chat.previews import preview_payload
+        return preview_payload(self.thumbnail.name, self.poster.name, self.placeholder, self.width, self.height)
     
     class Meta:
         db_table = 'file_uploads'
@@ -96,4 +244,58 @@ class FileUpload(models.Model):
             models.Index(fields=['room', 'uploaded_at']),
             models.Index(fields=['group', 'uploaded_at']),
             models.Index(fields=['channel', 'uploaded_at']),
-        ]
\ No newline at end of file
+        ]
+
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='upload_sessions')
+    conversation_type = models.CharField(max_length=10, choices=CONVERSATION_TYPES, default='private')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='upload_sessions', null=True, blank=True)
+    group = models.ForeignKey('groups.Group', on_delete=models.CASCADE, related_name='upload_sessions', null=True, blank=True)
+    channel = models.ForeignKey('channel.Channel', on_delete=models.CASCADE, related_name='upload_sessions', null=True, blank=True)
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    total_size = models.BigIntegerField()
+    received_size = models.BigIntegerField(default=0)
+    checksum = models.CharField(max_length=64, blank=True, default='')
+    file_upload = models.ForeignKey(FileUpload, on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    is_complete = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Upload {self.file_name} by {self.user}: {self.received_size}/{self.total_size}'
+
+
+
+@receiver(post_delete, sender=FileUpload)
+def release_file_upload(sender, instance, **kwargs):
+    from chat.blobs import release_blob
+
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    elif instance.file:
+        name, storage = instance.file.name, instance.file.storage
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_save, sender=FileUpload)
+def render_file_preview(sender, instance, created, **kwargs):
+    from chat.previews import PREVIEW_CATEGORIES, schedule_preview
+
+    if created and instance.file_category in PREVIEW_CATEGORIES and instance.checksum:
+        transaction.on_commit(lambda: schedule_preview(instance))
+
+
+@receiver(post_save, sender=Message)
+def index_private_message(sender, instance, created, update_fields, **kwargs):
+    from chat.search import index_message
+    index_message('private', instance, created, update_fields)
+
+
+@receiver(post_delete, sender=Message)
+def unindex_private_message(sender, instance, **kwargs):
+    from chat.search import unindex_message
+    unindex_message('private', instance.id)
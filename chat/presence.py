@@ -0,0 +1,220 @@
+import time
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.db.models import Case, When, Value, DateTimeField
+from django.utils import timezone
+
+from channels.db import database_sync_to_async
+
+from accounts.models import CustomUser, Contact
+from chat.models import Room, InboxEntry
+
+logger = logging.getLogger(__name__)
+
+# Presence updates for a user go to presence_<id>; only connections that
+# care about that user join it, instead of every socket joining "status".
+PRESENCE_BATCH_DELAY = 0.5
+MAX_PRESENCE_SUBSCRIPTIONS = 2000
+
+
+def presence_group(user_id):
+    return f'presence_{user_id}'
+
+
+def get_default_interests(user_id):
+    """Contacts and private chat peers: whose presence the contact list shows."""
+    contacts = Contact.objects.filter(owner_id=user_id).values_list('contact_user_id', flat=True)
+    peers = InboxEntry.objects.filter(
+        user_id=user_id, conversation_type='private'
+    ).values_list('peer_id', flat=True)
+    return (set(contacts) | set(peers)) - {None, user_id}
+
+
+def get_room_interests(user_id, room_id):
+    room = Room.objects.filter(id=room_id).values('user1_id', 'user2_id').first()
+    if not room or user_id not in room.values():
+        return set()
+    return set(room.values()) - {user_id}
+
+
+def get_group_interests(user_id, group_id, limit=MAX_PRESENCE_SUBSCRIPTIONS):
+    from groups.models import GroupMember
+
+    if not GroupMember.objects.filter(group_id=group_id, user_id=user_id).exists():
+        return set()
+    members = GroupMember.objects.filter(group_id=group_id).exclude(
+        user_id=user_id
+    ).values_list('user_id', flat=True)[:limit]
+    return set(members)
+
+
+
+class LocalPresenceRegistry:
+    """
+    In-process stand-in for RedisPresenceRegistry with the same semantics.
+    Only correct while a single worker serves every socket.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connections = {}
+
+    def _live(self, user_id, now):
+        entries = self.connections.get(user_id, {})
+        for connection_id, expires in list(entries.items()):
+            if expires <= now:
+                del entries[connection_id]
+        if not entries:
+            self.connections.pop(user_id, None)
+        return entries
+
+    async def add_connection(self, user_id, connection_id):
+        now = time.time()
+        with self.lock:
+            entries = self._live(user_id, now)
+            entries[connection_id] = now + self.ttl
+            self.connections[user_id] = entries
+            return len(entries)
+
+    async def heartbeat(self, user_id, connection_id):
+        await self.add_connection(user_id, connection_id)
+
+    async def remove_connection(self, user_id, connection_id):
+        with self.lock:
+            entries = self._live(user_id, time.time())
+            entries.pop(connection_id, None)
+            if not entries:
+                self.connections.pop(user_id, None)
+            return len(entries)
+
+    async def online_among(self, user_ids):
+        now = time.time()
+        with self.lock:
+            return {user_id for user_id in user_ids if self._live(user_id, now)}
+
+
+class RedisPresenceRegistry:
+    """
+    Keeps one sorted set per user whose members are connection ids scored by
+    their expiry time. Every change runs in a MULTI block, so the returned
+    count is exact across workers, and connections of a crashed worker drop
+    out once their heartbeat lapses.
+    """
+
+    def __init__(self, url, ttl):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+
+    def _key(self, user_id):
+        return f'presence:user:{user_id}'
+
+    async def _update(self, user_id, connection_id, add):
+        key, now = self._key(user_id), time.time()
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(key, '-inf', now)
+            if add:
+                pipe.zadd(key, {connection_id: now + self.ttl})
+            else:
+                pipe.zrem(key, connection_id)
+            pipe.zcard(key)
+            pipe.expire(key, self.ttl)
+            result = await pipe.execute()
+        return result[-2]
+
+    async def add_connection(self, user_id, connection_id):
+        return await self._update(user_id, connection_id, add=True)
+
+    async def heartbeat(self, user_id, connection_id):
+        await self._update(user_id, connection_id, add=True)
+
+    async def remove_connection(self, user_id, connection_id):
+        return await self._update(user_id, connection_id, add=False)
+
+    async def online_among(self, user_ids):
+        user_ids, now = list(user_ids), time.time()
+        if not user_ids:
+            return set()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(self._key(user_id), now, '+inf')
+            counts = await pipe.execute()
+        return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+
+_registry = None
+
+
+def get_presence_registry():
+    global _registry
+    if _registry is None:
+        if settings.PRESENCE_REDIS_URL:
+            _registry = RedisPresenceRegistry(settings.PRESENCE_REDIS_URL, settings.PRESENCE_TTL)
+        else:
+            _registry = LocalPresenceRegistry(settings.PRESENCE_TTL)
+    return _registry
+
+
+def write_presence(changes):
+    """
+    Persists {user_id: (is_online, changed_at)} with at most two UPDATEs:
+    one for users that came online and one for users that went offline.
+    """
+    online = [user_id for user_id, (is_online, _) in changes.items() if is_online]
+    offline = {user_id: changed_at for user_id, (is_online, changed_at) in changes.items() if not is_online}
+
+    if online:
+        CustomUser.objects.filter(id__in=online).update(is_online=True)
+    if offline:
+        CustomUser.objects.filter(id__in=offline).update(
+            is_online=False,
+            last_seen=Case(
+                *[When(id=user_id, then=Value(seen)) for user_id, seen in offline.items()],
+                output_field=DateTimeField()
+            )
+        )
+
+
+class PresenceWriter:
+    """
+    Buffers presence transitions and flushes them every interval, so a user
+    who reconnects several times between flushes costs one row write and
+    last_seen is written at most once per interval.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}
+        self.task = None
+
+    def record(self, user_id, is_online):
+        self.pending[user_id] = (is_online, timezone.now())
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        while self.pending:
+            await asyncio.sleep(self.interval)
+            changes, self.pending = self.pending, {}
+            try:
+                await database_sync_to_async(write_presence)(changes)
+            except Exception as e:
+                logger.error(f"Error writing presence: {e}")
+                for user_id, change in changes.items():
+                    self.pending.setdefault(user_id, change)
+        self.task = None
+
+
+_writer = None
+
+
+def get_presence_writer():
+    global _writer
+    if _writer is None:
+        _writer = PresenceWriter(settings.PRESENCE_FLUSH_INTERVAL)
+    return _writer
@@ -0,0 +1,116 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+
+from chat.blobs import preview_name
+from chat.imaging import render_preview
+
+logger = logging.getLogger(__name__)
+
+
+PREVIEW_CATEGORIES = ('image', 'video')
+
+_executor = None
+
+
+def preview_payload(thumbnail, poster, placeholder, width, height):
+    from chat.models import FileUpload
+
+    storage = FileUpload._meta.get_field('thumbnail').storage
+    return {
+        'thumbnail_url': f"{settings.BASE_URL}{storage.url(thumbnail)}" if thumbnail else None,
+        'poster_url': f"{settings.BASE_URL}{storage.url(poster)}" if poster else None,
+        'placeholder': placeholder or None,
+        'width': width,
+        'height': height,
+    }
+
+
+def store_preview(checksum, result):
+    """Saves rendered previews and attaches them to every upload of the same content."""
+    from chat.models import FileUpload
+
+    if not result:
+        return 0
+
+    storage = FileUpload._meta.get_field('thumbnail').storage
+    names = {}
+    for kind, field in (('thumb', 'thumbnail'), ('poster', 'poster')):
+        if result[field]:
+            name = preview_name(checksum, kind)
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(result[field]))
+            names[field] = name
+
+    updated = FileUpload.objects.filter(checksum=checksum).update(
+        thumbnail=names.get('thumbnail', ''),
+        poster=names.get('poster', ''),
+        placeholder=result['placeholder'],
+        width=result['width'],
+        height=result['height'],
+    )
+    if not updated:
+        # Every upload was deleted while rendering.
+        for name in names.values():
+            storage.delete(name)
+        return updated
+
+    from channel.feed import invalidate_feed
+    invalidate_feed(FileUpload.objects.filter(checksum=checksum, channel__isnull=False).values('channel_id'))
+    return updated
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.CHAT_PREVIEW_WORKERS)
+    return _executor
+
+
+def _on_rendered(checksum, future):
+    # Runs on the pool's management thread, which owns its own connection.
+    try:
+        store_preview(checksum, future.result())
+    except Exception:
+        logger.exception(f"Could not store preview for {checksum}")
+    finally:
+        close_old_connections()
+
+
+def _copy_existing(file_upload):
+    from chat.models import FileUpload
+
+    source = FileUpload.objects.filter(checksum=file_upload.checksum).exclude(
+        id=file_upload.id
+    ).exclude(thumbnail='').values('thumbnail', 'poster', 'placeholder', 'width', 'height').first()
+    if not source:
+        return False
+
+    FileUpload.objects.filter(id=file_upload.id).update(**source)
+    for field, value in source.items():
+        setattr(file_upload, field, value)
+    return True
+
+
+def schedule_preview(file_upload):
+    """
+    Queues thumbnail rendering for an image or video upload. Decoding runs in
+    worker processes, so neither the event loop nor the thread that runs
+    database calls for the consumers is blocked by it.
+    """
+    if _copy_existing(file_upload):
+        return
+
+    args = (
+        file_upload.file.path, file_upload.file_category,
+        settings.CHAT_THUMBNAIL_SIZE, settings.CHAT_POSTER_SIZE
+    )
+    if not settings.CHAT_PREVIEW_WORKERS:
+        store_preview(file_upload.checksum, render_preview(*args))
+        return
+
+    future = _get_executor().submit(render_preview, *args)
+    future.add_done_callback(lambda f: _on_rendered(file_upload.checksum, f))
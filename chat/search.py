@@ -0,0 +1,153 @@
+import html
+
+from django.db import connection
+from django.db.models import Q, BooleanField, TextField
+from django.db.models.expressions import RawSQL
+
+from chat.models import Room, SearchEntry
+from chat.services import CONVERSATION_FIELDS
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+FTS_TABLE = 'chat_searchentry_fts'
+
+# Highlight markers are control characters so the snippet can be escaped
+# before they become <mark> tags.
+_MARK_START, _MARK_END = '\x02', '\x03'
+_HEADLINE_OPTIONS = f'StartSel={_MARK_START}, StopSel={_MARK_END}, MaxWords=24, MinWords=8, MaxFragments=2'
+
+_BODY_FIELDS = {'private': 'text', 'group': 'content', 'channel': 'content'}
+
+
+def _entry_fields(conversation_type, message):
+    if conversation_type == 'private':
+        return {
+            'room_id': message.room_id,
+            'sender_id': message.sender_id,
+            'body': message.text,
+            'created_at': message.timestamp,
+        }
+    if conversation_type == 'group':
+        return {
+            'group_id': message.group_id,
+            'sender_id': message.sender_id,
+            'body': message.content,
+            'created_at': message.created_at,
+        }
+    return {
+        'channel_id': message.channel_id,
+        'sender_id': message.user_id,
+        'body': message.content,
+        'created_at': message.created_at,
+    }
+
+
+def index_message(conversation_type, message, created=False, update_fields=None):
+    """Adds or refreshes the search entry of one message; saves that do not touch the text are ignored."""
+    if update_fields is not None and _BODY_FIELDS[conversation_type] not in update_fields:
+        return
+
+    fields = _entry_fields(conversation_type, message)
+    if not (fields['body'] or '').strip():
+        unindex_message(conversation_type, message.id)
+        return
+
+    if created or not SearchEntry.objects.filter(
+        conversation_type=conversation_type, message_id=message.id
+    ).update(**fields):
+        SearchEntry.objects.create(conversation_type=conversation_type, message_id=message.id, **fields)
+
+
+def unindex_message(conversation_type, message_id):
+    SearchEntry.objects.filter(conversation_type=conversation_type, message_id=message_id).delete()
+
+
+def _visible_to(user_id):
+    from groups.models import GroupMember
+    from channel.models import Channel
+
+    rooms = Room.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id)).values('id')
+    groups = GroupMember.objects.filter(user_id=user_id).values('group_id')
+    channels = Channel.objects.filter(Q(owner_id=user_id) | Q(members=user_id)).values('id')
+    return Q(room_id__in=rooms) | Q(group_id__in=groups) | Q(channel_id__in=channels)
+
+
+def _fts5_query(text):
+    # Every word is quoted, so user input cannot form FTS5 syntax; the
+    # trailing * makes each one a prefix match.
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in text.split())
+
+
+def _match(entries, text):
+    if connection.vendor == 'postgresql':
+        query = "websearch_to_tsquery('simple', %s)"
+        return entries.filter(
+            RawSQL(f"chat_searchentry.search_vector @@ {query}", [text], output_field=BooleanField())
+        ).annotate(
+            snippet=RawSQL(
+                f"ts_headline('simple', chat_searchentry.body, {query}, %s)",
+                [text, _HEADLINE_OPTIONS], output_field=TextField()
+            )
+        )
+
+    query = _fts5_query(text)
+    return entries.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [query])
+    ).annotate(
+        snippet=RawSQL(
+            f"SELECT snippet({FTS_TABLE}, 0, %s, %s, '…', 24) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = chat_searchentry.id",
+            [_MARK_START, _MARK_END, query], output_field=TextField()
+        )
+    )
+
+
+def search_messages(user_id, text, conversation_type=None, conversation_id=None, before=None, limit=SEARCH_PAGE_SIZE):
+    """
+    One page of messages matching `text` in conversations the user belongs
+    to, newest first. `before` is the (created_at, id) of the last entry of
+    the previous page. Returns (entries, has_more).
+    """
+    text = (text or '').strip()
+    if not text:
+        raise ValueError("q is required")
+    limit = max(1, min(int(limit), SEARCH_MAX_PAGE_SIZE))
+
+    entries = SearchEntry.objects.filter(_visible_to(user_id)).select_related('sender')
+
+    if conversation_type:
+        if conversation_type not in CONVERSATION_FIELDS:
+            raise ValueError(f"Invalid type: {conversation_type}")
+        entries = entries.filter(conversation_type=conversation_type)
+        if conversation_id:
+            entries = entries.filter(**{CONVERSATION_FIELDS[conversation_type]: conversation_id})
+
+    if before:
+        before_at, before_id = before
+        entries = entries.filter(
+            Q(created_at__lt=before_at) |
+            Q(created_at=before_at, id__lt=before_id)
+        )
+
+    entries = list(_match(entries, text).order_by('-created_at', '-id')[:limit + 1])
+    return entries[:limit], len(entries) > limit
+
+
+def render_snippet(snippet):
+    return html.escape(snippet or '').replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def serialize_search_entry(entry):
+    return {
+        'type': entry.conversation_type,
+        'conversation_id': entry.room_id or entry.group_id or entry.channel_id,
+        'message_id': entry.message_id,
+        'sender': {
+            'id': entry.sender_id,
+            'fullname': entry.sender.fullname,
+        },
+        'snippet': render_snippet(entry.snippet),
+        'created_at': entry.created_at.isoformat(),
+    }
@@ -0,0 +1,323 @@
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import F, Q, Max, Sum, Value, Case, When
+from django.db.models.functions import Coalesce, Greatest
+
+from accounts.models import Contact
+from chat.models import Room, Message, FileUpload, InboxEntry
+
+
+PREVIEW_LENGTH = 255
+INBOX_PAGE_SIZE = 50
+INBOX_MAX_PAGE_SIZE = 200
+
+CONVERSATION_FIELDS = {
+    'private': 'room_id',
+    'group': 'group_id',
+    'channel': 'channel_id',
+}
+
+
+def _preview(text):
+    return (text or '')[:PREVIEW_LENGTH]
+
+
+def _entries(conversation_type, conversation_id):
+    return InboxEntry.objects.filter(**{CONVERSATION_FIELDS[conversation_type]: conversation_id})
+
+
+def ensure_room_entries(room):
+    """Creates the two inbox entries of a P2P room if they are missing."""
+    aliases = dict(
+        Contact.objects.filter(
+            Q(owner_id=room.user1_id, contact_user_id=room.user2_id) |
+            Q(owner_id=room.user2_id, contact_user_id=room.user1_id)
+        ).values_list('owner_id', 'alias')
+    )
+
+    InboxEntry.objects.bulk_create(
+        [
+            InboxEntry(
+                user_id=user_id, peer_id=peer_id, room_id=room.id,
+                conversation_type='private', alias=aliases.get(user_id)
+            )
+            for user_id, peer_id in ((room.user1_id, room.user2_id), (room.user2_id, room.user1_id))
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def _apply_unread_delta(room_id, user_id, delta, read_at=None):
+    states = InboxEntry.objects.filter(room_id=room_id, user_id=user_id)
+
+    changes = {'unread_count': F('unread_count') + delta}
+    if delta < 0:
+        changes['unread_count'] = Greatest(F('unread_count') + delta, Value(0))
+    if read_at is not None:
+        changes['last_read_at'] = Greatest(Coalesce('last_read_at', Value(read_at)), Value(read_at))
+
+    if not states.update(**changes):
+        room = Room.objects.filter(id=room_id).first()
+        if room:
+            ensure_room_entries(room)
+            states.update(**changes)
+
+    return states.values_list('unread_count', flat=True).first() or 0
+
+
+def increment_unread(room_id, user_id, by=1):
+    return _apply_unread_delta(room_id, user_id, by)
+
+
+def decrement_unread(room_id, user_id, by=1):
+    return _apply_unread_delta(room_id, user_id, -by)
+
+
+def mark_read(room_id, user_id, by=1, read_at=None):
+    return _apply_unread_delta(room_id, user_id, -by, read_at=read_at)
+
+
+def get_unread_count(room_id, user_id):
+    return InboxEntry.objects.filter(
+        room_id=room_id, user_id=user_id
+    ).values_list('unread_count', flat=True).first() or 0
+
+
+def get_total_unread(user_id):
+    return InboxEntry.objects.filter(user_id=user_id, conversation_type='private').aggregate(
+        total=Sum('unread_count')
+    )['total'] or 0
+
+
+def recount_unread(room_id, user_id):
+    """Rebuilds the counter from the message tables; not for the hot path."""
+    count = (
+        Message.objects.filter(room_id=room_id, recipient_id=user_id, is_read=False).count()
+        + FileUpload.objects.filter(room_id=room_id, recipient_id=user_id, is_read=False).count()
+    )
+    updated = InboxEntry.objects.filter(room_id=room_id, user_id=user_id).update(unread_count=count)
+    if not updated:
+        room = Room.objects.filter(id=room_id).first()
+        if room:
+            ensure_room_entries(room)
+            InboxEntry.objects.filter(room_id=room_id, user_id=user_id).update(unread_count=count)
+    return count
+
+
+def mark_read_until(room_id, user_id, until):
+    """
+    Marks every message and file addressed to the user in the room up to
+    `until` as read with one UPDATE per table. Returns (marked, unread).
+    """
+    until = min(until, timezone.now())
+
+    with transaction.atomic():
+        marked = Message.objects.filter(
+            room_id=room_id, recipient_id=user_id, is_read=False, timestamp__lte=until
+        ).update(is_read=True)
+
+        marked += FileUpload.objects.filter(
+            room_id=room_id, recipient_id=user_id, is_read=False, uploaded_at__lte=until
+        ).update(is_read=True)
+
+        unread = mark_read(room_id, user_id, by=marked, read_at=until)
+
+    return marked, unread
+
+
+def record_message(conversation_type, conversation_id, sender_id, text, message_type, sent_at):
+    """
+    Moves a conversation to the top of every participant's inbox with one
+    UPDATE: the preview is replaced for everyone and the unread counter is
+    bumped for everyone except the sender. Returns the number of entries.
+    """
+    return _entries(conversation_type, conversation_id).update(
+        last_message=_preview(text),
+        message_type=message_type,
+        last_message_at=sent_at,
+        last_sender_id=sender_id,
+        unread_count=Case(
+            When(user_id=sender_id, then=F('unread_count')),
+            default=F('unread_count') + 1,
+        ),
+    )
+
+
+def record_private_message(room, sender_id, text, message_type, sent_at):
+    """Records a P2P send and returns the recipient's new unread count."""
+    if record_message('private', room.id, sender_id, text, message_type, sent_at) < 2:
+        ensure_room_entries(room)
+        record_message('private', room.id, sender_id, text, message_type, sent_at)
+
+    recipient_id = room.user2_id if room.user1_id == sender_id else room.user1_id
+    return get_unread_count(room.id, recipient_id)
+
+
+def _latest_room_item(room_id):
+    message = Message.objects.filter(room_id=room_id).order_by('-timestamp', '-id').first()
+    upload = FileUpload.objects.filter(room_id=room_id).order_by('-uploaded_at', '-id').first()
+
+    if upload and (not message or upload.uploaded_at > message.timestamp):
+        name = upload.original_filename or upload.file.name.split('/')[-1]
+        return name, 'file', upload.uploaded_at, upload.user_id
+    if message:
+        return message.text, 'text', message.timestamp, message.sender_id
+    return '', 'text', None, None
+
+
+def _latest_feed_item(queryset, sender_field):
+    message = queryset.select_related('file').order_by('-created_at', '-id').first()
+    if not message:
+        return None
+    if message.file_id:
+        name = message.file.original_filename or message.file.file.name.split('/')[-1]
+        return name, 'file', message.created_at, getattr(message, sender_field)
+    return message.content, message.message_type or 'text', message.created_at, getattr(message, sender_field)
+
+
+def _latest_item(conversation_type, conversation_id):
+    if conversation_type == 'private':
+        return _latest_room_item(conversation_id)
+
+    if conversation_type == 'group':
+        from groups.models import Group, GroupMessage
+        latest = _latest_feed_item(GroupMessage.objects.filter(group_id=conversation_id), 'sender_id')
+        created_at = Group.objects.filter(id=conversation_id).values_list('created_at', flat=True).first()
+    else:
+        from channel.models import Channel, ChannelMessage
+        latest = _latest_feed_item(ChannelMessage.objects.filter(channel_id=conversation_id), 'user_id')
+        created_at = Channel.objects.filter(id=conversation_id).values_list('created_at', flat=True).first()
+
+    # Groups and channels without messages still sort by their creation time.
+    return latest or ('', 'text', created_at, None)
+
+
+def refresh_preview(conversation_type, conversation_id):
+    """Recomputes the preview after the latest message was edited or deleted."""
+    text, message_type, sent_at, sender_id = _latest_item(conversation_type, conversation_id)
+    _entries(conversation_type, conversation_id).update(
+        last_message=_preview(text),
+        message_type=message_type,
+        last_message_at=sent_at,
+        last_sender_id=sender_id,
+    )
+
+
+def decrement_unread_for(conversation_type, conversation_id, exclude_user_ids, by=1):
+    """Decrements the unread counter of every participant not in `exclude_user_ids`."""
+    return _entries(conversation_type, conversation_id).exclude(
+        user_id__in=exclude_user_ids
+    ).update(unread_count=Greatest(F('unread_count') - by, Value(0)))
+
+
+def mark_conversation_read(conversation_type, conversation_id, user_id, by=None):
+    """Decrements the user's counter by `by`, or resets it when `by` is None."""
+    unread_count = Value(0) if by is None else Greatest(F('unread_count') - by, Value(0))
+    entries = _entries(conversation_type, conversation_id).filter(user_id=user_id)
+    entries.update(unread_count=unread_count, last_read_at=timezone.now())
+    return entries.values_list('unread_count', flat=True).first() or 0
+
+
+def set_conversation_unread(conversation_type, conversation_id, user_id, unread_count):
+    """Stores a recounted unread counter, e.g. after the user's read watermark moved."""
+    _entries(conversation_type, conversation_id).filter(user_id=user_id).update(
+        unread_count=unread_count, last_read_at=timezone.now()
+    )
+    return unread_count
+
+
+def add_inbox_entries(conversation_type, conversation_id, user_ids):
+    text, message_type, sent_at, sender_id = _latest_item(conversation_type, conversation_id)
+    field = CONVERSATION_FIELDS[conversation_type]
+
+    InboxEntry.objects.bulk_create(
+        [
+            InboxEntry(
+                user_id=user_id, conversation_type=conversation_type,
+                last_message=_preview(text), message_type=message_type,
+                last_message_at=sent_at, last_sender_id=sender_id,
+                **{field: conversation_id}
+            )
+            for user_id in user_ids
+        ],
+        ignore_conflicts=True,
+    )
+    if conversation_type != 'private':
+        _start_watermarks(conversation_type, conversation_id, user_ids)
+
+
+def _start_watermarks(conversation_type, conversation_id, user_ids):
+    # New entries start with nothing unread, so the members' watermarks start
+    # at the latest message instead of counting the whole history.
+    if conversation_type == 'group':
+        from groups.models import GroupMember as Member, GroupMessage as Item
+    else:
+        from channel.models import ChannelMember as Member, ChannelMessage as Item
+
+    field = CONVERSATION_FIELDS[conversation_type]
+    latest_id = Item.objects.filter(**{field: conversation_id}).aggregate(latest=Max('id'))['latest']
+    if latest_id:
+        Member.objects.filter(
+            user_id__in=user_ids, last_read_message_id__lt=latest_id, **{field: conversation_id}
+        ).update(last_read_message_id=latest_id)
+
+
+def remove_inbox_entries(conversation_type, conversation_id, user_ids):
+    _entries(conversation_type, conversation_id).filter(user_id__in=user_ids).delete()
+
+
+def set_contact_alias(owner_id, contact_user_id, alias):
+    InboxEntry.objects.filter(
+        user_id=owner_id, peer_id=contact_user_id, conversation_type='private'
+    ).update(alias=alias)
+
+
+def get_inbox(user_id, conversation_type=None, before=None, limit=INBOX_PAGE_SIZE):
+    """
+    One page of the user's conversation list, most recent first, read from
+    the (user, -last_message_at, -id) index. `before` is the (timestamp, id)
+    of the last entry of the previous page.
+    """
+    limit = max(1, min(int(limit), INBOX_MAX_PAGE_SIZE))
+
+    entries = InboxEntry.objects.filter(
+        user_id=user_id, last_message_at__isnull=False
+    ).select_related('peer', 'group', 'channel', 'last_sender')
+
+    if conversation_type:
+        entries = entries.filter(conversation_type=conversation_type)
+
+    if before:
+        before_at, before_id = before
+        entries = entries.filter(
+            Q(last_message_at__lt=before_at) |
+            Q(last_message_at=before_at, id__lt=before_id)
+        )
+
+    entries = list(entries.order_by('-last_message_at', '-id')[:limit + 1])
+    return entries[:limit], len(entries) > limit
+
+
+def serialize_inbox_entry(entry):
+    if entry.conversation_type == 'private':
+        conversation_id = entry.room_id
+        title = entry.alias or entry.peer.fullname
+    elif entry.conversation_type == 'group':
+        conversation_id = entry.group_id
+        title = entry.group.name
+    else:
+        conversation_id = entry.channel_id
+        title = entry.channel.name
+
+    return {
+        'id': conversation_id,
+        'type': entry.conversation_type,
+        'title': title,
+        'peer_id': entry.peer_id,
+        'alias': entry.alias,
+        'last_message': entry.last_message,
+        'message_type': entry.message_type,
+        'last_sender_id': entry.last_sender_id,
+        'timestamp': entry.last_message_at.isoformat(),
+        'unread': entry.unread_count,
+    }
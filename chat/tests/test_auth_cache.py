@@ -0,0 +1,34 @@
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import _users, _tokens, get_cached_user
+from accounts.models import CustomUser
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        _users.clear()
+        _tokens.clear()
+        self.user = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+
+    def test_user_is_loaded_once_and_dropped_on_save(self):
+        url = reverse('inbox')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        cached = get_cached_user(self.user.id)
+        cached.fullname = 'changed locally'
+        self.assertEqual(get_cached_user(self.user.id).fullname, 'alice')
+
+        with self.assertNumQueries(2):
+            # Inbox entries and their count; no user lookup.
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        self.user.fullname = 'alice b'
+        self.user.save(update_fields=['fullname'])
+        self.assertNotIn(self.user.id, _users.entries)
+        self.assertEqual(get_cached_user(self.user.id).fullname, 'alice b')
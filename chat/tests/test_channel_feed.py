@@ -0,0 +1,52 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from accounts.models import CustomUser
+from channel.feed import get_cached_page, apply_viewer, post_event
+from channel.models import Channel, ChannelMessage
+
+
+class ChannelFeedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.reader = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        self.channel = Channel.objects.create(owner=self.owner, name='news', username='news')
+        self.post = ChannelMessage.objects.create(channel=self.channel, user=self.owner, content='hello')
+
+
+    def version(self):
+        self.channel.refresh_from_db()
+        return self.channel.feed_version
+
+
+    def test_page_is_shared_until_a_post_changes(self):
+        posts, _, _ = get_cached_page(self.channel.id, self.version())
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_page(self.channel.id, self.channel.feed_version)[0], posts)
+
+        self.post.content = 'hello, edited'
+        self.post.save(update_fields=['content'])
+        posts, _, _ = get_cached_page(self.channel.id, self.version())
+        self.assertEqual(posts[0]['content'], 'hello, edited')
+
+
+    def test_viewer_flags(self):
+        post = get_cached_page(self.channel.id, self.version())[0][0]
+
+        as_owner = apply_viewer(post, self.owner.id, self.owner.id)
+        as_reader = apply_viewer(post, self.reader.id, self.owner.id)
+        self.assertTrue(as_owner['is_own'] and as_owner['can_edit'])
+        self.assertFalse(as_reader['is_own'] or as_reader['can_delete'] or as_reader['is_read'])
+        self.assertTrue(apply_viewer(post, self.reader.id, self.owner.id, last_read_id=self.post.id)['is_read'])
+        self.assertNotIn('is_own', post)
+
+
+    def test_post_event_is_encoded_per_audience(self):
+        post = get_cached_page(self.channel.id, self.version())[0][0]
+        event = post_event('chat_message', post, self.owner.id)
+
+        self.assertEqual(json.loads(event['owner_text'])['message'], apply_viewer(post, self.owner.id, self.owner.id))
+        self.assertEqual(json.loads(event['text'])['message'], apply_viewer(post, self.reader.id, self.owner.id))
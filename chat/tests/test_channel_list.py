@@ -0,0 +1,36 @@
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from channel.models import Channel, ChannelMessage
+from chat.services import add_inbox_entries, record_message
+
+
+class ChannelListTests(APITestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.reader = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        for i in range(3):
+            channel = Channel.objects.create(owner=self.owner, name=f'news {i}', username=f'news{i}')
+            channel.members.add(self.reader)
+            add_inbox_entries('channel', channel.id, [self.owner.id, self.reader.id])
+            post = ChannelMessage.objects.create(channel=channel, user=self.owner, content=f'post {i}')
+            record_message('channel', channel.id, self.owner.id, post.content, 'text', post.created_at)
+        self.client.force_authenticate(user=self.reader)
+
+
+    def test_pages_with_a_bounded_number_of_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/channels/list/', {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['has_more'])
+
+        first = response.data['channels'][0]
+        self.assertEqual(
+            (first['name'], first['member_count'], first['is_subscribed'], first['last_message'], first['unread']),
+            ('news 2', 1, True, 'post 2', 1)
+        )
+
+        response = self.client.get('/api/v1/channels/list/', {'cursor': response.data['next_cursor']})
+        self.assertEqual([channel['name'] for channel in response.data['channels']], ['news 0'])
+        self.assertFalse(response.data['has_more'])
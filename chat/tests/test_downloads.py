@@ -0,0 +1,101 @@
+import hashlib
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from accounts.services import get_or_create_room
+from chat.models import FileUpload, StoredBlob
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHAT_FILE_OFFLOAD='')
+class DownloadFileTests(APITestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
+    def setUp(self):
+        self.user1 = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.user2 = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        room = get_or_create_room(self.user1, self.user2)
+        self.upload = FileUpload(user=self.user1, recipient=self.user2, room=room, original_filename='clip.mp4')
+        self.upload.file.save('clip.mp4', ContentFile(b'0123456789'))
+        self.url = reverse('file_download', kwargs={'file_id': self.upload.id})
+        self.client.force_authenticate(user=self.user2)
+
+
+    def test_metadata_is_stored_at_upload(self):
+        self.assertEqual(self.upload.file_size, 10)
+        self.assertEqual(self.upload.content_type, 'video/mp4')
+        self.assertEqual(self.upload.file_category, 'video')
+        self.assertEqual(self.upload.checksum, hashlib.sha256(b'0123456789').hexdigest())
+
+
+    def test_full_download_has_validators(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], f'"{self.upload.checksum}"')
+
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(cached['Last-Modified'], response['Last-Modified'])
+
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(suffix.streaming_content), b'789')
+
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, status.HTTP_200_OK)
+
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(unsatisfiable.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+
+    @override_settings(CHAT_FILE_OFFLOAD='x-accel-redirect', CHAT_FILE_OFFLOAD_PREFIX='/protected-media/')
+    def test_offload_to_proxy(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['X-Accel-Redirect'].startswith('/protected-media/chat_files/'))
+        self.assertEqual(response.content, b'')
+
+
+    def test_identical_uploads_share_one_blob(self):
+        copy = FileUpload(user=self.user2, recipient=self.user1, room=self.upload.room, original_filename='copy.mp4')
+        copy.file.save('copy.mp4', ContentFile(b'0123456789'))
+
+        self.assertEqual(copy.blob_id, self.upload.blob_id)
+        self.assertEqual(copy.file.name, self.upload.file.name)
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+
+        storage = copy.file.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.delete()
+        self.assertTrue(storage.exists(self.upload.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload.delete()
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertFalse(storage.exists(copy.file.name))
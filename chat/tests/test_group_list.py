@@ -0,0 +1,40 @@
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from chat.models import InboxEntry
+from chat.services import record_message
+from groups.models import Group, GroupMember
+
+
+class GroupListTests(APITestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.bob = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        for i in range(3):
+            group = Group.objects.create(name=f'team {i}', created_by=self.alice)
+            for user in (self.alice, self.bob):
+                GroupMember.objects.create(group=group, user=user)
+                InboxEntry.objects.create(
+                    user=user, conversation_type='group', group=group, last_message_at=group.created_at
+                )
+            record_message('group', group.id, self.alice.id, f'hello {i}', 'text', timezone.now())
+        self.client.force_authenticate(user=self.bob)
+
+
+    def test_pages_with_latest_message_and_unread_count(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/group/all/', {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['has_more'])
+
+        first = response.data['groups'][0]
+        self.assertEqual(
+            (first['name'], first['last_message'], first['last_sender']['fullname'], first['unread_count']),
+            ('team 2', 'hello 2', 'alice', 1)
+        )
+
+        response = self.client.get('/api/v1/group/all/', {'cursor': response.data['next_cursor']})
+        self.assertEqual([group['name'] for group in response.data['groups']], ['team 0'])
@@ -0,0 +1,86 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.test import TestCase
+
+from accounts.models import CustomUser, Contact
+from accounts.services import get_or_create_room
+from chat.presence import (
+    get_default_interests, get_room_interests, get_group_interests, LocalPresenceRegistry, PresenceWriter
+)
+from groups.models import Group, GroupMember
+
+
+class PresenceInterestTests(TestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.bob = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        self.carol = CustomUser.objects.create_user(fullname='carol', email='carol@example.com', password='pass123')
+        self.dave = CustomUser.objects.create_user(fullname='dave', email='dave@example.com', password='pass123')
+
+
+    def test_interests_are_limited_to_contacts_rooms_and_groups(self):
+        Contact.objects.create(owner=self.alice, contact_user=self.bob)
+        room = get_or_create_room(self.alice, self.carol)
+        group = Group.objects.create(name='team', created_by=self.alice)
+        GroupMember.objects.create(group=group, user=self.alice)
+        GroupMember.objects.create(group=group, user=self.dave)
+
+        self.assertEqual(get_default_interests(self.alice.id), {self.bob.id, self.carol.id})
+        self.assertEqual(get_room_interests(self.alice.id, room.id), {self.carol.id})
+        self.assertEqual(get_room_interests(self.bob.id, room.id), set())
+        self.assertEqual(get_group_interests(self.alice.id, group.id), {self.dave.id})
+        self.assertEqual(get_group_interests(self.bob.id, group.id), set())
+
+
+
+class LocalPresenceRegistryTests(TestCase):
+    def test_counts_connections_and_expires_missed_heartbeats(self):
+        registry = LocalPresenceRegistry(ttl=60)
+
+        with mock.patch('chat.presence.time.time', return_value=1000):
+            self.assertEqual(async_to_sync(registry.add_connection)(1, 'a'), 1)
+            self.assertEqual(async_to_sync(registry.add_connection)(1, 'b'), 2)
+            async_to_sync(registry.add_connection)(2, 'c')
+            self.assertEqual(async_to_sync(registry.remove_connection)(1, 'a'), 1)
+            self.assertEqual(async_to_sync(registry.online_among)([1, 2, 3]), {1, 2})
+
+        with mock.patch('chat.presence.time.time', return_value=1050):
+            async_to_sync(registry.heartbeat)(2, 'c')
+
+        # Connection "b" belonged to a worker that stopped sending heartbeats.
+        with mock.patch('chat.presence.time.time', return_value=1070):
+            self.assertEqual(async_to_sync(registry.online_among)([1, 2]), {2})
+            self.assertEqual(async_to_sync(registry.add_connection)(1, 'd'), 1)
+
+
+
+class PresenceWriterTests(TestCase):
+    def test_flaps_collapse_into_one_write(self):
+        user = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        writer = PresenceWriter(interval=0)
+
+        async def flap():
+            for is_online in (True, False, True, False):
+                writer.record(user.id, is_online)
+            await writer.task
+
+        with self.assertNumQueries(1):
+            async_to_sync(flap)()
+
+        user.refresh_from_db()
+        self.assertFalse(user.is_online)
+        self.assertIsNotNone(user.last_seen)
+        self.assertIsNone(writer.task)
+
+
+
+class StatusConsumerTests(TestCase):
+    def test_disconnect_before_connect_finished(self):
+        from chat.consumers import StatusConsumer
+
+        user = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        consumer = StatusConsumer()
+        consumer.scope = {'user': user}
+        async_to_sync(consumer.disconnect)(1011)
@@ -0,0 +1,87 @@
+import io
+import shutil
+import tempfile
+
+from PIL import Image
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from accounts.models import CustomUser
+from accounts.services import get_or_create_room
+from chat.models import FileUpload
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def jpeg_bytes(size, orientation=None):
+    output = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    Image.new('RGB', size, (30, 120, 200)).save(output, 'JPEG', exif=exif)
+    return output.getvalue()
+
+
+def png_bytes(size=(800, 600), color=(200, 30, 30)):
+    output = io.BytesIO()
+    Image.new('RGB', size, color).save(output, 'PNG')
+    return output.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHAT_PREVIEW_WORKERS=0, CHAT_THUMBNAIL_SIZE=64)
+class FilePreviewTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
+    def setUp(self):
+        self.user1 = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.user2 = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        self.room = get_or_create_room(self.user1, self.user2)
+
+
+    def upload(self, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            upload = FileUpload.objects.create(
+                user=self.user1, recipient=self.user2, room=self.room,
+                original_filename=name, file=ContentFile(data, name=name)
+            )
+        upload.refresh_from_db()
+        return upload
+
+
+    def test_image_gets_thumbnail_and_placeholder(self):
+        upload = self.upload('photo.png', png_bytes())
+
+        self.assertEqual((upload.width, upload.height), (800, 600))
+        self.assertEqual(len(upload.placeholder), 28)
+        with upload.thumbnail.open('rb') as f:
+            thumbnail = Image.open(f)
+            self.assertEqual((thumbnail.format, thumbnail.size), ('WEBP', (64, 48)))
+
+        preview = upload.preview_payload()
+        self.assertTrue(preview['thumbnail_url'].endswith('.webp'))
+        self.assertIsNone(preview['poster_url'])
+
+
+    def test_large_jpeg_keeps_original_dimensions(self):
+        upload = self.upload('large.jpg', jpeg_bytes((4000, 3000)))
+        self.assertEqual((upload.width, upload.height), (4000, 3000))
+
+        rotated = self.upload('rotated.jpg', jpeg_bytes((4000, 3000), orientation=6))
+        self.assertEqual((rotated.width, rotated.height), (3000, 4000))
+
+
+    def test_duplicate_reuses_preview_and_other_files_are_skipped(self):
+        first = self.upload('photo.png', png_bytes())
+        copy = self.upload('copy.png', png_bytes())
+        document = self.upload('notes.txt', b'hello')
+
+        self.assertEqual(copy.thumbnail.name, first.thumbnail.name)
+        self.assertEqual(copy.placeholder, first.placeholder)
+        self.assertFalse(document.thumbnail)
+        self.assertIsNone(document.preview_payload()['placeholder'])
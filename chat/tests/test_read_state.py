@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from accounts.services import get_or_create_room
+from chat.models import Message, FileUpload, InboxEntry
+from chat.services import (
+    increment_unread, decrement_unread, mark_read,
+    mark_read_until, get_unread_count, get_total_unread,
+    record_private_message, refresh_preview, set_contact_alias, get_inbox
+)
+
+
+class InboxUnreadTests(TestCase):
+    def setUp(self):
+        self.user1 = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.user2 = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        self.user3 = CustomUser.objects.create_user(fullname='carol', email='carol@example.com', password='pass123')
+        self.room = get_or_create_room(self.user1, self.user2)
+        self.other_room = get_or_create_room(self.user3, self.user2)
+
+
+    def test_counter_tracks_sends_and_reads(self):
+        self.assertEqual(get_unread_count(self.room.id, self.user2.id), 0)
+        self.assertEqual(increment_unread(self.room.id, self.user2.id), 1)
+        self.assertEqual(increment_unread(self.room.id, self.user2.id), 2)
+
+        read_at = timezone.now()
+        self.assertEqual(mark_read(self.room.id, self.user2.id, read_at=read_at), 1)
+        self.assertEqual(InboxEntry.objects.get(room=self.room, user=self.user2).last_read_at, read_at)
+
+
+    def test_counter_never_goes_negative(self):
+        self.assertEqual(decrement_unread(self.room.id, self.user2.id, by=5), 0)
+        increment_unread(self.room.id, self.user2.id)
+        self.assertEqual(decrement_unread(self.room.id, self.user2.id, by=5), 0)
+
+
+    def test_total_across_rooms(self):
+        increment_unread(self.room.id, self.user2.id, by=3)
+        increment_unread(self.other_room.id, self.user2.id, by=4)
+        increment_unread(self.room.id, self.user1.id)
+
+        self.assertEqual(get_total_unread(self.user2.id), 7)
+        self.assertEqual(get_total_unread(self.user3.id), 0)
+
+
+    def test_read_until_marks_everything_up_to_watermark(self):
+        base = timezone.now() - timedelta(minutes=10)
+        messages = [
+            Message.objects.create(
+                room=self.room, sender=self.user1, recipient=self.user2,
+                text=f'message {i}', timestamp=base + timedelta(minutes=i)
+            )
+            for i in range(5)
+        ]
+        upload = FileUpload.objects.create(user=self.user1, room=self.room, recipient=self.user2, file='chat_files/a.txt')
+        FileUpload.objects.filter(id=upload.id).update(uploaded_at=base + timedelta(minutes=1, seconds=30))
+        increment_unread(self.room.id, self.user2.id, by=6)
+
+        marked, unread = mark_read_until(self.room.id, self.user2.id, messages[2].timestamp)
+
+        self.assertEqual(marked, 4)
+        self.assertEqual(unread, 2)
+        self.assertEqual(Message.objects.filter(room=self.room, is_read=False).count(), 2)
+        self.assertTrue(FileUpload.objects.get(id=upload.id).is_read)
+
+
+    def test_inbox_orders_by_latest_message(self):
+        earlier = timezone.now() - timedelta(minutes=5)
+        record_private_message(self.room, self.user1.id, 'hello bob', 'text', earlier)
+        unread = record_private_message(self.other_room, self.user3.id, 'x' * 300, 'text', timezone.now())
+        set_contact_alias(self.user2.id, self.user1.id, 'Ali')
+
+        entries, has_more = get_inbox(self.user2.id)
+
+        self.assertEqual(unread, 1)
+        self.assertFalse(has_more)
+        self.assertEqual([entry.room_id for entry in entries], [self.other_room.id, self.room.id])
+        self.assertEqual(len(entries[0].last_message), 255)
+        self.assertEqual(entries[1].alias, 'Ali')
+        self.assertEqual(entries[1].unread_count, 1)
+        self.assertEqual(get_unread_count(self.room.id, self.user1.id), 0)
+
+
+    def test_preview_follows_deletes(self):
+        first = Message.objects.create(room=self.room, sender=self.user1, recipient=self.user2, text='first')
+        record_private_message(self.room, self.user1.id, first.text, 'text', first.timestamp)
+        second = Message.objects.create(room=self.room, sender=self.user2, recipient=self.user1, text='second')
+        record_private_message(self.room, self.user2.id, second.text, 'text', second.timestamp)
+
+        second.delete()
+        refresh_preview('private', self.room.id)
+
+        entry = InboxEntry.objects.get(room=self.room, user=self.user1)
+        self.assertEqual(entry.last_message, 'first')
+        self.assertEqual(entry.last_sender_id, self.user1.id)
@@ -0,0 +1,70 @@
+from django.test import TestCase
+
+from accounts.models import CustomUser
+from channel.models import Channel, ChannelMember, ChannelMessage
+from channel.reads import write_reads
+from chat.models import InboxEntry
+from chat.services import add_inbox_entries
+
+
+class ChannelWatermarkTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.reader = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        self.channel = Channel.objects.create(owner=self.owner, name='news', username='news')
+        self.channel.members.add(self.reader)
+        self.messages = [
+            ChannelMessage.objects.create(channel=self.channel, user=self.owner, content=f'post {i}')
+            for i in range(3)
+        ]
+
+
+    def test_watermark_counts_and_only_moves_forward(self):
+        member = ChannelMember.objects.get(channel=self.channel, user=self.reader)
+        self.assertEqual(member.unread_count, 3)
+
+        self.assertTrue(self.messages[1].mark_as_read_by(self.reader))
+        member.refresh_from_db()
+        self.assertEqual(member.unread_count, 1)
+
+        self.assertFalse(member.mark_read_up_to(self.messages[0].id))
+        self.assertFalse(self.messages[2].mark_as_read_by(self.owner))
+        self.assertEqual(member.last_read_message_id, self.messages[1].id)
+
+
+    def test_new_member_starts_with_nothing_unread(self):
+        late = CustomUser.objects.create_user(fullname='dan', email='dan@example.com', password='pass123')
+        self.channel.members.add(late)
+        add_inbox_entries('channel', self.channel.id, [late.id])
+
+        member = ChannelMember.objects.get(channel=self.channel, user=late)
+        entry = InboxEntry.objects.get(channel=self.channel, user=late)
+        self.assertEqual((member.unread_count, entry.unread_count), (0, 0))
+        self.assertEqual(member.last_read_message_id, self.messages[-1].id)
+
+
+    def test_buffered_reads_are_written_in_one_batch(self):
+        other = CustomUser.objects.create_user(fullname='eve', email='eve@example.com', password='pass123')
+        self.channel.members.add(other)
+        add_inbox_entries('channel', self.channel.id, [self.reader.id, other.id])
+        InboxEntry.objects.filter(channel=self.channel).update(unread_count=3)
+        first, second, last = self.messages
+
+        ChannelMember.objects.filter(channel=self.channel, user=other).update(last_read_message_id=0)
+        ChannelMember.objects.filter(channel=self.channel, user=self.reader).update(last_read_message_id=first.id)
+
+        write_reads({(self.channel.id, self.reader.id): last.id, (self.channel.id, other.id): second.id})
+        # Replayed or stale reads add no views.
+        write_reads({(self.channel.id, self.reader.id): last.id, (self.channel.id, other.id): first.id})
+
+        self.assertEqual(
+            list(ChannelMessage.objects.filter(channel=self.channel).order_by('id').values_list('view_count', 'is_read')),
+            [(1, True), (2, True), (1, False)]
+        )
+        self.assertEqual(
+            dict(InboxEntry.objects.filter(channel=self.channel).values_list('user_id', 'unread_count')),
+            {self.reader.id: 0, other.id: 1}
+        )
+        version = Channel.objects.get(id=self.channel.id).feed_version
+        write_reads({(self.channel.id, other.id): last.id})
+        self.assertEqual(Channel.objects.get(id=self.channel.id).feed_version, version)
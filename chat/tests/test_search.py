@@ -0,0 +1,59 @@
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from accounts.services import get_or_create_room
+from chat.models import Message, SearchEntry
+
+
+class MessageSearchTests(APITestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.bob = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        self.eve = CustomUser.objects.create_user(fullname='eve', email='eve@example.com', password='pass123')
+        self.room = get_or_create_room(self.alice, self.bob)
+        self.other_room = get_or_create_room(self.bob, self.eve)
+        self.client.force_authenticate(user=self.alice)
+
+
+    def search(self, **params):
+        response = self.client.get(reverse('message-search'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+
+    def test_search_is_limited_to_own_conversations(self):
+        Message.objects.create(room=self.room, sender=self.bob, recipient=self.alice, text='deploy <b>tonight</b>?')
+        Message.objects.create(room=self.other_room, sender=self.bob, recipient=self.eve, text='deploy plan')
+
+        results = self.search(q='deplo')['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['conversation_id'], self.room.id)
+        self.assertEqual(results[0]['snippet'], '<mark>deploy</mark> &lt;b&gt;tonight&lt;/b&gt;?')
+
+        self.client.force_authenticate(user=self.bob)
+        self.assertEqual(len(self.search(q='deploy')['results']), 2)
+        self.assertEqual(len(self.search(q='deploy', type='private', conversation_id=self.other_room.id)['results']), 1)
+
+
+    def test_index_follows_edits_deletes_and_pages(self):
+        messages = [
+            Message.objects.create(room=self.room, sender=self.bob, recipient=self.alice, text=f'report {i}')
+            for i in range(4)
+        ]
+        messages[0].text = 'summary'
+        messages[0].save(update_fields=['text'])
+        messages[1].delete()
+
+        self.assertEqual(self.search(q='summary')['results'][0]['message_id'], messages[0].id)
+
+        page = self.search(q='report', limit=1)
+        self.assertEqual([r['message_id'] for r in page['results']], [messages[3].id])
+        page = self.search(q='report', cursor=page['next_cursor'])
+        self.assertEqual([r['message_id'] for r in page['results']], [messages[2].id])
+        self.assertFalse(page['has_more'])
+        self.assertEqual(SearchEntry.objects.count(), 3)
+
+        self.assertEqual(self.client.get(reverse('message-search')).status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from accounts.services import get_or_create_room
+from chat.models import Message, FileUpload
+from chat.timeline import get_room_timeline, get_feed_page, NEWER
+from channel.models import Channel, ChannelMessage
+
+
+class RoomTimelineTests(APITestCase):
+    def setUp(self):
+        self.user1 = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.user2 = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        self.room = get_or_create_room(self.user1, self.user2)
+
+        base = timezone.now() - timedelta(hours=1)
+        for i in range(7):
+            Message.objects.create(
+                room=self.room, sender=self.user1, recipient=self.user2,
+                text=f'message {i}', timestamp=base + timedelta(minutes=i)
+            )
+        for i in range(3):
+            upload = FileUpload.objects.create(
+                user=self.user2, room=self.room, recipient=self.user1,
+                file=f'chat_files/photo_{i}.png', original_filename=f'photo_{i}.png'
+            )
+            FileUpload.objects.filter(id=upload.id).update(uploaded_at=base + timedelta(minutes=i, seconds=30))
+
+
+    def test_pages_cover_history_in_order(self):
+        seen = []
+        page = get_room_timeline(self.room.id, limit=4)
+        seen.extend(page['messages'])
+        while page['has_more']:
+            page = get_room_timeline(self.room.id, cursor=page['older_cursor'], limit=4)
+            seen.extend(page['messages'])
+
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len({(m['type'], m['id']) for m in seen}), 10)
+        timestamps = [m['timestamp'] for m in seen]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+        self.assertEqual(seen[0]['message'], 'message 6')
+        self.assertEqual(seen[-1]['message'], 'message 0')
+
+
+    def test_load_newer_returns_items_after_cursor(self):
+        oldest = get_room_timeline(self.room.id, limit=100)['messages'][-1]
+        first_page = get_room_timeline(self.room.id, limit=100)
+        page = get_room_timeline(self.room.id, cursor=first_page['older_cursor'], direction=NEWER, limit=3)
+
+        self.assertEqual(len(page['messages']), 3)
+        self.assertTrue(page['has_more'])
+        self.assertNotIn(oldest['id'], [m['id'] for m in page['messages'] if m['type'] == oldest['type']])
+
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            get_room_timeline(self.room.id, cursor='not-a-cursor')
+
+
+    def test_rest_endpoint_requires_participant(self):
+        outsider = CustomUser.objects.create_user(fullname='eve', email='eve@example.com', password='pass123')
+        url = reverse('room-messages', kwargs={'room_id': self.room.id})
+
+        self.client.force_authenticate(user=outsider)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.get(url, {'limit': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['messages']), 5)
+        self.assertTrue(response.data['has_more'])
+
+
+class FeedPageTests(APITestCase):
+    def test_pages_walk_back_through_channel_history(self):
+        owner = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        channel = Channel.objects.create(owner=owner, name='news', username='news')
+        posts = [ChannelMessage.objects.create(channel=channel, user=owner, content=f'post {i}') for i in range(5)]
+        feed = ChannelMessage.objects.filter(channel=channel)
+
+        seen, cursor, has_more = [], None, True
+        while has_more:
+            page, cursor, has_more = get_feed_page(feed, 'channel', cursor, limit=2)
+            self.assertLessEqual(len(page), 2)
+            seen = page + seen
+
+        self.assertEqual([post.id for post in seen], [post.id for post in posts])
+        with self.assertRaises(ValueError):
+            get_feed_page(feed, 'channel', 'not-a-cursor')
@@ -0,0 +1,121 @@
+import hashlib
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from accounts.services import get_or_create_room
+from chat.blobs import blob_name
+from chat.models import FileUpload, InboxEntry, StoredBlob, UploadSession
+from chat.uploads import finalize_upload, _temp_path
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHAT_UPLOAD_TEMP_DIR=Path(MEDIA_ROOT) / 'uploads_tmp', CHAT_UPLOAD_BUFFER_SIZE=4)
+class UploadSessionTests(APITestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
+    def setUp(self):
+        self.user1 = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        self.user2 = CustomUser.objects.create_user(fullname='bob', email='bob@example.com', password='pass123')
+        self.room = get_or_create_room(self.user1, self.user2)
+        self.client.force_authenticate(user=self.user1)
+        self.data = b'0123456789abcdefghij'
+
+
+    def create_session(self):
+        response = self.client.post(reverse('upload-session'), {
+            'conversation_type': 'private',
+            'conversation_id': self.room.id,
+            'file_name': 'notes.txt',
+            'file_size': len(self.data),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+
+    def put_chunk(self, session_id, start, end):
+        return self.client.generic(
+            'PUT', reverse('upload-session-detail', kwargs={'session_id': session_id}),
+            self.data[start:end + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.data)}'
+        )
+
+
+    def test_resumable_upload_creates_file_on_complete(self):
+        session_id = self.create_session()
+
+        self.assertEqual(self.put_chunk(session_id, 0, 9).data['offset'], 10)
+        self.assertEqual(self.put_chunk(session_id, 0, 9).status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(FileUpload.objects.exists())
+
+        status_response = self.client.get(reverse('upload-session-detail', kwargs={'session_id': session_id}))
+        self.assertEqual(status_response.data['offset'], 10)
+        self.assertEqual(self.put_chunk(session_id, 10, 19).data['offset'], 20)
+
+        response = self.client.post(reverse('upload-session-complete', kwargs={'session_id': session_id}))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['checksum'], hashlib.sha256(self.data).hexdigest())
+
+        upload = FileUpload.objects.get()
+        self.assertEqual(upload.recipient, self.user2)
+        self.assertEqual((upload.file_size, upload.file_category), (20, 'text'))
+        self.assertEqual(upload.checksum, response.data['checksum'])
+        with upload.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertTrue(UploadSession.objects.get(id=session_id).is_complete)
+        self.assertEqual(InboxEntry.objects.get(room=self.room, user=self.user2).unread_count, 1)
+
+
+    def test_failed_finalize_can_be_retried(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, 19)
+        session = UploadSession.objects.get(id=session_id)
+
+        with mock.patch.dict('chat.uploads._CREATORS', {'private': mock.Mock(side_effect=RuntimeError)}):
+            with self.assertRaises(RuntimeError):
+                finalize_upload(session)
+        self.assertFalse(StoredBlob.objects.exists())
+        storage = StoredBlob._meta.get_field('file').storage
+        self.assertFalse(storage.exists(blob_name(hashlib.sha256(self.data).hexdigest(), 'notes.txt')))
+        self.assertTrue(Path(_temp_path(session)).exists())
+
+        session.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            file_upload, _, _ = finalize_upload(session)
+        with file_upload.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(Path(_temp_path(session)).exists())
+
+
+    def test_complete_requires_all_bytes(self):
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0, 9)
+
+        response = self.client.post(reverse('upload-session-complete', kwargs={'session_id': session_id}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 10)
+
+
+    def test_outsider_cannot_open_session(self):
+        outsider = CustomUser.objects.create_user(fullname='eve', email='eve@example.com', password='pass123')
+        self.client.force_authenticate(user=outsider)
+
+        response = self.client.post(reverse('upload-session'), {
+            'conversation_type': 'private', 'conversation_id': self.room.id,
+            'file_name': 'notes.txt', 'file_size': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,42 @@
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser, Contact
+from accounts.services import get_or_create_room
+from chat.models import Message
+from chat.services import record_private_message
+
+
+class UserSearchTests(APITestCase):
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(fullname='alice', email='alice@example.com', password='pass123')
+        for name in ('bob', 'bobby', 'carol', 'robert'):
+            CustomUser.objects.create_user(fullname=name, email=f'{name}@example.com', password='pass123')
+        self.client.force_authenticate(user=self.alice)
+
+
+    def test_pages_without_per_row_queries(self):
+        Contact.objects.create(owner=self.alice, contact_user=CustomUser.objects.get(fullname='carol'))
+        bob = CustomUser.objects.get(fullname='bob')
+        room = get_or_create_room(self.alice, bob)
+        message = Message.objects.create(room=room, sender=bob, recipient=self.alice, text='hi alice')
+        record_private_message(room, bob.id, message.text, 'text', message.timestamp)
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/accounts/users/search/', {'search': 'bo', 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([u['full_name'] for u in response.data['users']], ['bob'])
+        self.assertEqual(response.data['users'][0]['unread_count'], 1)
+        self.assertEqual(response.data['users'][0]['last_message'], 'hi alice')
+
+        response = self.client.get('/api/v1/accounts/users/search/', {'search': 'bo', 'cursor': response.data['next_cursor']})
+        self.assertEqual([u['full_name'] for u in response.data['users']], ['bobby'])
+        self.assertFalse(response.data['has_more'])
+
+        # Three characters switch from prefix to substring matching; contacts stay excluded.
+        response = self.client.get('/api/v1/accounts/users/search/', {'search': 'rob'})
+        self.assertEqual([u['full_name'] for u in response.data['users']], ['robert'])
+        response = self.client.get('/api/v1/accounts/users/search/', {'search': 'ro'})
+        self.assertEqual([u['full_name'] for u in response.data['users']], ['robert'])
+        response = self.client.get('/api/v1/accounts/users/search/', {'search': 'car'})
+        self.assertEqual(response.data['users'], [])
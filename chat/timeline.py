@@ -0,0 +1,222 @@
+import json
+import base64
+from datetime import datetime
+
+from django.db.models import F, Q, Value, CharField, BooleanField, IntegerField
+from django.db.models.functions import Coalesce
+from django.conf import settings
+
+from chat.models import Message, FileUpload
+from chat.previews import preview_payload
+from chat.utils import file_type_for_category
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 100
+
+OLDER = 'older'
+NEWER = 'newer'
+
+TIMELINE_COLUMNS = (
+    'kind', 'item_id', 'body', 'file_path',
+    'author_id', 'author_email', 'author_fullname',
+    'read', 'updated', 'ts', 'category',
+    'thumbnail_path', 'poster_path', 'blurhash', 'preview_width', 'preview_height',
+)
+
+
+def encode_cursor(timestamp, kind, item_id):
+    raw = json.dumps([timestamp.isoformat(), kind, item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, kind, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(timestamp), str(kind), int(item_id)
+    except (TypeError, ValueError, AttributeError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def _message_rows(room_id):
+    return Message.objects.filter(room_id=room_id).annotate(
+        kind=Value('text', output_field=CharField()),
+        item_id=F('id'),
+        body=F('text'),
+        file_path=Value('', output_field=CharField()),
+        author_id=F('sender_id'),
+        author_email=F('sender__email'),
+        author_fullname=F('sender__fullname'),
+        read=F('is_read'),
+        updated=F('is_updated'),
+        ts=F('timestamp'),
+        category=Value('', output_field=CharField()),
+        thumbnail_path=Value('', output_field=CharField()),
+        poster_path=Value('', output_field=CharField()),
+        blurhash=Value('', output_field=CharField()),
+        preview_width=Value(None, output_field=IntegerField()),
+        preview_height=Value(None, output_field=IntegerField()),
+    )
+
+
+def _file_rows(room_id):
+    return FileUpload.objects.filter(room_id=room_id).annotate(
+        kind=Value('file', output_field=CharField()),
+        item_id=F('id'),
+        body=Coalesce('original_filename', Value('', output_field=CharField())),
+        file_path=F('file'),
+        author_id=F('user_id'),
+        author_email=F('user__email'),
+        author_fullname=F('user__fullname'),
+        read=F('is_read'),
+        updated=Value(False, output_field=BooleanField()),
+        ts=F('uploaded_at'),
+        category=F('file_category'),
+        thumbnail_path=F('thumbnail'),
+        poster_path=F('poster'),
+        blurhash=F('placeholder'),
+        preview_width=F('width'),
+        preview_height=F('height'),
+    )
+
+
+def _keyset_filter(queryset, ts_field, kind, cursor, direction):
+    # Rows are ordered by (ts, kind, id); both sides of the union share the
+    # cursor, so the tie-break on kind is resolved here in Python.
+    cursor_ts, cursor_kind, cursor_id = cursor
+
+    if direction == OLDER:
+        condition = Q(**{f'{ts_field}__lt': cursor_ts})
+        if kind < cursor_kind:
+            condition |= Q(**{ts_field: cursor_ts})
+        elif kind == cursor_kind:
+            condition |= Q(**{ts_field: cursor_ts, 'id__lt': cursor_id})
+    else:
+        condition = Q(**{f'{ts_field}__gt': cursor_ts})
+        if kind > cursor_kind:
+            condition |= Q(**{ts_field: cursor_ts})
+        elif kind == cursor_kind:
+            condition |= Q(**{ts_field: cursor_ts, 'id__gt': cursor_id})
+
+    return queryset.filter(condition)
+
+
+def serialize_timeline_row(row):
+    sender = {
+        "id": str(row['author_id']),
+        "email": row['author_email'],
+        "full_name": row['author_fullname'],
+        "fullname": row['author_fullname'],
+    }
+
+    if row['kind'] == 'text':
+        return {
+            "type": "text",
+            "id": str(row['item_id']),
+            "message": row['body'],
+            "sender": sender,
+            "is_read": row['read'],
+            "is_updated": row['updated'],
+            "timestamp": str(row['ts']),
+        }
+
+    file_name = row['body'] or row['file_path'].split('/')[-1]
+    file_url = None
+    if row['file_path']:
+        storage = FileUpload._meta.get_field('file').storage
+        file_url = f"{settings.BASE_URL}{storage.url(row['file_path'])}"
+
+    return {
+        "type": "file",
+        "id": str(row['item_id']),
+        "message": file_name,
+        "sender": sender,
+        "is_read": row['read'],
+        "is_updated": False,
+        "timestamp": str(row['ts']),
+        "file_name": file_name,
+        "file_url": file_url,
+        "file_type": file_type_for_category(row['category']),
+        "preview": preview_payload(
+            row['thumbnail_path'], row['poster_path'], row['blurhash'],
+            row['preview_width'], row['preview_height']
+        ),
+    }
+
+
+def get_room_timeline(room_id, cursor=None, direction=OLDER, limit=DEFAULT_LIMIT):
+    """
+    One page of the merged text/file history of a P2P room, newest first.
+
+    Messages and files are read with a single UNION ALL query ordered by
+    (timestamp, kind, id), so each side is a range scan over its
+    (room, timestamp) index. `cursor` is the opaque value returned as
+    `older_cursor` / `newer_cursor` by a previous page.
+    """
+    if direction not in (OLDER, NEWER):
+        raise ValueError(f"Invalid direction: {direction}")
+
+    limit = max(1, min(int(limit), MAX_LIMIT))
+
+    messages = _message_rows(room_id)
+    files = _file_rows(room_id)
+
+    if cursor:
+        position = decode_cursor(cursor)
+        messages = _keyset_filter(messages, 'timestamp', 'text', position, direction)
+        files = _keyset_filter(files, 'uploaded_at', 'file', position, direction)
+
+    ordering = ('-ts', '-kind', '-item_id') if direction == OLDER else ('ts', 'kind', 'item_id')
+
+    rows = list(
+        messages.order_by().values(*TIMELINE_COLUMNS)
+        .union(files.order_by().values(*TIMELINE_COLUMNS), all=True)
+        .order_by(*ordering)[:limit + 1]
+    )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == NEWER:
+        rows.reverse()
+
+    older_cursor = None
+    newer_cursor = None
+    if rows:
+        newest, oldest = rows[0], rows[-1]
+        older_cursor = encode_cursor(oldest['ts'], oldest['kind'], oldest['item_id'])
+        newer_cursor = encode_cursor(newest['ts'], newest['kind'], newest['item_id'])
+    elif cursor:
+        older_cursor = newer_cursor = cursor
+
+    return {
+        "messages": [serialize_timeline_row(row) for row in rows],
+        "older_cursor": older_cursor,
+        "newer_cursor": newer_cursor,
+        "has_more": has_more,
+    }
+
+
+def get_feed_page(queryset, kind, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    One page of a group or channel feed, read newest first over its
+    (conversation, created_at, id) index. `cursor` is the `older_cursor` of
+    the previous page. Returns (messages oldest first, older_cursor, has_more).
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+
+    if cursor:
+        cursor_ts, _, cursor_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=cursor_ts) |
+            Q(created_at=cursor_ts, id__lt=cursor_id)
+        )
+
+    messages = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+    has_more = len(messages) > limit
+    messages = messages[:limit][::-1]
+
+    older_cursor = cursor
+    if messages:
+        older_cursor = encode_cursor(messages[0].created_at, kind, messages[0].id)
+    return messages, older_cursor, has_more
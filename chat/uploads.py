@@ -0,0 +1,310 @@
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.files import File
+from django.db import transaction
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from chat.blobs import delete_unreferenced
+from chat.models import Room, FileUpload, UploadSession
+from chat.services import record_private_message, record_message, get_total_unread
+from chat.utils import file_type_for_category, encoded_event, p2p_file_frame
+
+logger = logging.getLogger(__name__)
+
+
+# Running sha256 per session, valid only while chunks arrive in order on this
+# process. Anything else falls back to hashing the finished file once.
+_running_checksums = OrderedDict()
+_MAX_RUNNING_CHECKSUMS = 256
+
+
+class UploadOffsetMismatch(ValueError):
+    def __init__(self, offset):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+def _temp_path(session):
+    return os.path.join(settings.CHAT_UPLOAD_TEMP_DIR, f'{session.id}.part')
+
+
+def _remove_temp_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remember_checksum(session_id, offset, hasher):
+    _running_checksums[session_id] = (offset, hasher)
+    _running_checksums.move_to_end(session_id)
+    while len(_running_checksums) > _MAX_RUNNING_CHECKSUMS:
+        _running_checksums.popitem(last=False)
+
+
+def _file_checksum(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(settings.CHAT_UPLOAD_BUFFER_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def create_upload_session(user, conversation_type, conversation_id, file_name, total_size, content_type=''):
+    total_size = int(total_size)
+    if total_size <= 0 or total_size > settings.CHAT_UPLOAD_MAX_SIZE:
+        raise ValueError(f"file_size must be between 1 and {settings.CHAT_UPLOAD_MAX_SIZE} bytes")
+
+    file_name = os.path.basename(file_name or '')
+    if not file_name:
+        raise ValueError("file_name is required")
+
+    session = UploadSession(
+        user=user, conversation_type=conversation_type, file_name=file_name[:255],
+        content_type=(content_type or '')[:100], total_size=total_size
+    )
+
+    if conversation_type == 'private':
+        room = Room.objects.filter(id=conversation_id).first()
+        if not room or user.id not in (room.user1_id, room.user2_id):
+            raise PermissionDenied("You are not a participant of this room")
+        session.room = room
+    elif conversation_type == 'group':
+        from groups.models import GroupMember
+        if not GroupMember.objects.filter(group_id=conversation_id, user=user).exists():
+            raise PermissionDenied("You are not a member of this group")
+        session.group_id = conversation_id
+    elif conversation_type == 'channel':
+        from channel.models import Channel
+        if not Channel.objects.filter(id=conversation_id, owner=user).exists():
+            raise PermissionDenied("Only channel owner can upload files")
+        session.channel_id = conversation_id
+    else:
+        raise ValueError(f"Invalid conversation type: {conversation_type}")
+
+    session.save()
+    return session
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Streams `length` bytes from `stream` into the session's temporary file at
+    `offset`. Memory use is bounded by CHAT_UPLOAD_BUFFER_SIZE regardless of
+    the chunk size. Returns the new offset.
+    """
+    if session.is_complete:
+        raise ValueError("Upload is already complete")
+    if offset != session.received_size:
+        raise UploadOffsetMismatch(session.received_size)
+    if length <= 0 or offset + length > session.total_size:
+        raise ValueError("Chunk exceeds the declared file size")
+
+    running = _running_checksums.pop(session.id, None)
+    if running and running[0] == offset:
+        hasher = running[1]
+    elif offset == 0:
+        hasher = hashlib.sha256()
+    else:
+        hasher = None
+
+    os.makedirs(settings.CHAT_UPLOAD_TEMP_DIR, exist_ok=True)
+    fd = os.open(_temp_path(session), os.O_WRONLY | os.O_CREAT, 0o600)
+    written = 0
+    try:
+        while written < length:
+            block = stream.read(min(settings.CHAT_UPLOAD_BUFFER_SIZE, length - written))
+            if not block:
+                break
+            os.pwrite(fd, block, offset + written)
+            if hasher:
+                hasher.update(block)
+            written += len(block)
+    finally:
+        os.close(fd)
+
+    new_offset = offset + written
+    updated = UploadSession.objects.filter(
+        id=session.id, received_size=offset, is_complete=False
+    ).update(received_size=new_offset)
+    if not updated:
+        session.refresh_from_db(fields=['received_size'])
+        raise UploadOffsetMismatch(session.received_size)
+
+    session.received_size = new_offset
+    if hasher:
+        _remember_checksum(session.id, new_offset, hasher)
+    return new_offset
+
+
+def abort_upload(session):
+    _running_checksums.pop(session.id, None)
+    _remove_temp_file(_temp_path(session))
+    session.delete()
+
+
+def _file_payload(file_upload, session):
+    return {
+        'id': str(file_upload.id),
+        'file_name': session.file_name,
+        'file_url': file_upload.file_url,
+        'file_size': session.total_size,
+        'file_type': file_type_for_category(file_upload.file_category),
+        'checksum': session.checksum,
+        'preview': file_upload.preview_payload(),
+        'user': {
+            'id': str(session.user.id),
+            'email': session.user.email,
+            'full_name': session.user.fullname
+        },
+        'uploaded_at': str(file_upload.uploaded_at)
+    }
+
+
+def _create_private_file(session, file_upload):
+    room = session.room
+    file_upload.room = room
+    file_upload.recipient_id = room.user2_id if room.user1_id == session.user_id else room.user1_id
+    file_upload.save()
+    unread_count = record_private_message(
+        room, session.user_id, session.file_name, 'file', file_upload.uploaded_at
+    )
+    return None, unread_count
+
+
+def _create_group_file(session, file_upload):
+    from groups.models import GroupMessage
+
+    file_upload.group_id = session.group_id
+    file_upload.save()
+    message = GroupMessage.objects.create(
+        group_id=session.group_id,
+        sender=session.user,
+        content=f"File: {session.file_name}",
+        file=file_upload,
+        message_type='file'
+    )
+    record_message('group', session.group_id, session.user_id, session.file_name, 'file', message.created_at)
+    return message, None
+
+
+def _create_channel_file(session, file_upload):
+    from channel.models import ChannelMessage
+
+    file_upload.channel_id = session.channel_id
+    file_upload.save()
+    message = ChannelMessage.objects.create(
+        channel_id=session.channel_id,
+        user=session.user,
+        content=f"File: {session.file_name}",
+        message_type='file',
+        file=file_upload
+    )
+    record_message('channel', session.channel_id, session.user_id, session.file_name, 'file', message.created_at)
+    return message, None
+
+
+_CREATORS = {
+    'private': _create_private_file,
+    'group': _create_group_file,
+    'channel': _create_channel_file,
+}
+
+
+def finalize_upload(session):
+    """
+    Copies the finished upload into blob storage and creates the FileUpload
+    and the conversation message in one transaction. Returns
+    (file_upload, message, unread_count); message is None for P2P rooms.
+    """
+    if session.is_complete:
+        raise ValueError("Upload is already complete")
+    if session.received_size != session.total_size:
+        raise UploadOffsetMismatch(session.received_size)
+
+    path = _temp_path(session)
+    running = _running_checksums.pop(session.id, None)
+    if running and running[0] == session.total_size:
+        session.checksum = running[1].hexdigest()
+    else:
+        session.checksum = _file_checksum(path)
+
+    file_upload = FileUpload(user=session.user, original_filename=session.file_name)
+
+    # The content is copied, not moved, so a failed transaction leaves the
+    # session's temp file in place and the upload can be finalized again.
+    try:
+        with transaction.atomic():
+            with open(path, 'rb') as f:
+                file_upload.store_content(File(f, name=path), checksum=session.checksum)
+
+            message, unread_count = _CREATORS[session.conversation_type](session, file_upload)
+
+            session.file_upload = file_upload
+            session.is_complete = True
+            session.save(update_fields=['checksum', 'file_upload', 'is_complete', 'updated_at'])
+    except Exception:
+        if file_upload.blob_id:
+            delete_unreferenced(file_upload.checksum, file_upload.file.name)
+        raise
+
+    transaction.on_commit(lambda: _remove_temp_file(path))
+    return file_upload, message, unread_count
+
+
+def broadcast_upload(session, file_upload, message, unread_count):
+    """Sends the same channel layer events the WebSocket upload frames produce."""
+    channel_layer = get_channel_layer()
+    payload = _file_payload(file_upload, session)
+
+    if session.conversation_type == 'private':
+        recipient_id = file_upload.recipient_id
+        async_to_sync(channel_layer.group_send)(
+            f'p2p_chat_{session.room_id}',
+            encoded_event("file_uploaded", p2p_file_frame(payload))
+        )
+        async_to_sync(channel_layer.group_send)(
+            f"notifications_{recipient_id}",
+            {
+                "type": "unread_count_update",
+                "contact_id": session.user_id,
+                "unread_count": unread_count,
+                "total_unread": get_total_unread(recipient_id),
+            }
+        )
+
+    elif session.conversation_type == 'group':
+        from groups.consumers import get_unread_counts, send_unread_counts, file_message_frame
+
+        async_to_sync(channel_layer.group_send)(
+            f'group_{session.group_id}',
+            encoded_event('file_message', file_message_frame({
+                'file_id': message.id,
+                'file_name': session.file_name,
+                'file_url': file_upload.file.url,
+                'file_type': session.content_type or file_upload.content_type,
+                'file_size': session.total_size,
+                'preview': payload['preview'],
+                'sender_id': session.user_id,
+                'sender_name': session.user.fullname,
+                'timestamp': message.created_at.isoformat(),
+            }))
+        )
+        counts = get_unread_counts(session.group_id, session.user_id)
+        async_to_sync(send_unread_counts)(channel_layer, session.group_id, counts)
+
+    else:
+        from channel.feed import serialize_post, post_event
+
+        async_to_sync(channel_layer.group_send)(
+            f'channel_{session.channel_id}',
+            post_event('file_uploaded', serialize_post(message), message.channel.owner_id)
+        )
+
+    return payload
@@ -1,12 +1,23 @@
 from django.urls import path
 
-from chat.views import MessageListApiView, FileUploadApiView, StartChatApiView, download_file, get_user_files
+from chat.views import (
+    MessageListApiView, FileUploadApiView,
+    StartChatApiView, RoomMessagesApiView, InboxApiView, MessageSearchApiView,
+    UploadSessionApiView, UploadSessionDetailApiView, UploadSessionCompleteApiView,
+    download_file, get_user_files
+)
 
 
 urlpatterns = [
     path('message/all/', MessageListApiView.as_view(), name='message-list'),
     path('file-upload/', FileUploadApiView.as_view(), name='file-upload'),
     path("start/", StartChatApiView.as_view(), name="start-chat"),
+    path('room/<int:room_id>/messages/', RoomMessagesApiView.as_view(), name='room-messages'),
+    path('inbox/', InboxApiView.as_view(), name='inbox'),
+    path('search/', MessageSearchApiView.as_view(), name='message-search'),
+    path('uploads/', UploadSessionApiView.as_view(), name='upload-session'),
+    path('uploads/<uuid:session_id>/', UploadSessionDetailApiView.as_view(), name='upload-session-detail'),
+    path('uploads/<uuid:session_id>/complete/', UploadSessionCompleteApiView.as_view(), name='upload-session-complete'),
     path('files/<int:file_id>/download/', download_file, name='file_download'),
     path('user-files/', get_user_files, name='user-files'),   
 ]
\ No newline at end of file
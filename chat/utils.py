@@ -1,3 +1,5 @@
+import json
+
 from channels.layers import get_channel_layer
 
 from asgiref.sync import async_to_sync
@@ -15,4 +17,68 @@ def send_notification(user, title, message):
             'message': message,
             'timestamp': now().isoformat()
         }
-    )
\ No newline at end of file
+    )
+
+
+def encoded_event(handler, frame):
+    """
+    A channel layer event that carries `frame` already JSON-encoded, so a
+    broadcast is serialized once by the sender and every receiving socket
+    forwards `text` unchanged.
+    """
+    return {'type': handler, 'text': json.dumps(frame)}
+
+
+def p2p_file_frame(info):
+    return {
+        'type': 'file_uploaded',
+        'id': info['id'],
+        'file_name': info['file_name'],
+        'file_url': info['file_url'],
+        'preview': info.get('preview'),
+        'user': info['user'],
+        'uploaded_at': info['uploaded_at']
+    }
+
+
+FILE_CATEGORIES = {
+    'jpg': 'image', 'jpeg': 'image', 'png': 'image', 'gif': 'image', 'webp': 'image',
+    'mp4': 'video', 'avi': 'video', 'mov': 'video', 'wmv': 'video',
+    'mp3': 'audio', 'wav': 'audio', 'ogg': 'audio', 'flac': 'audio',
+    'pdf': 'pdf',
+    'doc': 'document', 'docx': 'document',
+    'xls': 'spreadsheet', 'xlsx': 'spreadsheet',
+    'zip': 'archive', 'rar': 'archive', '7z': 'archive',
+    'txt': 'text',
+}
+
+# The P2P chat protocol names some categories differently.
+P2P_FILE_TYPES = {
+    'document': 'word',
+    'spreadsheet': 'excel',
+}
+
+
+def get_file_category(file_name):
+    if not file_name or '.' not in file_name:
+        return 'file'
+    return FILE_CATEGORIES.get(file_name.rsplit('.', 1)[-1].lower(), 'file')
+
+
+def get_file_type(file_name):
+    return file_type_for_category(get_file_category(file_name))
+
+
+def file_type_for_category(category):
+    return P2P_FILE_TYPES.get(category, category or 'file')
+
+
+def format_file_size(size_bytes):
+    if not size_bytes:
+        return "0B"
+    size_names = ["B", "KB", "MB", "GB"]
+    i = 0
+    while size_bytes >= 1024 and i < len(size_names)-1:
+        size_bytes /= 1024.0
+        i += 1
+    return f"{size_bytes:.1f}{size_names[i]}"
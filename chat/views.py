@@ -1,4 +1,3 @@
-from django.http import FileResponse
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 
@@ -10,9 +9,17 @@ from rest_framework.decorators import api_view
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 
-from chat.models import Message, FileUpload
+from chat.models import Message, FileUpload, Room, UploadSession
 from chat.serializers import MessageSerializer, FileSerializer
-from chat.utils import send_notification
+from chat.timeline import get_room_timeline, encode_cursor, decode_cursor, OLDER, DEFAULT_LIMIT
+from chat.services import get_inbox, serialize_inbox_entry, CONVERSATION_FIELDS, INBOX_PAGE_SIZE
+from chat.downloads import serve_file
+from chat.search import search_messages, serialize_search_entry, SEARCH_PAGE_SIZE
+from chat.uploads import (
+    create_upload_session, write_chunk, finalize_upload,
+    broadcast_upload, abort_upload, UploadOffsetMismatch
+)
+from chat.utils import send_notification, format_file_size
 
 from accounts.services import get_or_create_room
 from accounts.models import CustomUser, Contact
@@ -99,6 +106,191 @@ class StartChatApiView(APIView):
         return Response({"room_id": room.id}, status=status.HTTP_200_OK)
     
 
+class RoomMessagesApiView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, room_id):
+        room = get_object_or_404(Room, id=room_id)
+
+        if request.user.id not in (room.user1_id, room.user2_id):
+            return Response({"error": "You are not a participant of this room"}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            page = get_room_timeline(
+                room.id,
+                cursor=request.query_params.get('cursor'),
+                direction=request.query_params.get('direction', OLDER),
+                limit=request.query_params.get('limit', DEFAULT_LIMIT),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(page, status=status.HTTP_200_OK)
+
+
+class InboxApiView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        conversation_type = request.query_params.get('type')
+        if conversation_type and conversation_type not in CONVERSATION_FIELDS:
+            return Response({"error": f"Invalid type: {conversation_type}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            before = None
+            cursor = request.query_params.get('cursor')
+            if cursor:
+                before_at, _, before_id = decode_cursor(cursor)
+                before = (before_at, before_id)
+
+            entries, has_more = get_inbox(
+                request.user.id,
+                conversation_type=conversation_type,
+                before=before,
+                limit=request.query_params.get('limit', INBOX_PAGE_SIZE),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_cursor = None
+        if has_more:
+            last = entries[-1]
+            next_cursor = encode_cursor(last.last_message_at, last.conversation_type, last.id)
+
+        return Response({
+            "conversations": [serialize_inbox_entry(entry) for entry in entries],
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }, status=status.HTTP_200_OK)
+
+
+class MessageSearchApiView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            before = None
+            cursor = request.query_params.get('cursor')
+            if cursor:
+                before_at, _, before_id = decode_cursor(cursor)
+                before = (before_at, before_id)
+
+            entries, has_more = search_messages(
+                request.user.id,
+                request.query_params.get('q'),
+                conversation_type=request.query_params.get('type'),
+                conversation_id=request.query_params.get('conversation_id'),
+                before=before,
+                limit=request.query_params.get('limit', SEARCH_PAGE_SIZE),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_cursor = None
+        if has_more:
+            last = entries[-1]
+            next_cursor = encode_cursor(last.created_at, last.conversation_type, last.id)
+
+        return Response({
+            "results": [serialize_search_entry(entry) for entry in entries],
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }, status=status.HTTP_200_OK)
+
+
+def _parse_content_range(header):
+    # "bytes <start>-<end>/<total>"
+    try:
+        unit, _, spec = header.partition(' ')
+        span, _, total = spec.partition('/')
+        start, _, end = span.partition('-')
+        if unit != 'bytes':
+            raise ValueError
+        return int(start), int(end), int(total)
+    except ValueError:
+        raise ValueError(f"Invalid Content-Range: {header}")
+
+
+def _upload_state(session):
+    return {
+        "id": str(session.id),
+        "offset": session.received_size,
+        "file_size": session.total_size,
+        "is_complete": session.is_complete,
+    }
+
+
+class UploadSessionApiView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        try:
+            session = create_upload_session(
+                request.user,
+                request.data.get('conversation_type', 'private'),
+                request.data.get('conversation_id'),
+                request.data.get('file_name'),
+                request.data.get('file_size', 0),
+                request.data.get('content_type', ''),
+            )
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(_upload_state(session), status=status.HTTP_201_CREATED)
+
+
+class UploadSessionDetailApiView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_session(self, request, session_id):
+        return get_object_or_404(UploadSession, id=session_id, user=request.user)
+
+    def get(self, request, session_id):
+        return Response(_upload_state(self.get_session(request, session_id)), status=status.HTTP_200_OK)
+
+    def put(self, request, session_id):
+        session = self.get_session(request, session_id)
+
+        try:
+            start, end, total = _parse_content_range(request.headers.get('Content-Range', ''))
+            if total != session.total_size or end < start:
+                raise ValueError("Content-Range does not match the upload")
+            offset = write_chunk(session, start, request.stream, end - start + 1)
+        except UploadOffsetMismatch as e:
+            return Response({"error": str(e), "offset": e.offset}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({**_upload_state(session), "offset": offset}, status=status.HTTP_200_OK)
+
+    def delete(self, request, session_id):
+        session = self.get_session(request, session_id)
+        if session.is_complete:
+            return Response({"error": "Upload is already complete"}, status=status.HTTP_400_BAD_REQUEST)
+
+        abort_upload(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCompleteApiView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, session_id):
+        session = get_object_or_404(
+            UploadSession.objects.select_related('user', 'room'), id=session_id, user=request.user
+        )
+
+        try:
+            file_upload, message, unread_count = finalize_upload(session)
+        except UploadOffsetMismatch as e:
+            return Response({"error": str(e), "offset": e.offset}, status=status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        payload = broadcast_upload(session, file_upload, message, unread_count)
+        return Response(payload, status=status.HTTP_201_CREATED)
+
+
 @api_view(['GET'])
 def download_file(request, file_id):
     file_upload = get_object_or_404(FileUpload, id=file_id)
@@ -109,12 +301,7 @@ def download_file(request, file_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    original_filename = file_upload.original_filename
-    
-    response = FileResponse(file_upload.file.open(), as_attachment=True)
-    response['Content-Disposition'] = f'attachment; filename="{original_filename}"'
-    
-    return response
+    return serve_file(request, file_upload)
 
 
 @api_view(['GET'])
@@ -127,50 +314,16 @@ def get_user_files(request):
         data = [{
             'id': file.id,
             'name': file.original_filename if hasattr(file, 'original_filename') and file.original_filename else file.file.name.split('/')[-1],
-            'type': get_file_type(file.file.name),
-            'size': format_file_size(file.file.size),
+            'type': file.file_category,
+            'size': format_file_size(file.file_size),
             'uploadedBy': file.user.fullname if file.user.fullname else file.user.email,
             'uploadDate': file.uploaded_at.strftime("%Y-%m-%d %H:%M"),
             'downloadCount': file.download_count if hasattr(file, 'download_count') else 0,
             'isOwner': file.user == request.user,
+            'preview': file.preview_payload(),
             'roomId': file.room.id if file.room else None
         } for file in files]
         
         return Response(data)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
-
-def get_file_type(filename):
-    if not filename:
-        return 'file'
-    
-    extension = filename.split('.')[-1].lower() if '.' in filename else ''
-    
-    if extension in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-        return 'image'
-    elif extension in ['mp4', 'avi', 'mov', 'wmv']:
-        return 'video'
-    elif extension in ['mp3', 'wav', 'ogg', 'flac']:
-        return 'audio'
-    elif extension == 'pdf':
-        return 'pdf'
-    elif extension in ['doc', 'docx']:
-        return 'document'
-    elif extension in ['xls', 'xlsx']:
-        return 'spreadsheet'
-    elif extension in ['zip', 'rar', '7z']:
-        return 'archive'
-    elif extension in ['txt']:
-        return 'text'
-    else:
-        return 'file'
-
-def format_file_size(size_bytes):
-    if size_bytes == 0:
-        return "0B"
-    size_names = ["B", "KB", "MB", "GB"]
-    i = 0
-    while size_bytes >= 1024 and i < len(size_names)-1:
-        size_bytes /= 1024.0
-        i += 1
-    return f"{size_bytes:.1f}{size_names[i]}"
\ No newline at end of file
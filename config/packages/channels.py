@@ -1,3 +1,5 @@
+import os
+
 # CHANNEL_LAYERS = {
 #     'default': {
 #         'BACKEND': 'channels.layers.InMemoryChannelLayer' 
@@ -12,4 +14,16 @@ CHANNEL_LAYERS = {
             "hosts": [('127.0.0.1', 6379)],
         },
     },
-}
\ No newline at end of file
+}
+
+# Presence registry shared by all daphne workers, read from the environment;
+# unset keeps it in process memory (single worker, development and tests)
+PRESENCE_REDIS_URL = os.environ.get('PRESENCE_REDIS_URL', '')
+# A connection counts as online for this long after its last heartbeat
+PRESENCE_TTL = 60
+# is_online/last_seen changes are buffered and written in bulk this often
+PRESENCE_FLUSH_INTERVAL = 5
+# Serialized channel feed pages are shared by all subscribers for this long
+CHANNEL_FEED_CACHE_TTL = 300
+# Channel post views and read watermarks are buffered and written this often
+CHANNEL_READ_FLUSH_INTERVAL = 5
@@ -158,6 +158,22 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Chunked uploads are written here before they are moved into MEDIA_ROOT
+CHAT_UPLOAD_TEMP_DIR = MEDIA_ROOT / 'uploads_tmp'
+CHAT_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+CHAT_UPLOAD_BUFFER_SIZE = 64 * 1024
+
+# Hand file downloads to the front proxy: '', 'x-accel-redirect' (nginx) or 'x-sendfile'
+CHAT_FILE_OFFLOAD = env.str('CHAT_FILE_OFFLOAD', default='')
+# nginx `internal` location that aliases MEDIA_ROOT
+CHAT_FILE_OFFLOAD_PREFIX = env.str('CHAT_FILE_OFFLOAD_PREFIX', default='/protected-media/')
+
+# Thumbnails and video posters are rendered in a process pool of this size;
+# 0 renders inline, which is only meant for tests and debugging
+CHAT_PREVIEW_WORKERS = env.int('CHAT_PREVIEW_WORKERS', default=2)
+CHAT_THUMBNAIL_SIZE = 320
+CHAT_POSTER_SIZE = 1280
+
 
 # settings.py faylida
 BASE_URL = 'https://planshet2.stat.uz/'
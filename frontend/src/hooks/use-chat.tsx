@@ -181,17 +181,24 @@ export function useChat() {
 
   const loadGroups = useCallback(async () => {
     try {
-      const groupsData = await apiClient.getGroups()
+      const groupsData: any[] = []
+      let cursor: string | null = null
+      do {
+        const page = await apiClient.getGroups(cursor)
+        groupsData.push(...page.groups)
+        cursor = page.has_more ? page.next_cursor : null
+      } while (cursor)
+
       const formattedGroups: Chat[] = groupsData.map((group: any) => ({
         id: group.id,
         name: group.name,
         sender: group.name,
         sender_id: group.created_by,
-        last_message: "",
+        last_message: group.last_message || "",
         timestamp: group.last_message_time || group.updated_at,
-        unread: 0,
+        unread: group.unread_count || 0,
         avatar: "/group-avatar.png",
-        message_type: "text",
+        message_type: group.message_type || "text",
         room_id: `group_${group.id}`,
         type: "group",
         description: group.description,
@@ -1498,7 +1505,13 @@ export function useChat() {
 
 const loadChannels = useCallback(async () => {
   try {
-    const channelsData = await apiClient.getChannels();
+    const channelsData: any[] = [];
+    let cursor: string | null = null;
+    do {
+      const page = await apiClient.getChannels(cursor);
+      channelsData.push(...page.channels);
+      cursor = page.has_more ? page.next_cursor : null;
+    } while (cursor);
 
     const formattedChannels: Chat[] = channelsData.map((channel: any) => {
       const isOwner = getChannelOwnership(channel, currentUser);
@@ -1518,8 +1531,8 @@ const loadChannels = useCallback(async () => {
         sender: channel.owner_name || "Noma'lum",
         sender_id: channel.owner,
         last_message: channel.last_message || channel.description || "",
-        timestamp: channel.last_message_time || channel.updated_at || new Date().toISOString(),
-        unread: channel.unread_count || 0,
+        timestamp: channel.timestamp || channel.last_message_time || channel.updated_at || new Date().toISOString(),
+        unread: channel.unread || channel.unread_count || 0,
         avatar: "/channel-avatar.png",
         message_type: "text",
         room_id: `channel_${channel.id}`,
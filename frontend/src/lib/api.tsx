@@ -281,8 +281,10 @@ export const apiClient = {
     return this.handleResponse(response);
   },
 
-  async getGroups() {
-    const response = await api.get(`${BASE_URL}/v1/group/all/`,);
+  async getGroups(cursor?: string | null) {
+    const response = await api.get(`${BASE_URL}/v1/group/all/`, {
+      params: cursor ? { cursor } : undefined,
+    });
     return response.data;
   },
 
@@ -421,8 +423,9 @@ export const apiClient = {
     return this.handleResponse(response);
   },
 
-  async getChannels() {
-    const response = await fetch(`${BASE_URL}/v1/channels/list/`, {
+  async getChannels(cursor?: string | null) {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const response = await fetch(`${BASE_URL}/v1/channels/list/${query}`, {
       method: 'GET',
       headers: this.getHeaders(),
     });
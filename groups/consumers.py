@@ -2,9 +2,61 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import Q, Max
 
 from groups.models import GroupMember, GroupMessage
 from groups.serializers import GroupMessageSerializer
+from chat.models import InboxEntry
+from chat.services import record_message, refresh_preview, decrement_unread_for, set_conversation_unread
+from chat.timeline import get_feed_page, DEFAULT_LIMIT
+from chat.utils import encoded_event
+
+
+def member_group_name(group_id, user_id):
+    # Joined only by the user's own sockets in this group.
+    return f'group_{group_id}_member_{user_id}'
+
+
+def get_unread_counts(group_id, sender_id):
+    """Every other member's unread counter for the group, read in one query."""
+    return list(
+        InboxEntry.objects.filter(
+            conversation_type='group', group_id=group_id
+        ).exclude(user_id=sender_id).values_list('user_id', 'unread_count')
+    )
+
+
+def file_message_frame(info):
+    return {
+        'type': 'file_uploaded',
+        'id': info['file_id'],
+        'file_name': info['file_name'],
+        'file_url': info['file_url'],
+        'file_type': info['file_type'],
+        'file_size': info['file_size'],
+        'preview': info.get('preview'),
+        'user': {
+            'id': info['sender_id'],
+            'fullname': info['sender_name']
+        },
+        'sender_id': info['sender_id'],
+        'sender_name': info['sender_name'],
+        'timestamp': info['timestamp'],
+        'uploaded_at': info['timestamp'],
+        'message_type': 'file'
+    }
+
+
+async def send_unread_counts(channel_layer, group_id, counts):
+    for user_id, count in counts:
+        await channel_layer.group_send(
+            member_group_name(group_id, user_id),
+            {
+                'type': 'unread_count_for_user',
+                'count': count
+            }
+        )
 
 
 class GroupChatConsumer(AsyncWebsocketConsumer):
@@ -28,6 +80,10 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             self.group_room_name,
             self.channel_name
         )
+        await self.channel_layer.group_add(
+            member_group_name(self.group_id, self.user.id),
+            self.channel_name
+        )
 
         unread_count = await self.get_unread_count()
         await self.send(text_data=json.dumps({
@@ -35,8 +91,6 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             'count': unread_count
         }))
 
-        await self.set_user_online(True)
-
 
     async def disconnect(self, close_code):
         if hasattr(self, 'group_room_name'):
@@ -44,9 +98,10 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 self.group_room_name,
                 self.channel_name
             )
-
-        if hasattr(self, 'user') and not isinstance(self.user, AnonymousUser):
-            await self.set_user_online(False)
+            await self.channel_layer.group_discard(
+                member_group_name(self.group_id, self.user.id),
+                self.channel_name
+            )
 
 
     async def receive(self, text_data):
@@ -62,6 +117,8 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 await self.handle_stop_typing(text_data_json)
             elif message_type == 'get_history':
                 await self.send_message_history()
+            elif message_type == 'load_older':
+                await self.handle_load_older(text_data_json)
             elif message_type == 'file_upload':
                 await self.handle_file_upload(text_data_json)
             elif message_type == 'mark_as_read':  
@@ -84,14 +141,35 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
 
             
     async def handle_mark_all_as_read(self):
-        await self.mark_all_messages_as_read()
-        unread_count = await self.get_unread_count()
+        last_read_id, unread_count = await self.mark_all_messages_as_read()
         
         await self.send(text_data=json.dumps({
             'type': 'unread_count',
             'count': unread_count
         }))
 
+        if last_read_id:
+            await self.channel_layer.group_send(
+                self.group_room_name,
+                {
+                    'type': 'messages_read',
+                    'user_id': self.user.id,
+                    'user_name': self.user.fullname,
+                    'last_read_message_id': last_read_id,
+                }
+            )
+
+
+    async def messages_read(self, event):
+        # One receipt covers every message up to last_read_message_id.
+        if event['user_id'] != self.user.id:
+            await self.send(text_data=json.dumps({
+                'type': 'messages_read_status',
+                'reader_id': event['user_id'],
+                'reader_name': event['user_name'],
+                'last_read_message_id': event['last_read_message_id'],
+            }))
+
 
     async def handle_mark_as_read(self, data):
         message_id = data.get('message_id')
@@ -164,7 +242,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         if message:
             await self.channel_layer.group_send(
                 self.group_room_name,
-                {
+                encoded_event('chat_message', {
                     'type': 'chat_message',
                     'message': await self.serialize_message(message),
                     'sender_id': self.user.id,
@@ -172,35 +250,25 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                     'timestamp': message.created_at.isoformat(),
                     'reply_to': await self.get_reply_message(reply_to_id) if reply_to_id else None,
                     'temp_message_id': temp_message_id
-                }
+                })
             )
+            await self.notify_unread_counts()
 
 
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message'],
-            'sender_id': event['sender_id'],
-            'sender_name': event['sender_name'],
-            'timestamp': event['timestamp'],
-            'reply_to': event['reply_to'],
-            'temp_message_id': event.get('temp_message_id')
-        }))
-        
-        if event['sender_id'] != self.user.id:
-            unread_count = await self.get_unread_count()
-            await self.send(text_data=json.dumps({
-                'type': 'unread_count',
-                'count': unread_count
-            }))
+        await self.send(text_data=event['text'])
+
+
+    async def notify_unread_counts(self):
+        counts = await database_sync_to_async(get_unread_counts)(self.group_id, self.user.id)
+        await send_unread_counts(self.channel_layer, self.group_id, counts)
 
 
     async def unread_count_for_user(self, event):
-        if event['target_user_id'] == self.user.id:
-            await self.send(text_data=json.dumps({
-                'type': 'unread_count',
-                'count': event['count']
-            }))
+        await self.send(text_data=json.dumps({
+            'type': 'unread_count',
+            'count': event['count']
+        }))
 
 
     async def handle_typing(self, data):
@@ -271,10 +339,37 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
 
         
     async def send_message_history(self):
-        messages = await self.get_group_messages()
+        messages, older_cursor, has_more = await self.get_group_messages()
         await self.send(text_data=json.dumps({
             'type': 'message_history',
-            'messages': messages
+            'messages': messages,
+            'older_cursor': older_cursor,
+            'has_more': has_more
+        }))
+
+
+    async def handle_load_older(self, data):
+        cursor = data.get('cursor')
+        if not cursor:
+            await self.send(text_data=json.dumps({
+                'error': 'cursor is required'
+            }))
+            return
+
+        try:
+            messages, older_cursor, has_more = await self.get_group_messages(cursor, data.get('limit') or DEFAULT_LIMIT)
+        except ValueError as e:
+            await self.send(text_data=json.dumps({
+                'error': str(e)
+            }))
+            return
+
+        await self.send(text_data=json.dumps({
+            'type': 'message_page',
+            'direction': 'older',
+            'messages': messages,
+            'older_cursor': older_cursor,
+            'has_more': has_more
         }))
 
         
@@ -289,54 +384,25 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         file_message = await self.save_file_message(file_name, file_type, file_data)
 
         if file_message:
-            all_members = await self.get_group_members()
-            
             await self.channel_layer.group_send(
                 self.group_room_name,
-                {
-                    'type': 'file_message',
+                encoded_event('file_message', file_message_frame({
                     'file_id': file_message.id,
                     'file_name': file_message.file.original_filename if file_message.file else file_name,
                     'file_url': file_message.file.file.url if file_message.file else '',
                     'file_type': file_type,
-                    'file_size': file_message.file.file.size if file_message.file else 0,
+                    'file_size': file_message.file.file_size if file_message.file else 0,
+                    'preview': file_message.file.preview_payload() if file_message.file else None,
                     'sender_id': self.user.id,
                     'sender_name': self.user.fullname,
                     'timestamp': file_message.created_at.isoformat(),
-                }
+                }))
             )
-            
-            for member in all_members:
-                if member.user.id != self.user.id:
-                    unread_count = await self.get_unread_count_for_user(member.user.id)
-                    await self.channel_layer.group_send(
-                        self.group_room_name,
-                        {
-                            'type': 'unread_count_for_user',
-                            'target_user_id': member.user.id,
-                            'count': unread_count
-                        }
-                    )
+            await self.notify_unread_counts()
 
 
     async def file_message(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'file_uploaded',
-            'id': event['file_id'],
-            'file_name': event['file_name'],
-            'file_url': event['file_url'],
-            'file_type': event['file_type'],
-            'file_size': event['file_size'],
-            'user': {
-                'id': event['sender_id'],
-                'fullname': event['sender_name']
-            },
-            'sender_id': event['sender_id'],
-            'sender_name': event['sender_name'],
-            'timestamp': event['timestamp'],
-            'uploaded_at': event['timestamp'],
-            'message_type': 'file'
-        }))
+        await self.send(text_data=event['text'])
         
         
     async def handle_delete_file(self, data):
@@ -379,29 +445,19 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 message_type='file'
             )
         
+            self.release_unread(message)
+
             if message.file:
                 message.file.delete()   
                 message.file = None
         
             message.delete()
+            refresh_preview('group', self.group_id)
             return True
         except GroupMessage.DoesNotExist:
             return False
 
 
-    @database_sync_to_async
-    def get_group_members(self):
-        return list(GroupMember.objects.filter(group_id=self.group_id).select_related('user'))
-
-
-    @database_sync_to_async
-    def get_unread_count_for_user(self, user_id):
-        return GroupMessage.objects.filter(
-            group_id=self.group_id,
-            is_read=False
-        ).exclude(sender_id=user_id).count()
-        
-        
     @database_sync_to_async
     def save_file_message(self, file_name, file_type, base64_data):
         try:
@@ -434,6 +490,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 file=file_upload,
                 message_type='file'
             )
+            record_message('group', self.group_id, self.user.id, file_name, 'file', file_message.created_at)
 
             file_url = file_upload.file.url
             if not file_url.startswith('https'):
@@ -468,6 +525,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 content=content,
                 reply_to=reply_to
             )
+            record_message('group', self.group_id, self.user.id, content, 'text', message.created_at)
             return message
         except Exception:
             return None
@@ -490,26 +548,21 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
 
 
     @database_sync_to_async
-    def set_user_online(self, is_online):
-        from django.utils import timezone
-        if not isinstance(self.user, AnonymousUser):
-            self.user.is_online = is_online
-            if not is_online:
-                self.user.last_seen = timezone.now()
-            self.user.save()
-
-            
-    @database_sync_to_async
-    def get_group_messages(self):
-        messages = GroupMessage.objects.filter(
-            group_id=self.group_id
-        ).prefetch_related('read_by').select_related(
-            'sender', 'reply_to', 'reply_to__sender', 'file'
-        ).order_by('created_at')
+    def get_group_messages(self, cursor=None, limit=DEFAULT_LIMIT):
+        last_read_id = GroupMember.objects.filter(
+            group_id=self.group_id, user=self.user
+        ).values_list('last_read_message_id', flat=True).first() or 0
+
+        messages, older_cursor, has_more = get_feed_page(
+            GroupMessage.objects.filter(group_id=self.group_id).select_related(
+                'sender', 'reply_to', 'reply_to__sender', 'file'
+            ),
+            'group', cursor, limit
+        )
 
         result = []
         for msg in messages:
-            is_read_by_user = self.user in msg.read_by.all() or msg.sender == self.user
+            is_read_by_user = msg.id <= last_read_id or msg.sender_id == self.user.id
             
             message_data = {
                 'id': msg.id,
@@ -527,7 +580,8 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                     'file_name': msg.file.original_filename,
                     'file_url': msg.file.file.url if msg.file.file else '',
                     'file_type': 'file',
-                    'file_size': msg.file.file.size if msg.file.file else 0,
+                    'file_size': msg.file.file_size,
+                    'preview': msg.file.preview_payload(),
                 })
         
             if msg.reply_to:
@@ -548,7 +602,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
     
             result.append(message_data)
 
-        return result
+        return result, older_cursor, has_more
     
     async def handle_edit_message(self, data):
         message_id = data.get('message_id')
@@ -564,12 +618,12 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         if success:
             await self.channel_layer.group_send(
                 self.group_room_name,
-                {
+                encoded_event('message_updated', {
                     'type': 'message_updated',
                     'message_id': message_id,
                     'new_content': new_content,
                     'sender_id': self.user.id  # ✅ Qo'shildi
-                }
+                })
             )
         else:
             await self.send(text_data=json.dumps({
@@ -600,12 +654,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             }))
 
     async def message_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'message_updated',
-            'message_id': event['message_id'],
-            'new_content': event['new_content'],
-            'sender_id': event['sender_id']  # ✅ Qo'shildi
-        }))
+        await self.send(text_data=event['text'])
 
     async def message_deleted(self, event):
         await self.send(text_data=json.dumps({
@@ -629,6 +678,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             message.content = new_content.strip()
             message.is_updated = True
             message.save(update_fields=["content", "is_updated"])
+            refresh_preview('group', self.group_id)
         
             return True
         except GroupMessage.DoesNotExist:
@@ -642,44 +692,64 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 group_id=self.group_id,
                 sender=self.user
             )
+            self.release_unread(message)
             message.delete()
+            refresh_preview('group', self.group_id)
             return True
         except GroupMessage.DoesNotExist:
             return False
 
 
+    def release_unread(self, message):
+        # Members whose watermark is still below the message lose it from their counter.
+        readers = GroupMember.objects.filter(group_id=self.group_id).filter(
+            Q(last_read_message_id__gte=message.id) | Q(user_id=message.sender_id)
+        ).values('user_id')
+        decrement_unread_for('group', self.group_id, readers)
+
+
+    def get_member(self):
+        return GroupMember.objects.filter(group_id=self.group_id, user=self.user).first()
+
+
     @database_sync_to_async
     def mark_message_as_read(self, message_id):
-        try:
-            message = GroupMessage.objects.get(id=message_id, group_id=self.group_id)
-            if message.sender != self.user:
-                message.read_by.add(self.user)
-                return True
-            return False
-        except GroupMessage.DoesNotExist:
+        sender_id = GroupMessage.objects.filter(
+            id=message_id, group_id=self.group_id
+        ).values_list('sender_id', flat=True).first()
+        member = self.get_member()
+        if sender_id is None or sender_id == self.user.id or not member:
             return False
 
+        if member.mark_read_up_to(message_id):
+            set_conversation_unread('group', self.group_id, self.user.id, member.unread_count)
+        return True
+
 
     @database_sync_to_async
     def get_unread_count(self):
-        return GroupMessage.objects.filter(
-            group_id=self.group_id
-        ).exclude(
-            sender=self.user
-        ).exclude(
-            read_by=self.user
-        ).count()
+        member = self.get_member()
+        return member.unread_count if member else 0
         
         
     @database_sync_to_async
     def mark_all_messages_as_read(self):
-        messages = GroupMessage.objects.filter(
-            group_id=self.group_id
-        ).exclude(
-            sender=self.user
-        ).exclude(
-            read_by=self.user
-        )
-        
-        for message in messages:
-            message.read_by.add(self.user)
\ No newline at end of file
+        """
+        Moves the member's watermark to the newest message in one UPDATE.
+        Returns (last_read_id, unread_count); last_read_id is None when
+        nothing new was read.
+        """
+        with transaction.atomic():
+            member = self.get_member()
+            if not member:
+                return None, 0
+
+            latest_id = GroupMessage.objects.filter(
+                group_id=self.group_id
+            ).aggregate(latest=Max('id'))['latest']
+            if not latest_id or not member.mark_read_up_to(latest_id):
+                return None, member.unread_count
+
+            # Messages sent while this ran stay unread.
+            unread_count = set_conversation_unread('group', self.group_id, self.user.id, member.unread_count)
+        return latest_id, unread_count
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_watermarks(apps, schema_editor):
+    GroupMember = apps.get_model('groups', 'GroupMember')
+    GroupMessage = apps.get_model('groups', 'GroupMessage')
+    InboxEntry = apps.get_model('chat', 'InboxEntry')
+
+    # The newest message a member has read becomes the watermark.
+    watermarks = GroupMessage.read_by.through.objects.values(
+        'groupmessage__group_id', 'customuser_id'
+    ).annotate(last_read=Max('groupmessage_id'))
+
+    for row in watermarks.iterator():
+        GroupMember.objects.filter(
+            group_id=row['groupmessage__group_id'], user_id=row['customuser_id']
+        ).update(last_read_message_id=row['last_read'])
+
+    for member in GroupMember.objects.iterator():
+        unread = GroupMessage.objects.filter(
+            group_id=member.group_id, id__gt=member.last_read_message_id
+        ).exclude(sender_id=member.user_id).count()
+        InboxEntry.objects.filter(
+            conversation_type='group', group_id=member.group_id, user_id=member.user_id
+        ).update(unread_count=unread)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0010_alter_groupmessage_created_at'),
+        ('chat', '0026_searchentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupmember',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='groupmessage',
+            name='read_by',
+        ),
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'id'], name='groups_grou_group_i_66714b_idx'),
+        ),
+    ]
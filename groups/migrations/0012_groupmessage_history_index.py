@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0011_groupmember_last_read_message_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupmessage',
+            index=models.Index(fields=['group', 'created_at', 'id'], name='groups_grou_group_i_5de903_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 from accounts.models import CustomUser
 
@@ -26,22 +28,33 @@ class GroupMember(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='group_memberships')
     role = models.CharField(max_length=50, choices=ROLE_CHOICES, default='member')
     joined_at = models.DateTimeField(auto_now_add=True)
+    # Every message with an id up to this one counts as read by the member.
+    last_read_message_id = models.BigIntegerField(default=0)
 
     class Meta:
         unique_together = ('group', 'user')
 
     def __str__(self):
         return f"{self.user.username} in {self.group.name} as {self.role}"
-    
+
+    def unread_messages(self):
+        return GroupMessage.objects.filter(
+            group_id=self.group_id,
+            id__gt=self.last_read_message_id
+        ).exclude(sender_id=self.user_id)
+
     @property
     def unread_count(self):
-        return GroupMessage.objects.filter(
-            group=self.group
-        ).exclude(
-            sender=self.user
-        ).exclude(
-            read_by=self.user
-        ).count()
+        return self.unread_messages().count()
+
+    def mark_read_up_to(self, message_id):
+        """Moves the watermark forward to `message_id`; returns False if it was already past it."""
+        advanced = GroupMember.objects.filter(
+            id=self.id, last_read_message_id__lt=message_id
+        ).update(last_read_message_id=message_id)
+        if advanced:
+            self.last_read_message_id = message_id
+        return bool(advanced)
 
 
 class GroupMessage(models.Model):
@@ -55,7 +68,12 @@ class GroupMessage(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_read = models.BooleanField(default=False)  
     is_updated = models.BooleanField(default=False)  
-    read_by = models.ManyToManyField(CustomUser, related_name='read_group_messages', blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'id']),
+            models.Index(fields=['group', 'created_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Message by {self.sender.username} in {self.group.name}"
@@ -66,13 +84,15 @@ class GroupMessage(models.Model):
         super().save(*args, **kwargs)
     
     def mark_as_read_by(self, user):
-        if self.sender != user and user not in self.read_by.all():
-            self.read_by.add(user)
-            return True
-        return False
+        if self.sender_id == user.id:
+            return False
+        member = GroupMember.objects.filter(group_id=self.group_id, user=user).first()
+        return bool(member) and member.mark_read_up_to(self.id)
     
     def is_read_by(self, user):
-        return self.sender == user or user in self.read_by.all()
+        return self.sender_id == user.id or GroupMember.objects.filter(
+            group_id=self.group_id, user=user, last_read_message_id__gte=self.id
+        ).exists()
     
     
     def get_absolute_url(self):
@@ -84,4 +104,17 @@ class GroupMessage(models.Model):
         if self.file:
             from django.conf import settings
             return f"{settings.BASE_URL}{self.file.url}"
-        return None
\ No newline at end of file
+        return None
+
+
+
+@receiver(post_save, sender=GroupMessage)
+def index_group_message(sender, instance, created, update_fields, **kwargs):
+    from chat.search import index_message
+    index_message('group', instance, created, update_fields)
+
+
+@receiver(post_delete, sender=GroupMessage)
+def unindex_group_message(sender, instance, **kwargs):
+    from chat.search import unindex_message
+    unindex_message('group', instance.id)
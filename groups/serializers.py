@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
 from groups.models import Group, GroupMember, GroupMessage
+from chat.services import add_inbox_entries
 
 
 class GroupSerializer(serializers.ModelSerializer):
@@ -17,6 +18,7 @@ class GroupSerializer(serializers.ModelSerializer):
             user=user,
             role='owner'
         )
+        add_inbox_entries('group', group.id, [user.id])
         
         return group
         
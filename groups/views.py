@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from groups.models import Group, GroupMember, GroupMessage
 from groups.permissions import IsGroupOwner, IsGroupAdmin, IsGroupOwnerOrAdmin
 from groups.serializers import GroupSerializer, GroupMemberSerialzer, GroupMessageSerializer, GroupMembersSerializer, GroupUpdateSerializer
+from chat.services import add_inbox_entries, remove_inbox_entries, get_inbox, INBOX_PAGE_SIZE
+from chat.timeline import encode_cursor, decode_cursor
 
 
 class GroupApiView(generics.GenericAPIView):
@@ -54,25 +56,46 @@ class GroupListApiView(generics.GenericAPIView):
     serializer_class = GroupSerializer
     
     def get(self, request):
-        user_groups = Group.objects.filter(members__user=request.user)
+        try:
+            before = None
+            cursor = request.query_params.get('cursor')
+            if cursor:
+                before_at, _, before_id = decode_cursor(cursor)
+                before = (before_at, before_id)
+
+            # Latest message, sender and unread count are kept on the member's inbox entry.
+            entries, has_more = get_inbox(
+                request.user.id,
+                conversation_type='group',
+                before=before,
+                limit=request.query_params.get('limit', INBOX_PAGE_SIZE),
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         groups_data = []
-        for group in user_groups:
-            last_message = GroupMessage.objects.filter(
-                group=group
-            ).order_by('-created_at').first()
-            
-            serializer = self.get_serializer(group)
-            group_data = serializer.data
-            
-            if last_message:
-                group_data['last_message_time'] = last_message.created_at.isoformat()
-            else:
-                group_data['last_message_time'] = group.created_at.isoformat()
-                
+        for entry in entries:
+            group_data = self.get_serializer(entry.group).data
+            group_data['last_message_time'] = entry.last_message_at.isoformat()
+            group_data['last_message'] = entry.last_message
+            group_data['message_type'] = entry.message_type
+            group_data['last_sender'] = {
+                'id': entry.last_sender.id,
+                'fullname': entry.last_sender.fullname,
+            } if entry.last_sender else None
+            group_data['unread_count'] = entry.unread_count
             groups_data.append(group_data)
+
+        next_cursor = None
+        if has_more:
+            last = entries[-1]
+            next_cursor = encode_cursor(last.last_message_at, last.conversation_type, last.id)
         
-        return Response(groups_data, status=status.HTTP_200_OK)
+        return Response({
+            'groups': groups_data,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        }, status=status.HTTP_200_OK)
     
     
 
@@ -106,6 +129,7 @@ class GroupMemberAddApiView(generics.GenericAPIView):
             user=user,
             role=role
         )
+        add_inbox_entries('group', group.id, [user.id])
         
         return Response({'message': f'{user.username} added to {group.name}'}, status=status.HTTP_200_OK)
     
@@ -132,6 +156,7 @@ class GroupMemberDeleteApiView(generics.GenericAPIView):
                 )
             
             member.delete()
+            remove_inbox_entries('group', group_id, [user_id])
             return Response({'message': 'Member removed'}, status=status.HTTP_200_OK)
             
         except GroupMember.DoesNotExist:
@@ -225,6 +250,7 @@ class LeaveGroup(generics.GenericAPIView):
         membership = GroupMember.objects.filter(group=group, user=request.user).first()
         if membership:
             membership.delete()
+            remove_inbox_entries('group', group.id, [request.user.id])
             return Response({"detail": "Successfully left the group."}, status=status.HTTP_200_OK)
 
         return Response({"detail": "You are not a member of this group."}, status=status.HTTP_400_BAD_REQUEST)    